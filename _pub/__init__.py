@@ -0,0 +1 @@
+default_app_config = '_pub.apps._PubConfig'
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class _PubConfig(AppConfig):
     name = '_pub'
+
+    def ready(self):
+        # Connect signal receivers invalidating cached users and permissions, and recycling workers over the memory
+        # budget.
+        from endportal import auth, memory  # noqa: F401
@@ -2,6 +2,9 @@ import re
 
 from django import template
 from django.conf import settings
+from django.templatetags.static import static
+
+from endportal import assets
 
 register = template.Library()
 
@@ -68,6 +71,48 @@ def do_footer(_, token):
     return FooterNode()
 
 
+@register.tag('assets')
+def do_assets(parser, token):
+    """
+    Load stylesheets or scripts of a page type. Accept exactly two arguments: the page type and either `css` or `js`.
+    If `ASSETS_BUNDLED` is set and bundles have been built, the fingerprinted bundle is loaded, with critical CSS inlined
+    and the rest of the stylesheet loaded without blocking rendering. Otherwise, libraries are loaded from the CDN.
+    Scripts are always deferred, so inline scripts should wait for `DOMContentLoaded` before using them.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError('%r tag requires exactly two arguments' % bits[0])
+    return AssetsNode(parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
+
+
+class AssetsNode(template.Node):
+    def __init__(self, name, kind):
+        self.name, self.kind = name, kind
+
+    def render(self, context):
+        name, kind = self.name.resolve(context), self.kind.resolve(context)
+        bundle = assets.bundles().get(name) if assets.enabled() else None
+        if bundle is not None:
+            href = settings.STATIC_URL + bundle[kind]
+            if kind == 'js':
+                return f'<script defer src="{href}"></script>'
+            if not bundle.get('critical'):
+                return f'<link href="{href}" rel="stylesheet">'
+            return \
+                f'<style>{bundle["critical"]}</style>' \
+                f'<link as="style" href="{href}" onload="this.onload=null;this.rel=\'stylesheet\'" rel="preload">' \
+                f'<noscript><link href="{href}" rel="stylesheet"></noscript>'
+        html = ''
+        for item in assets.BUNDLES[name][kind]:
+            url, integrity = assets.cdn_url(item)
+            attrs = f'crossorigin="anonymous" integrity="{integrity}" ' if integrity is not None else ''
+            if kind == 'js':
+                html += f'<script {attrs}defer src="{url or static(item)}"></script>'
+            else:
+                html += f'<link {attrs}href="{url or static(item)}" rel="stylesheet">'
+        return html
+
+
 class NavigatorNode(template.Node):
     def __init__(self, nodelist_items, nodelist_links, nodelist_menus):
         self.nodelist_items, self.nodelist_links, self.nodelist_menus = nodelist_items, nodelist_links, nodelist_menus
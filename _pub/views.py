@@ -1,7 +1,12 @@
 from datetime import datetime
 from platform import uname
 
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import redirect, render
+from ipware import get_client_ip
+
+from endportal import memory, metrics
 
 # UWSGI is only provided in production environment. We try to import it, and do nothing if failed.
 try:
@@ -40,4 +45,17 @@ def index(request):
             'architecture': platform.machine,
             'processor': platform.processor
         }
+        context['metrics'] = metrics.summary()
+        context['memory'] = memory.summary(metrics.snapshots())
         return render(request, 'index.html', context)
+
+
+def metrics_exposition(request):
+    """
+    Metrics page: export instrumentation data in Prometheus text format. Only superusers and scrapers from addresses
+    listed in the `METRICS_ALLOWED_ADDRS` setting (default to be loopback addresses) have access to it.
+    """
+    ip, _ = get_client_ip(request)
+    if not request.user.is_superuser and ip not in getattr(settings, 'METRICS_ALLOWED_ADDRS', ('127.0.0.1', '::1')):
+        raise Http404()
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
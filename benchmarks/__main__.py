@@ -0,0 +1,71 @@
+"""
+Benchmark suite: seed test databases with generated data (see `benchmarks.data`), then measure endpoints and helpers
+against it. The configured databases and caches are never touched.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=endportal.settings python -m benchmarks [--blogs 2000] [--logs 1000000] [--number 50]
+                                                                   [--seed 0] [--only endpoints|micro] > result.json
+
+Results are printed as JSON, along with the commit and the parameters they were measured with. Results of different
+commits are compared with `python -m benchmarks.compare`.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import django
+
+
+def commit():
+    # Changes not committed yet are marked as dirty.
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run benchmarks against seeded data.')
+    parser.add_argument('--blogs', type=int, default=2000, help='Number of blogs generated.')
+    parser.add_argument('--logs', type=int, default=1000000, help='Number of logs generated.')
+    parser.add_argument('--number', type=int, default=50, help='Number of requests timed for each endpoint.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of generated data.')
+    parser.add_argument('--only', choices=('endpoints', 'micro'), help='Run only one kind of benchmarks.')
+    args = parser.parse_args()
+    if args.blogs <= 0 or args.logs <= 0 or args.number <= 0:
+        parser.error('Numbers must be positive.')
+
+    django.setup()
+    from django.db import connections
+    from benchmarks import data, endpoints, micro
+
+    with data.isolated():
+        start = time.perf_counter()
+        superuser, paths = data.seed(args.blogs, args.logs, args.seed)
+        result = {'meta': {
+            'commit': commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'databases': {alias: connections[alias].vendor for alias in connections},
+            'blogs': args.blogs,
+            'logs': args.logs,
+            'number': args.number,
+            'seed': args.seed,
+            'seconds_seeding': time.perf_counter() - start,
+        }}
+        print('Seeded in %.1fs.' % result['meta']['seconds_seeding'], file=sys.stderr)
+        if args.only in (None, 'endpoints'):
+            result['endpoints'] = endpoints.run(superuser, paths, args.number)
+        if args.only in (None, 'micro'):
+            # Helpers are much faster than requests, so they are timed more often.
+            result['micro'] = micro.run(superuser, paths, args.number * 20)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare two results of `python -m benchmarks`, e.g. of a base commit and of a change.
+
+Usage:
+    python -m benchmarks.compare base.json head.json [--threshold 10]
+
+Every measurement present in both is listed with its relative change, regressions beyond the threshold (in percent)
+are marked and make the exit status non-zero. Results seeded with different parameters are not comparable, so that is
+refused.
+"""
+import argparse
+import json
+import sys
+
+# Measurements compared for endpoints, and whether larger is better.
+ENDPOINT_KEYS = {'p50': False, 'p95': False, 'throughput': True, 'peak': False}
+
+
+def rows(base, head):
+    """
+    Pair up measurements of two results.
+    :return: A generator of name, base value, head value and whether larger is better.
+    """
+    for name, measured in base.get('endpoints', {}).items():
+        other = head.get('endpoints', {}).get(name)
+        if other is None:
+            continue
+        for key, larger in ENDPOINT_KEYS.items():
+            yield '%s %s' % (name, key), measured[key], other[key], larger
+        for alias, count in measured['queries'].items():
+            if alias in other['queries']:
+                yield '%s queries[%s]' % (name, alias), count, other['queries'][alias], False
+    for name, value in base.get('micro', {}).items():
+        if name in head.get('micro', {}):
+            yield name, value, head['micro'][name], False
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare', description='Compare benchmark results.')
+    parser.add_argument('base', help='Result of the base commit.')
+    parser.add_argument('head', help='Result of the commit compared.')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regressions beyond this percentage fail.')
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    for key in ('blogs', 'logs', 'seed'):
+        if base['meta'][key] != head['meta'][key]:
+            sys.exit('Results are not comparable, %s differ.' % key)
+
+    print('%-64s %12s %12s %9s' % ('measurement', 'base', 'head', 'change'))
+    regressions = 0
+    for name, old, new, larger in rows(base, head):
+        change = (new - old) / old * 100 if old else (0.0 if new == old else float('inf'))
+        worse = -change if larger else change
+        # Query counts are exact, any additional query is a regression.
+        regressed = worse > 0 if 'queries' in name else worse > args.threshold
+        regressions += regressed
+        print('%-64s %12.2f %12.2f %8.1f%%%s' % (name, old, new, change, ' !' if regressed else ''))
+    print('%d regressions.' % regressions)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Synthetic but realistic data for benchmarks, generated deterministically from a seed so that results of different
+commits are comparable: blogs in nested directories with CJK text, code blocks and math, and logs spread over months of
+partitions.
+
+Benchmarks never touch the configured databases and caches. `isolated` creates test databases (named after the
+configured ones, see `DATABASES[...]['TEST']`) and destroys them afterwards, and switches caches, stamp files and the
+invalidation bus to private ones.
+"""
+import os
+import random
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+# Vocabulary of generated texts. Chinese words are joined without spaces, like real Chinese texts.
+WORDS = ('数据', '结构', '算法', '复杂度', '分析', '证明', '函数', '变量', '模型', '训练', '网络', '内存', '缓存', '查询',
+         '索引', '事务', '并发', '线程', '进程', '调度', '编译', '优化', '语法', '语义', '类型', '推导', '矩阵', '向量',
+         '概率', '分布', '期望', '方差', '定理', '引理', '推论', '服务器', '客户端', '协议', '请求', '响应', '日志', '部署',
+         '的', '了', '在', '是', '和', '与', '对于', '因此', '所以', '但是', '如果', '那么', '我们', '可以', '需要', '通过')
+ENGLISH = ('python', 'django', 'linux', 'kernel', 'cache', 'query', 'index', 'thread', 'socket', 'tensor', 'graph',
+           'tree', 'heap', 'hash', 'regex', 'parser', 'compiler', 'runtime', 'latency', 'throughput')
+TAGS = tuple('标签%d' % i for i in range(40)) + ENGLISH
+CATEGORIES = ('algorithm', 'system', 'network', 'database', 'math', 'ml', 'web', 'life', 'notes', 'misc')
+FORMULAS = (r'\sum_{i=1}^{n} i = \frac{n(n+1)}{2}', r'e^{i\pi} + 1 = 0', r'\int_0^\infty e^{-x^2} dx = '
+            r'\frac{\sqrt{\pi}}{2}', r'O(n \log n)', r'\mathbb{E}[X] = \sum_x x P(X = x)', r'\nabla_\theta J(\theta)',
+            r'\begin{pmatrix} a & b \\ c & d \end{pmatrix}', r'\lim_{n \to \infty} \left(1 + \frac{1}{n}\right)^n')
+CODE = ('def fib(n):\n    a, b = 0, 1\n    for _ in range(n):\n        a, b = b, a + b\n    return a\n',
+        'for (int i = 0; i < n; ++i) {\n    sum += a[i] * b[i];\n}\n',
+        'SELECT id, publish_path FROM blog_blog WHERE publish_path LIKE \'web/%\' ORDER BY publish_date DESC;\n')
+# Addresses of visitors, networks are shared by several of them.
+NETWORKS = ('10.0.%d.%d', '192.168.%d.%d', '114.%d.35.%d', '202.120.%d.%d')
+# Users referenced by logs, besides anonymous visitors.
+USERS = 8
+
+
+def sentence(rng, length):
+    words = [rng.choice(WORDS) if rng.random() < 0.9 else ' %s ' % rng.choice(ENGLISH) for _ in range(length)]
+    return ''.join(words).strip() + '。'
+
+
+def paragraph(rng):
+    text = ''.join(sentence(rng, rng.randint(8, 30)) for _ in range(rng.randint(2, 6)))
+    # Inline math, sometimes escaped dollars, which arithmatex patterns have to tell apart.
+    if rng.random() < 0.4:
+        text += '其中 $%s$ 成立' % rng.choice(FORMULAS)
+    if rng.random() < 0.1:
+        text += '，价格是 \\$%d。' % rng.randint(1, 100)
+    return text
+
+
+def markdown(rng, sections):
+    """
+    Generate markdown content with headers, paragraphs, lists, code blocks and math.
+    :rtype str
+    """
+    parts = []
+    for i in range(sections):
+        parts.append('## %s%d' % (rng.choice(WORDS[:42]), i))
+        for j in range(rng.randint(1, 3)):
+            parts.append('### %s%d.%d' % (rng.choice(WORDS[:42]), i, j))
+            parts.extend(paragraph(rng) for _ in range(rng.randint(1, 4)))
+            roll = rng.random()
+            if roll < 0.3:
+                parts.append('```python\n%s```' % rng.choice(CODE))
+            elif roll < 0.5:
+                parts.append('$$\n%s\n$$' % rng.choice(FORMULAS))
+            elif roll < 0.6:
+                parts.append('\n'.join('- %s' % sentence(rng, 6) for _ in range(rng.randint(2, 5))))
+    return '\n\n'.join(parts)
+
+
+def blogs(count, seed):
+    """
+    Generate blogs with unique publish paths under nested directories, they are not saved.
+    :param count: Number of blogs.
+    :param seed: Seed of the random generator.
+    :return: A list of unsaved blogs.
+    :rtype list
+    """
+    from blog.models import Blog
+    rng, result, paths = random.Random(seed), [], set()
+    first = date(2016, 1, 1)
+    while len(result) < count:
+        parts = [rng.choice(CATEGORIES)] + ['d%d' % rng.randint(0, 9) for _ in range(rng.randint(0, 2))]
+        path = '/'.join(parts + ['p%d' % len(result)])
+        if path in paths:
+            continue
+        paths.add(path)
+        urls = '\n'.join('%s:::https://example.com/%d/%d' % (rng.choice(ENGLISH), len(result), i)
+                         for i in range(rng.randint(0, 2)))
+        result.append(Blog(
+            publish_path=path,
+            publish_date=first + timedelta(days=rng.randint(0, 3000)),
+            publish_desc=sentence(rng, 6)[:64],
+            content_name=sentence(rng, 5)[:64],
+            content_type='markdown',
+            content_urls=urls,
+            content_tags=','.join(rng.sample(TAGS, rng.randint(1, 5))),
+            content_desc=sentence(rng, 20),
+            content_text=markdown(rng, rng.randint(2, 6)),
+        ))
+    return result
+
+
+def address(rng):
+    return rng.choice(NETWORKS) % (rng.randint(0, 255), rng.randint(1, 254))
+
+
+def logs(count, seed, paths, users, months=6):
+    """
+    Generate logs of the months before July 2024 (fixed, so that partitions are the same whenever benchmarks run), in
+    the same mix as a live site: mostly blog accesses, then searches, tags, commands and publishes.
+    :param count: Number of logs.
+    :param seed: Seed of the random generator.
+    :param paths: Publish paths of blogs accessed.
+    :param users: IDs of users, most logs are written by anonymous users.
+    :param months: Number of months logs spread over.
+    :return: A generator of dictionaries of fields, see `logs.partitions.bulk_insert`.
+    """
+    from logs.models import Behavior, Category, pack_address
+    rng = random.Random(seed)
+    end = datetime(2024, 6, 30, tzinfo=timezone.utc)
+    span = int(timedelta(days=30 * months).total_seconds())
+    # Popular blogs are accessed much more often, like real traffic.
+    weights = [1 / (i + 1) for i in range(len(paths))]
+    accessed = rng.choices(paths, weights, k=min(count, 100000))
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.8:
+            category, behavior, detailed = Category.BLOG, Behavior.ACCESS, accessed[i % len(accessed)]
+        elif roll < 0.9:
+            category, behavior, detailed = Category.BLOG, Behavior.SEARCH, rng.choice(WORDS + ENGLISH)
+        elif roll < 0.97:
+            category, behavior, detailed = Category.BLOG, Behavior.TAG, rng.choice(TAGS)
+        elif roll < 0.995:
+            category, behavior, detailed = Category.OTHER, Behavior.OTHER, rng.choice(('help', 'whoami', 'login x'))
+        else:
+            category, behavior, detailed = Category.BLOG, Behavior.PUBLISH, str(rng.randint(1, len(paths)))
+        yield {
+            'src_user_id': rng.choice(users) if rng.random() < 0.05 else None,
+            'src_addr': pack_address(address(rng)),
+            'src_time': end - timedelta(seconds=rng.randint(0, span)),
+            'category': category,
+            'behavior': behavior,
+            'detailed': detailed,
+        }
+
+
+def seed(blog_count, log_count, seed_):
+    """
+    Fill the (test) databases with generated data, and build everything derived from it: categories, tags and related
+    blogs. Blogs are created in bulk without signals, like a restored database.
+    :return: The superuser of benchmarks, and publish paths of all blogs.
+    :rtype User, list
+    """
+    from django.contrib.auth.models import User
+    from blog import caches, related, taxonomy
+    from blog.models import Blog
+    from logs import partitions
+
+    superuser = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    users = [superuser.id] + [User.objects.create_user('user%d' % i).id for i in range(USERS - 1)]
+    Blog.objects.bulk_create(blogs(blog_count, seed_), batch_size=500)
+    for _ in taxonomy.backfill():
+        pass
+    if related.numpy is not None:
+        related.rebuild()
+    paths = list(Blog.objects.order_by('id').values_list('publish_path', flat=True))
+    generator = logs(log_count, seed_, paths, users)
+    while True:
+        chunk = [row for _, row in zip(range(50000), generator)]
+        if not chunk:
+            break
+        partitions.bulk_insert(chunk)
+    caches.invalidate(broadcast=False)
+    return superuser, paths
+
+
+@contextmanager
+def isolated():
+    """
+    Run benchmarks in test databases, with private caches and stamp files and without the invalidation bus, so that
+    neither the data nor the caches of the site are touched.
+    """
+    directory = tempfile.mkdtemp(prefix='endportal-benchmark-')
+    overrides = override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+        BLOG_CACHE_STAMP=os.path.join(directory, 'blog.stamp'),
+        AUTH_CACHE_STAMP=os.path.join(directory, 'auth.stamp'),
+        METRICS_DIR=os.path.join(directory, 'metrics'),
+        CACHE_BUS_URL=None,
+        # Hits must be logged by views, as they are by default.
+        LOGS_INGEST_HITS=False,
+        # Generated logs are of fixed months, which must never be pruned as old ones.
+        LOGS_RETENTION_MONTHS=None,
+    )
+    setup_test_environment()
+    overrides.enable()
+    databases = setup_databases(verbosity=0, interactive=False, keepdb=False)
+    try:
+        yield
+    finally:
+        teardown_databases(databases, verbosity=0)
+        overrides.disable()
+        teardown_test_environment()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,127 @@
+"""
+Benchmark of endpoints: requests are sent through the whole stack of middlewares and views by the test client, one at a
+time. For every endpoint, the latency (in milliseconds) and the throughput of a single worker are measured, along with
+the number of queries to every database and the peak of memory allocated by a request (in kilobytes).
+
+Pages served from the page cache are measured both warm (served from the cache) and cold (after a blog is published,
+so that the page cache, the render cache and the caches of blog data are all rebuilt).
+
+Run through `python -m benchmarks`, which seeds the databases first.
+"""
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.forms import model_to_dict
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def measure(request, number, prepare=None):
+    """
+    Measure a request.
+    :param request: Function sending the request, returning the response.
+    :param number: Number of requests timed.
+    :param prepare: Function called before every request, which is not timed.
+    :rtype dict
+    """
+    prepare = prepare or (lambda: None)
+    # Warm up, and make sure that it is not an error page which is measured.
+    prepare()
+    status = request().status_code
+    if status >= 400:
+        raise RuntimeError('Status %d.' % status)
+    prepare()
+    with ExitStack() as stack:
+        captures = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections}
+        request()
+    queries = {alias: len(capture) for alias, capture in captures.items()}
+    prepare()
+    tracemalloc.start()
+    try:
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    times = []
+    for _ in range(number):
+        prepare()
+        start = time.perf_counter()
+        request()
+        times.append(time.perf_counter() - start)
+    return {
+        'status': status,
+        'mean': statistics.mean(times) * 1e3,
+        'p50': percentile(times, 0.5) * 1e3,
+        'p95': percentile(times, 0.95) * 1e3,
+        'min': min(times) * 1e3,
+        'throughput': len(times) / sum(times),
+        'queries': queries,
+        'peak': peak / 1024,
+    }
+
+
+def cold():
+    from blog import caches
+    caches.invalidate(broadcast=False)
+    cache.clear()
+
+
+def run(superuser, paths, number):
+    """
+    Measure all endpoints against seeded data.
+    :param superuser: The user of pages requiring permissions.
+    :param paths: Publish paths of seeded blogs, the first one is the most popular.
+    :param number: Number of requests timed for each endpoint.
+    :rtype dict
+    """
+    from blog.models import Blog
+
+    anonymous, admin = Client(), Client()
+    admin.force_login(superuser)
+    article, directory = paths[0], paths[0].split('/')[0]
+    blog = Blog.objects.get(publish_path=article)
+    results = {}
+    pages = {
+        'blog-content/article': '/blog/%s/' % article,
+        'blog-content/directory': '/blog/%s/' % directory,
+        'blog-content/directory-page': '/blog/%s/?page=5' % directory,
+        'blog-content/root': '/blog/',
+        'blog-indices': '/blog/indices/?keyword=python',
+    }
+    for name, url in pages.items():
+        results[name] = measure(lambda: anonymous.get(url), number)
+        results[name + '/cold'] = measure(lambda: anonymous.get(url), number, cold)
+    # Authenticated users always get freshly rendered pages.
+    results['blog-content/article/authenticated'] = measure(lambda: admin.get(pages['blog-content/article']), number)
+    results['publish/form'] = measure(lambda: admin.get('/blog/publish/?id=%d' % blog.id), number)
+    form = {key: value for key, value in model_to_dict(blog).items() if key not in ('category', 'tags')}
+    # Publishing is rolled back, so that the data stays the same.
+    with transaction.atomic():
+        results['publish'] = measure(lambda: admin.post('/blog/publish/', form), number)
+        transaction.set_rollback(True)
+    cold()
+    filters = {
+        '': {},
+        'time': {'src_time_s': '2024-06-01T00:00:00+00:00', 'src_time_e': '2024-06-07T00:00:00+00:00'},
+        'user': {'src_user': superuser.id},
+        'anonymous': {'src_user': 0},
+        'address': {'src_addr': '10.0.1.1'},
+        'network': {'src_addr': '10.0.0.0/16'},
+        'keyword': {'keyword': 'python'},
+        'label': {'keyword': 'search'},
+        'combined': {'src_time_s': '2024-05-01T00:00:00+00:00', 'src_addr': '192.168.0.0/16', 'keyword': 'python'},
+    }
+    for name, params in filters.items():
+        results['logs/' + name if name else 'logs'] = measure(lambda: admin.get('/logs/', params), number)
+    results['wcmd_exec/help'] = measure(lambda: anonymous.post('/wcmd/exec/', {'_': 'help'}), number)
+    results['wcmd_exec/batch'] = measure(lambda: admin.post('/wcmd/exec/', {'_': 'whoami ; logparts list'}), number)
+    return results
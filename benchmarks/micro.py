@@ -0,0 +1,60 @@
+"""
+Microbenchmarks of helpers every blog and log page relies on, in microseconds per operation. Helpers querying the
+database are measured against seeded data, see `python -m benchmarks`.
+"""
+import re
+import timeit
+
+from django.test import RequestFactory
+
+# Unterminated math with many escapes, on which badly written patterns backtrack for long.
+ADVERSARIAL = '$' + 'a\\$' * 500 + ' \\(' + 'b\\)' * 500 + ' $$' + '\\\\' * 500 + ' \\[' + 'c\\]' * 500
+
+
+def timed(function, number, repeat=5):
+    # The best of several rounds is the least disturbed by other processes.
+    number = max(number // repeat, 1)
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6
+
+
+def run(superuser, paths, number):
+    """
+    Measure all helpers.
+    :param superuser: Unused, accepted for the same signature as `benchmarks.endpoints.run`.
+    :param paths: Publish paths of seeded blogs, the first one is the most popular.
+    :param number: Number of operations timed for each helper.
+    :rtype dict
+    """
+    import arithmatex
+    from blog import rendering, views
+    from blog.models import Blog
+    from endportal import utils
+    from logs import partitions
+
+    blog = Blog.objects.get(publish_path=paths[0])
+    directory = paths[0].rsplit('/', 1)[0]
+    factory = RequestFactory()
+    first, last = factory.get('/'), factory.get('/', {'page': Blog.objects.count() // 10})
+    # Warm up the render cache and caches of blog data.
+    views.blog_to_dict(blog)
+    views.get_universal_context(directory, True)
+    results = {
+        'blog_to_dict': timed(lambda: views.blog_to_dict(blog, False), number),
+        'blog_to_dict/content': timed(lambda: views.blog_to_dict(blog), number),
+        'render': timed(lambda: rendering.render(blog.content_type, blog.content_text), max(number // 10, 1)),
+        'get_universal_context/root': timed(lambda: views.get_universal_context('', False), number),
+        'get_universal_context/directory': timed(lambda: views.get_universal_context(directory, True), number),
+        'paginate/blogs': timed(lambda: list(utils.paginate(first, 10, Blog.objects.order_by('-publish_date'))[3]),
+                                number),
+        'paginate/blogs-last': timed(
+            lambda: list(utils.paginate(last, 10, Blog.objects.order_by('-publish_date'))[3]), number),
+        'paginate/logs': timed(lambda: list(utils.paginate(first, 50, partitions.PartitionedQuerySet())[3]),
+                               max(number // 10, 1)),
+    }
+    texts = {'article': blog.content_text, 'adversarial': ADVERSARIAL}
+    for name in ('RE_SMART_DOLLAR_INLINE', 'RE_DOLLAR_INLINE', 'RE_BRACKET_INLINE', 'RE_DOLLAR_BLOCK', 'RE_TEX_BLOCK',
+                 'RE_BRACKET_BLOCK'):
+        pattern = re.compile(getattr(arithmatex, name))
+        for kind, text in texts.items():
+            results['arithmatex/%s/%s' % (name, kind)] = timed(lambda: pattern.findall(text), max(number // 10, 1))
+    return results
@@ -0,0 +1,54 @@
+"""
+Benchmark of web command dispatching: compiling the argument parser of every registered command, parsing a typical
+command line of each of them, and generating help texts.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=endportal.settings python -m benchmarks.wcmd_exec [number]
+
+Results are printed as JSON, in microseconds per operation.
+"""
+import json
+import sys
+import timeit
+
+import django
+
+
+def sample_line(command):
+    """
+    Build a command line passing every parameter of the given command, with a value its preprocessor accepts.
+    """
+    def sample(param):
+        for value in ('1', 'yes', 'x'):
+            try:
+                param.type(value)
+                return value
+            except ValueError:
+                continue
+        return 'x'
+
+    tokens = [sample(param) for param in command.pos_params]
+    for name, param in command.key_params.items():
+        tokens += ['--' + name, sample(param)]
+    return tokens
+
+
+def main(number=10000):
+    django.setup()
+    from wcmd.commands import WebCommand
+
+    results = {}
+    for name, command in WebCommand.commands.items():
+        tokens = sample_line(command)
+        compile_time = timeit.timeit(lambda: WebCommand.Parser(command), number=number // 10) / (number // 10)
+        parse_time = timeit.timeit(lambda: command.parser.parse(tokens), number=number) / number
+        help_time = timeit.timeit(lambda: command.parser.help, number=number) / number
+        results[name] = {'tokens': len(tokens), 'compile': compile_time * 1e6, 'parse': parse_time * 1e6,
+                         'help': help_time * 1e6}
+    results['total'] = {key: sum(result[key] for result in results.values())
+                        for key in ('tokens', 'compile', 'parse', 'help')}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,318 @@
+"""
+Bulk import and export of blogs as a directory tree of markdown files (e.g. a git repository), one file per blog at its
+publish path (`a/b/c` is stored as `a/b/c.md`). Every file starts with front matter holding the other fields:
+
+    ---
+    path: a/b/c
+    date: 2020-01-31
+    title: 标题
+    note: 发布描述
+    type: markdown
+    tags:
+      - 标签
+    urls:
+      - 名称:::https://example.com/
+    summary: 简介
+    ---
+    Content text...
+
+Values are plain text, or JSON strings if they contain line breaks or surrounding whitespaces. `path` defaults to the
+path of the file, and `type` to markdown.
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.db import connections, transaction
+
+from blog import caches, feeds, related, rendering, revisions, taxonomy
+from blog.models import Blog, Source
+
+# Keys of front matter and the fields they hold, in the order they are written.
+FIELDS = (('path', 'publish_path'), ('date', 'publish_date'), ('title', 'content_name'), ('note', 'publish_desc'),
+          ('type', 'content_type'), ('tags', 'content_tags'), ('urls', 'content_urls'), ('summary', 'content_desc'))
+# Fields written as lists, and the separators joining their items in the database.
+LISTS = {'content_tags': ',', 'content_urls': '\n'}
+SUFFIX = '.md'
+# Paths which `blog-content` can serve, which are also safe as paths of files.
+RE_PATH = re.compile(r'[-\w]+(?:/[-\w]+)*')
+
+
+def digest(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def quote(value):
+    if value == '' or value != value.strip() or '\n' in value or value.startswith('"'):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def unquote(value):
+    return json.loads(value) if value.startswith('"') else value
+
+
+def dumps(blog):
+    """
+    Serialize a blog into the content of its file.
+    :rtype str
+    """
+    lines = ['---']
+    for key, field in FIELDS:
+        value = getattr(blog, field)
+        if field in LISTS:
+            lines.append(key + ':')
+            lines.extend('  - ' + quote(item.strip()) for item in value.split(LISTS[field]) if item.strip() != '')
+        else:
+            lines.append('%s: %s' % (key, quote(str(value))))
+    lines.append('---')
+    return '\n'.join(lines) + '\n' + blog.content_text
+
+
+def loads(text, path):
+    """
+    Parse the content of a file into fields of a blog.
+    :param text: Content of the file.
+    :param path: Path of the file relative to the root without the suffix, which is the default publish path.
+    :raise ValueError: If the file is malformed, or any field is invalid.
+    :return: Fields of the blog.
+    :rtype dict
+    """
+    if not text.startswith('---\n') or text.find('\n---\n', 3) < 0:
+        raise ValueError('Front matter is missing.')
+    end = text.find('\n---\n', 3)
+    header, keys, current, fields = text[4:end], dict(FIELDS), None, {}
+    for line in header.split('\n'):
+        if line.strip() == '':
+            continue
+        if line.lstrip().startswith('- '):
+            if current is None:
+                raise ValueError('Unexpected list item: %s' % line)
+            current.append(unquote(line.lstrip()[2:].strip()))
+            continue
+        key, colon, value = line.partition(':')
+        key, value = key.strip(), value.strip()
+        if colon == '' or key not in keys:
+            raise ValueError('Unknown key: %s' % line)
+        if keys[key] in fields:
+            raise ValueError('Duplicated key: %s' % line)
+        # Lists have no value on the line of their keys, while empty texts are always quoted.
+        if value == '':
+            if keys[key] not in LISTS:
+                raise ValueError('Value is missing: %s' % line)
+            current = fields[keys[key]] = []
+        else:
+            current, fields[keys[key]] = None, unquote(value)
+    for field, separator in LISTS.items():
+        value = fields.get(field, [])
+        # Tags may also be written on a single line.
+        if isinstance(value, str):
+            value = value.split(',') if field == 'content_tags' else [value]
+        fields[field] = separator.join(item.strip() for item in value if item.strip() != '')
+    fields.setdefault('publish_path', path)
+    fields.setdefault('content_type', 'markdown')
+    if 'publish_date' not in fields:
+        raise ValueError('Date is missing.')
+    fields['publish_date'] = date.fromisoformat(fields['publish_date'])
+    if RE_PATH.fullmatch(fields['publish_path']) is None:
+        raise ValueError('Invalid path: %s' % fields['publish_path'])
+    if Blog.reserved(fields['publish_path']):
+        raise ValueError('Reserved path: %s' % fields['publish_path'])
+    fields['content_text'] = text[end + 5:]
+    for field in Blog._meta.fields:
+        if field.name in ('id', 'category'):
+            continue
+        fields.setdefault(field.name, '')
+        if field.max_length is not None and len(fields[field.name]) > field.max_length:
+            raise ValueError('%s is longer than %d characters.' % (field.name, field.max_length))
+    return fields
+
+
+def files(root):
+    """
+    List markdown files under a directory recursively, skipping hidden ones (e.g. `.git`).
+    :return: A generator of paths of files, and their paths relative to the root without the suffix.
+    """
+    for directory, names, filenames in os.walk(root):
+        names[:] = sorted(name for name in names if not name.startswith('.'))
+        for name in sorted(filenames):
+            if name.endswith(SUFFIX) and not name.startswith('.'):
+                file = os.path.join(directory, name)
+                yield file, os.path.relpath(file, root)[:-len(SUFFIX)].replace(os.sep, '/')
+
+
+def render(content):
+    # Runs in worker processes, which must not touch the database. Errors are returned as messages, so that a content
+    # failing to render never aborts rendering the others.
+    try:
+        return rendering.render(*content)
+    except Exception as e:
+        return '%s: %s' % (type(e).__name__, e)
+
+
+def render_all(contents, jobs):
+    """
+    Render contents of blogs in a pool of processes, since rendering markdown is pure Python and bound by CPU.
+    :param contents: Pairs of content type and content text.
+    :param jobs: Number of processes, rendering in the current process if it is one.
+    :return: Rendered contents (see `blog.rendering.render`), or messages of errors raised rendering them.
+    :rtype list
+    """
+    if jobs <= 1 or len(contents) <= 1:
+        return [render(content) for content in contents]
+    # Forked processes must not share the connections of this one.
+    connections.close_all()
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(render, contents, chunksize=16))
+
+
+def import_posts(root, jobs=None, batch=200, delete=False, dry_run=False):
+    """
+    Synchronize blogs with files under a directory. Only files changed since they were last imported or exported
+    (detected by their digests) are rendered and written, in transactions of a batch of blogs each. Contents are
+    recorded as revisions, like publishing does.
+    Rendered contents are put into the render cache, which only helps if it is shared with workers (see
+    `blog.rendering`). Categories, tags, caches and recommendations are updated once at last, and feeds are queued.
+    :param root: Path of the directory.
+    :param jobs: Number of processes rendering blogs, default to the number of processors.
+    :param batch: Number of blogs written in every transaction.
+    :param delete: Whether to delete blogs without files. Nothing is deleted if any file is invalid.
+    :param dry_run: Whether to only report what would be changed.
+    :return: A generator yielding lines of progress, and a summary at last.
+    """
+    existing = dict(Blog.objects.values_list('publish_path', 'id'))
+    digests = dict(Source.objects.values_list('blog_id', 'digest'))
+    changed, seen, failed = [], set(), 0
+    for file, path in files(root):
+        with open(file, 'rb') as f:
+            data = f.read()
+        try:
+            fields = loads(data.decode(), path)
+        except (UnicodeDecodeError, ValueError) as e:
+            failed += 1
+            yield 'Skipped %s: %s\n' % (file, e)
+            continue
+        if fields['publish_path'] in seen:
+            failed += 1
+            yield 'Skipped %s: %s is published by another file.\n' % (file, fields['publish_path'])
+            continue
+        seen.add(fields['publish_path'])
+        if fields['publish_path'] not in existing or digests.get(existing[fields['publish_path']]) != digest(data):
+            changed.append((digest(data), fields))
+    results = render_all([(fields['content_type'], fields['content_text']) for _, fields in changed],
+                         jobs or os.cpu_count() or 1)
+    ready = []
+    for (digest_, fields), result in zip(changed, results):
+        if result is None:
+            failed += 1
+            yield 'Skipped %s: unknown type %s.\n' % (fields['publish_path'], fields['content_type'])
+        elif isinstance(result, str):
+            failed += 1
+            yield 'Skipped %s: %s\n' % (fields['publish_path'], result)
+        else:
+            ready.append((digest_, fields, result))
+    stale = sorted(blog_id for path, blog_id in existing.items() if path not in seen) if delete else []
+    if stale and failed:
+        yield 'Not deleting %d blogs, since some files are invalid.\n' % len(stale)
+        stale = []
+    if dry_run:
+        for _, fields, _ in ready:
+            yield '%s %s\n' % ('Update' if fields['publish_path'] in existing else 'Create', fields['publish_path'])
+        stale = set(stale)
+        for path, blog_id in existing.items():
+            if blog_id in stale:
+                yield 'Delete %s\n' % path
+        return
+    names = [field for _, field in FIELDS] + ['content_text']
+    for start in range(0, len(ready), batch):
+        chunk = ready[start:start + batch]
+        with transaction.atomic():
+            updated = Blog.objects.in_bulk([existing[fields['publish_path']] for _, fields, _ in chunk
+                                            if fields['publish_path'] in existing])
+            # Contents being overwritten are kept as revisions, in case they were never recorded.
+            revisions.record_many(updated.values())
+            for _, fields, _ in chunk:
+                if fields['publish_path'] in existing:
+                    blog = updated[existing[fields['publish_path']]]
+                    for name in names:
+                        setattr(blog, name, fields[name])
+            Blog.objects.bulk_update(updated.values(), names)
+            # Not every database returns primary keys of created rows, so they are queried again.
+            Blog.objects.bulk_create([Blog(**{name: fields[name] for name in names}) for _, fields, _ in chunk
+                                      if fields['publish_path'] not in existing])
+            blogs = Blog.objects.in_bulk([fields['publish_path'] for _, fields, _ in chunk], field_name='publish_path')
+            Source.objects.filter(blog_id__in=[blog.id for blog in blogs.values()]).delete()
+            Source.objects.bulk_create([Source(blog_id=blogs[fields['publish_path']].id, digest=digest_)
+                                        for digest_, fields, _ in chunk])
+            taxonomy.sync_many(blogs.values())
+            revisions.record_many(blogs.values())
+        for _, fields, result in chunk:
+            rendering.store(fields['content_type'], fields['content_text'], result)
+        yield 'Imported %d of %d blogs\n' % (start + len(chunk), len(ready))
+    for start in range(0, len(stale), batch):
+        # Deleting sends signals, which detach categories and tags.
+        Blog.objects.filter(id__in=stale[start:start + batch]).delete()
+    if ready or stale:
+        feeds.enqueue()
+        caches.invalidate()
+        if related.numpy is not None:
+            related.rebuild()
+    created = sum(fields['publish_path'] not in existing for _, fields, _ in ready)
+    yield 'Created %d, updated %d, deleted %d, unchanged %d, failed %d.\n' % (
+        created, len(ready) - created, len(stale), len(seen) - len(changed), failed)
+
+
+def export_posts(root, delete=False, commit=None):
+    """
+    Write all blogs into files under a directory. Files already up to date are not written again, so that their
+    modification times and the history of the repository only change with blogs.
+    :param root: Path of the directory, created if it does not exist.
+    :param delete: Whether to delete files of blogs which do not exist any more.
+    :param commit: Message of a git commit of all changes under the directory, which must be a git repository. No
+                   commit is made if it is None.
+    :return: A generator yielding lines of progress, and a summary at last.
+    """
+    os.makedirs(root, exist_ok=True)
+    written, sources, total = set(), [], 0
+    for blog in Blog.objects.order_by('id').iterator(chunk_size=500):
+        if RE_PATH.fullmatch(blog.publish_path) is None:
+            yield 'Skipped %s: invalid path.\n' % blog.publish_path
+            continue
+        data = dumps(blog).encode()
+        file = os.path.join(root, *blog.publish_path.split('/')) + SUFFIX
+        written.add(file)
+        sources.append(Source(blog_id=blog.id, digest=digest(data)))
+        try:
+            with open(file, 'rb') as f:
+                if f.read() == data:
+                    continue
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, 'wb') as f:
+            f.write(data)
+        total += 1
+        yield 'Exported %s\n' % blog.publish_path
+    # Files just written are imported already.
+    with transaction.atomic():
+        Source.objects.all().delete()
+        Source.objects.bulk_create(sources, batch_size=500)
+    deleted = 0
+    if delete:
+        for file, _ in list(files(root)):
+            if file not in written:
+                os.remove(file)
+                deleted += 1
+                yield 'Deleted %s\n' % file
+    yield 'Exported %d, unchanged %d, deleted %d.\n' % (total, len(sources) - total, deleted)
+    if commit is not None:
+        subprocess.run(['git', 'add', '--all', '.'], cwd=root, check=True)
+        if subprocess.run(['git', 'diff', '--cached', '--quiet'], cwd=root).returncode == 0:
+            yield 'Nothing to commit.\n'
+        else:
+            subprocess.run(['git', 'commit', '--quiet', '-m', commit], cwd=root, check=True)
+            yield 'Committed.\n'
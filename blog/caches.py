@@ -0,0 +1,203 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from blog.models import Blog, Tag, Views
+from endportal import bus, metrics
+
+
+def stamp_path():
+    """
+    Get the path of the stamp file, whose modification time is the time blog data was last changed. Without the
+    invalidation bus, it is the generation of blog data: every worker compares it with the generation its caches were
+    built at, so that caches of all workers on this machine are invalidated once a blog is changed by any of them.
+    :rtype str
+    """
+    return getattr(settings, 'BLOG_CACHE_STAMP', os.path.join(tempfile.gettempdir(), 'endportal-blog.stamp'))
+
+
+def changed():
+    """
+    Get the time blog data was last changed on this node, or changed on another one and applied by this node, in
+    nanoseconds. This costs a `stat` system call, but no database queries.
+    :rtype int
+    """
+    try:
+        return os.stat(stamp_path()).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def generation():
+    """
+    Get the current generation of blog data: the version of the invalidation bus if it is configured, which is the same
+    on all nodes, so that they share entries of shared caches (e.g. pages) keyed by it, otherwise the time of the last
+    change (see `changed`). Invalidations from other nodes are applied in the background once connected.
+    :rtype int
+    """
+    version_ = bus.version('blog')
+    return version_ if version_ is not None else changed()
+
+
+def invalidate(broadcast=True):
+    """
+    Start a new generation of blog data, invalidating caches of all workers, and those of other nodes through the
+    invalidation bus (see `endportal.bus`).
+    :param broadcast: Whether to publish the invalidation, false when applying one published by another process.
+    """
+    # Make sure that the time always increases, even if the clock is too coarse.
+    now = max(time.time_ns(), changed() + 1)
+    with open(stamp_path(), 'a'):
+        os.utime(stamp_path(), ns=(now, now))
+    if broadcast:
+        bus.publish('blog')
+
+
+bus.register('blog', lambda: invalidate(broadcast=False))
+
+
+class PathIndex:
+    """
+    In-process map of publish paths, deciding whether a path is an article, a directory or nothing without querying the
+    database. Also provides major categories and subdirectories for the navigation.
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: Pairs of blog id and publish path of all blogs.
+        """
+        self.articles, self.children, self.categories = {}, {'': set()}, set()
+        for blog_id, path in rows:
+            self.articles[path] = blog_id
+            # A major category is the first part of access path string after splitting it by slashes.
+            parts = path.split('/')
+            self.categories.add(parts[0])
+            # Every proper prefix of a path is a directory, whose subdirectories are the next parts. Articles are not
+            # subdirectories, unless there are other blogs under them.
+            for i in range(len(parts)):
+                children = self.children.setdefault('/'.join(parts[:i]), set())
+                if i < len(parts) - 1:
+                    children.add(parts[i])
+
+    def article(self, path):
+        """
+        Get the id of the blog published at the given path, or None if there is not.
+        :rtype int | None
+        """
+        return self.articles.get(path)
+
+    def is_directory(self, path):
+        """
+        Check whether there are any blogs under the given path. The root path is always a directory.
+        :rtype bool
+        """
+        return path in self.children
+
+    def subdirectories(self, path):
+        """
+        Get names of subdirectories of the given directory.
+        :rtype set
+        """
+        return self.children.get(path, set())
+
+
+class GenerationCache:
+    """
+    A value of the current process, rebuilt lazily whenever the version it is built for changes.
+    """
+
+    def __init__(self, name, build, version=generation):
+        """
+        :param name: Name of the cache, used for reporting hit rates.
+        :param build: Function building the value.
+        :param version: Function getting the version of the data the value is built from, the generation of blog data
+                        by default.
+        """
+        self.name, self.build, self.version, self.value, self.built = name, build, version, None, None
+
+    def get(self):
+        current = self.version()
+        if self.value is None or self.built != current:
+            metrics.count('cache_miss', self.name)
+            # Build the value completely before publishing it, so that concurrent threads never see a partial one.
+            self.value, self.built = self.build(), current
+        else:
+            metrics.count('cache_hit', self.name)
+        return self.value
+
+
+def popular_count():
+    """
+    Get the number of popular articles in the navigation, configured by `BLOG_POPULAR_COUNT` (default five).
+    :rtype int
+    """
+    return getattr(settings, 'BLOG_POPULAR_COUNT', 5)
+
+
+def popular_refresh():
+    """
+    Get the number of seconds after which the navigation is rebuilt for the latest view counts, configured by
+    `BLOG_POPULAR_REFRESH` (default ten minutes). Views never start a new generation, since that would invalidate all
+    cached pages.
+    :rtype float
+    """
+    return getattr(settings, 'BLOG_POPULAR_REFRESH', 600)
+
+
+def epoch():
+    """
+    Get the number of popular refresh periods since the Unix epoch. Periods start at the same time in all workers and
+    on all nodes, so that the navigation and cached pages showing it are rebuilt for the latest view counts together.
+    :rtype int
+    """
+    return int(time.time() // popular_refresh())
+
+
+def version():
+    """
+    Get the version of blog pages, which show both blog data and the popular articles: the generation of blog data and
+    the epoch of popular articles. Views never start a new generation, so popular articles of cached pages are only
+    refreshed once per period, rather than invalidating all cached pages (and caches of blog data) per view.
+    :rtype (int, int)
+    """
+    return generation(), epoch()
+
+
+def build_navigation():
+    """
+    Collect components of the navigation which are the same for all blog pages: tags (the most used first), recent
+    articles and popular articles (the most viewed first).
+    :rtype dict
+    """
+    # We do not need all the information of recent articles, just access path, publish date and title is enough.
+    # TODO make the number of recent articles configurable.
+    recent = Blog.objects.order_by('-publish_date').only('publish_path', 'publish_date', 'content_name')[:5]
+    popular = Views.objects.filter(count__gt=0).select_related('blog').order_by('-count') \
+        .only('count', 'blog__publish_path', 'blog__publish_date', 'blog__content_name')[:popular_count()]
+    return {
+        'tags': list(Tag.objects.filter(count__gt=0).order_by('-count', 'name').values_list('name', flat=True)),
+        'recent': [(blog.content_name, blog.publish_date, blog.publish_path) for blog in recent],
+        'popular': [(views.blog.content_name, views.blog.publish_date, views.blog.publish_path) for views in popular],
+    }
+
+
+_paths = GenerationCache('paths', lambda: PathIndex(Blog.objects.values_list('id', 'publish_path')))
+_navigation = GenerationCache('navigation', build_navigation, version)
+
+
+def paths():
+    """
+    Get the path index of the current generation, rebuilding it with a single query if blog data has changed.
+    :rtype PathIndex
+    """
+    return _paths.get()
+
+
+def navigation():
+    """
+    Get the navigation components of the current version, see `build_navigation` and `version`.
+    :rtype dict
+    """
+    return _navigation.get()
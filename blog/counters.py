@@ -0,0 +1,92 @@
+import re
+import time
+from collections import Counter
+from threading import Lock
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError, connections, router
+from django.dispatch import receiver
+
+from blog import caches
+from blog.models import Views
+
+# User agents of crawlers and scripts, whose views are not counted. Requests without user agents are not counted either.
+RE_CRAWLER = re.compile(r'bot|crawl|spider|slurp|curl|wget|python|java/|go-http|headless|preview|monitor|feed',
+                        re.IGNORECASE)
+
+_pending, _lock, _flushed = Counter(), Lock(), time.monotonic()
+
+
+def interval():
+    """
+    Get the number of seconds between merges of counters of this worker into the database, configured by
+    `BLOG_VIEWS_FLUSH_INTERVAL` (default one minute). Views of a worker not merged yet are lost once it exits, which
+    are at most those of one interval.
+    :rtype float
+    """
+    return getattr(settings, 'BLOG_VIEWS_FLUSH_INTERVAL', 60)
+
+
+def hit(request, blog_id):
+    """
+    Count a view of a blog in memory. Counters are merged into the database once the response has been sent, see
+    `request_done`, so that viewing never writes to the database.
+    """
+    if RE_CRAWLER.search(request.META.get('HTTP_USER_AGENT', '') or 'bot') is not None:
+        return
+    with _lock:
+        _pending[blog_id] += 1
+
+
+@receiver(request_finished)
+def request_done(**_):
+    """
+    Merge counters of this worker into the database once they are older than the flush interval. This runs after the
+    response of a request has been sent, on the connection of the request, so no request ever waits for it.
+    """
+    global _flushed
+    with _lock:
+        if not _pending or time.monotonic() - _flushed < interval():
+            return
+        _flushed = time.monotonic()
+    flush()
+
+
+def upsert(connection, counts):
+    """
+    Add counts to the counter table with a single statement, whatever the number of blogs.
+    :param connection: Database connection.
+    :param counts: Pairs of blog ID and count.
+    """
+    table, quote = Views._meta.db_table, connection.ops.quote_name
+    values = ', '.join(['(%s, %s)'] * len(counts))
+    if connection.vendor == 'mysql':
+        conflict = 'ON DUPLICATE KEY UPDATE {count} = {count} + VALUES({count})'
+    else:
+        # Both PostgreSQL and SQLite (since 3.24) support this.
+        conflict = 'ON CONFLICT ({blog}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}'
+    sql = ('INSERT INTO {table} ({blog}, {count}) VALUES %s ' % values + conflict).format(
+        table=quote(table), blog=quote('blog_id'), count=quote('count'))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for pair in counts for value in pair])
+
+
+def flush():
+    """
+    Merge counters of this worker into the database, and reset them.
+    """
+    with _lock:
+        counts = sorted(_pending.items())
+        _pending.clear()
+    if not counts:
+        return
+    try:
+        # Blogs deleted since they were viewed would violate the foreign key.
+        articles = set(caches.paths().articles.values())
+        counts = [(blog_id, count) for blog_id, count in counts if blog_id in articles]
+        if counts:
+            upsert(connections[router.db_for_write(Views)], counts)
+    except DatabaseError:
+        # A blog may still have been deleted just now, views are not worth retrying.
+        pass
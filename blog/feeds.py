@@ -0,0 +1,205 @@
+import hashlib
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.html import escape
+
+from blog import caches, rendering
+from blog.models import Blog, Document, Regeneration
+from endportal import metrics, pagecache
+
+FEED_TYPES = {'rss': Rss201rev2Feed, 'atom': Atom1Feed}
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def feed_count():
+    """
+    Get the number of latest blogs included in feeds, configured by `BLOG_FEED_COUNT` (default twenty).
+    :rtype int
+    """
+    return getattr(settings, 'BLOG_FEED_COUNT', 20)
+
+
+def sitemap_size():
+    """
+    Get the maximum number of URLs in one sitemap, configured by `BLOG_SITEMAP_SIZE`. The protocol allows at most 50000,
+    sitemaps with more blogs than this are split into shards listed by a sitemap index.
+    :rtype int
+    """
+    return getattr(settings, 'BLOG_SITEMAP_SIZE', 50000)
+
+
+def site_url():
+    """
+    Get the absolute URL of the site root without the trailing slash, which generated documents link to, configured by
+    `BLOG_SITE_URL`. Documents are generated when blogs change rather than when requested, so the host of requests is
+    unknown. Default to the first host of `ALLOWED_HOSTS` which is not a pattern, over HTTPS.
+    :rtype str
+    """
+    url = getattr(settings, 'BLOG_SITE_URL', None)
+    if url is None:
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        url = 'https://' + hosts[0] if hosts else 'http://localhost'
+    return url.rstrip('/')
+
+
+def generate():
+    """
+    Generate all feeds and sitemaps. Shards of the sitemap are only generated if it is a sitemap index.
+    :return: Contents of documents by name.
+    :rtype dict
+    """
+    root = site_url()
+    documents = {'feed-' + kind: build_feed(kind, root) for kind in FEED_TYPES}
+    documents['sitemap-None'] = build_sitemap(None, root)
+    shards = (Blog.objects.count() + sitemap_size() - 1) // sitemap_size()
+    if shards > 1:
+        for shard in range(1, shards + 1):
+            content = build_sitemap(shard, root)
+            if content is not None:
+                documents['sitemap-%d' % shard] = content
+    return documents
+
+
+def rebuild():
+    """
+    Generate all feeds and sitemaps and store them. Only documents which have changed are compressed and written, and
+    documents which are no longer generated (e.g. shards of a shrunk sitemap) are deleted.
+    :return: Number of documents written or deleted.
+    :rtype int
+    """
+    documents = generate()
+    etags = dict(Document.objects.values_list('name', 'etag'))
+    rows = []
+    for name, content in documents.items():
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+        if etags.get(name) != etag:
+            variants = pagecache.encode(content)
+            rows.append(Document(name=name, etag=etag, identity=content, gzip=variants.get('gzip'),
+                                 br=variants.get('br')))
+    stale = [name for name in etags if name not in documents]
+    with transaction.atomic():
+        Document.objects.filter(name__in=stale + [row.name for row in rows]).delete()
+        Document.objects.bulk_create(rows)
+    return len(rows) + len(stale)
+
+
+def enqueue():
+    """
+    Queue regenerating feeds and sitemaps, which is done by `process` in a process of its own (see the `buildfeeds`
+    management command), so that neither publishing nor serving ever generates them. The request is committed along
+    with the changes of blogs.
+    """
+    Regeneration.objects.create()
+
+
+def process():
+    """
+    Regenerate feeds and sitemaps once for all queued requests. Requests queued meanwhile are left for the next time.
+    :return: Number of queued requests, and number of documents written or deleted.
+    :rtype int, int
+    """
+    last = Regeneration.objects.aggregate(last=Max('id'))['last']
+    if last is None:
+        return 0, 0
+    queued, updated = Regeneration.objects.filter(id__lte=last).count(), rebuild()
+    Regeneration.objects.filter(id__lte=last).delete()
+    if updated:
+        # Documents are cached per generation of blog data.
+        caches.invalidate()
+    return queued, updated
+
+
+def cached(name):
+    """
+    Get a generated document, from django's default cache or from the database once per generation of blog data.
+    :param name: Name of the document.
+    :return: Precompressed variants of the document (see `endportal.pagecache.encode`) and its entity tag, or None if it
+             does not exist.
+    :rtype (dict, str) | None
+    """
+    key = 'blog:feeds:%s:%d' % (name, caches.generation())
+    result = cache.get(key)
+    if result is None:
+        metrics.count('cache_miss', 'feeds')
+        document = Document.objects.filter(name=name).first()
+        # Nonexistent documents are cached as well, so that crawlers probing them are cheap too.
+        result = () if document is None else (
+            {coding: bytes(getattr(document, coding)) for coding in ('identity', 'gzip', 'br')
+             if getattr(document, coding) is not None}, document.etag)
+        cache.set(key, result, getattr(settings, 'BLOG_FEED_TIMEOUT', 86400))
+    else:
+        metrics.count('cache_hit', 'feeds')
+    return result or None
+
+
+def build_feed(kind, root):
+    """
+    Generate a full-content feed of the latest blogs. Contents come from the render cache, so they are only rendered if
+    they have never been viewed. This only runs after blogs change, never when feeds are requested.
+    :param kind: Either `rss` or `atom`.
+    :param root: Absolute URL of the site root, without the trailing slash.
+    :rtype bytes
+    """
+    blogs = Blog.objects.order_by('-publish_date', '-id')[:feed_count()]
+    feed = FEED_TYPES[kind](
+        title=getattr(settings, 'BLOG_FEED_TITLE', 'endportal'),
+        link=root + reverse('blog-content', kwargs={'path': ''}),
+        description=getattr(settings, 'BLOG_FEED_DESC', ''),
+        feed_url=root + reverse('blog-feed', kwargs={'kind': kind}),
+        language='zh-cn')
+    for blog in blogs:
+        content = rendering.rendered(blog.content_type, blog.content_text)
+        feed.add_item(
+            title=blog.content_name,
+            link=root + reverse('blog-content', kwargs={'path': blog.publish_path + '/'}),
+            description=content['content_text'] if content is not None else escape(blog.content_desc),
+            pubdate=datetime.combine(blog.publish_date, time()),
+            categories=[tag for tag in blog.content_tags.split(',') if tag != ''],
+            unique_id=root + reverse('blog-content', kwargs={'path': blog.publish_path + '/'}))
+    return feed.writeString('utf-8').encode()
+
+
+def build_sitemap(shard, root):
+    """
+    Generate the sitemap. If there are more blogs than fit in one sitemap, the sitemap without a shard number is a
+    sitemap index instead, and shards are numbered from one.
+    Only publish paths and dates are queried, in the order of the unique index on publish paths.
+    :param shard: Shard number, or None for the sitemap (or sitemap index) itself.
+    :param root: Absolute URL of the site root, without the trailing slash.
+    :rtype bytes | None
+    """
+    size, total = sitemap_size(), Blog.objects.count()
+    shards = max((total + size - 1) // size, 1)
+    if shard is None and shards > 1:
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<sitemapindex xmlns="%s">' % SITEMAP_NS]
+        for i in range(1, shards + 1):
+            lines.append('<sitemap><loc>%s</loc></sitemap>' % escape(root + reverse('sitemap-shard', args=(i,))))
+        lines.append('</sitemapindex>')
+        return '\n'.join(lines).encode()
+    if shard is not None and not 1 <= shard <= shards:
+        return None
+    start = (shard - 1) * size if shard is not None else 0
+    rows = Blog.objects.order_by('publish_path').values_list('publish_path', 'publish_date')[start:start + size]
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<urlset xmlns="%s">' % SITEMAP_NS]
+    # The blog root is only listed in an unsharded sitemap, so that shards never exceed the size limit.
+    if shard is None:
+        lines.append('<url><loc>%s</loc></url>' % escape(root + reverse('blog-content', kwargs={'path': ''})))
+    for path, date in rows:
+        lines.append('<url><loc>%s</loc><lastmod>%s</lastmod></url>' % (
+            escape(root + reverse('blog-content', kwargs={'path': path + '/'})), date.isoformat()))
+    lines.append('</urlset>')
+    return '\n'.join(lines).encode()
+
+
+def feed(kind):
+    return cached('feed-' + kind)
+
+
+def sitemap(shard=None):
+    return cached('sitemap-%s' % shard)
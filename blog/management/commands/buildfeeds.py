@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import caches, feeds
+
+
+class Command(BaseCommand):
+    """
+    Generate feeds and sitemaps queued by publishing and deleting, see `blog.feeds.process`. Unlike web commands, this
+    runs in a process of its own, so that generating them never occupies a worker. Run it from cron, or keep it running
+    with `--follow`. Run it with `--all` once after deploying, or after changing `BLOG_SITE_URL` or other settings of
+    feeds.
+    """
+    help = 'Generate feeds and sitemaps of changed blogs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Generate them even if no blogs have changed.')
+        parser.add_argument('--follow', action='store_true', help='Keep waiting for changed blogs.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait for changed blogs.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            total = feeds.rebuild()
+            if total:
+                caches.invalidate()
+            self.stdout.write('Generated feeds and sitemaps for %s, %d documents changed.' % (feeds.site_url(), total))
+        try:
+            while True:
+                queued, updated = feeds.process()
+                if queued:
+                    self.stdout.write('Generated %d documents for %d changes.' % (updated, queued))
+                if not options['follow']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            # Changes being processed are still queued.
+            pass
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q
+
+from blog import caches
+from blog.models import Blog
+
+
+class Command(BaseCommand):
+    """
+    Rename blogs sharing a publish path, which must be done before migrating to unique publish paths. The oldest blog
+    (with the smallest ID) keeps the path, and every other one is moved to the path with its ID appended, e.g. `a/b-12`.
+    Blogs under reserved paths (see `Blog.RESERVED`), which are routed to other pages, are moved by appending their IDs
+    to the first parts of their paths instead, e.g. `tags-12/a`.
+    Only publish paths are queried and updated, so this works with the schema before migrating. Run `retag` afterwards
+    if a renamed path has no slash, or a reserved path was renamed, since its category changes.
+    """
+    help = 'Rename blogs sharing a publish path, or published at a reserved path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be renamed.')
+
+    def handle(self, *args, **options):
+        max_length = Blog._meta.get_field('publish_path').max_length
+        duplicated = Blog.objects.values('publish_path').annotate(total=Count('id')).filter(total__gt=1) \
+            .values_list('publish_path', flat=True)
+        taken, kept, renames = set(Blog.objects.values_list('publish_path', flat=True)), None, []
+        reserved = Q(publish_path__in=Blog.RESERVED)
+        for first in Blog.RESERVED:
+            reserved |= Q(publish_path__startswith=first + '/')
+        for path, blog_id in Blog.objects.filter(reserved).order_by('id').values_list('publish_path', 'id'):
+            first, slash, rest = path.partition('/')
+            renames.append((blog_id, path, (first + '-%d' % blog_id + slash + rest)[:max_length]))
+        renamed = {blog_id for blog_id, _, _ in renames}
+        for path, blog_id in Blog.objects.filter(publish_path__in=list(duplicated)).order_by('publish_path', 'id') \
+                .values_list('publish_path', 'id'):
+            # The first blog of every path keeps it.
+            if blog_id in renamed:
+                continue
+            if path != kept:
+                kept = path
+                continue
+            suffix = '-%d' % blog_id
+            renames.append((blog_id, path, path[:max_length - len(suffix)] + suffix))
+        with transaction.atomic():
+            for blog_id, path, target in renames:
+                if target in taken:
+                    raise CommandError("Cannot rename blog %d, '%s' is taken." % (blog_id, target))
+                self.stdout.write("Renaming blog %d from '%s' to '%s'" % (blog_id, path, target))
+                if not options['dry_run']:
+                    Blog.objects.filter(id=blog_id).update(publish_path=target)
+                taken.add(target)
+        if renames and not options['dry_run']:
+            caches.invalidate()
+        self.stdout.write('\n%d blogs renamed.' % len(renames))
@@ -0,0 +1,25 @@
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import archive
+
+
+class Command(BaseCommand):
+    """
+    Export all blogs into a directory tree of markdown files, see `blog.archive` for the format. Exporting into a git
+    repository with `--commit` keeps the history of blogs.
+    """
+    help = 'Export blogs into a directory of markdown files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', help='Path of the directory.')
+        parser.add_argument('--delete', action='store_true', help='Delete files of blogs which do not exist.')
+        parser.add_argument('--commit', metavar='MESSAGE', help='Commit changes to the git repository of the directory.')
+
+    def handle(self, *args, **options):
+        try:
+            for line in archive.export_posts(options['root'], options['delete'], options['commit']):
+                self.stdout.write(line, ending='')
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CommandError(e)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import archive
+
+
+class Command(BaseCommand):
+    """
+    Import blogs from a directory tree of markdown files, see `blog.archive` for the format. Unlike web commands, this
+    runs in a process of its own, so that rendering can use all processors.
+    """
+    help = 'Import blogs from a directory of markdown files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', help='Path of the directory.')
+        parser.add_argument('--jobs', type=int, help='Number of processes rendering blogs, default to all processors.')
+        parser.add_argument('--batch', type=int, default=200, help='Number of blogs written in each transaction.')
+        parser.add_argument('--delete', action='store_true', help='Delete blogs without files.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be changed.')
+
+    def handle(self, *args, **options):
+        if options['batch'] <= 0 or (options['jobs'] is not None and options['jobs'] <= 0):
+            raise CommandError('Numbers must be positive.')
+        try:
+            for line in archive.import_posts(options['root'], options['jobs'], options['batch'], options['delete'],
+                                             options['dry_run']):
+                self.stdout.write(line, ending='')
+        except OSError as e:
+            raise CommandError(e)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import related
+
+
+class Command(BaseCommand):
+    """
+    Refresh recommendations of blogs queued by publishing and deleting, see `blog.related.process`. Unlike web
+    commands, this runs in a process of its own, so that computing recommendations never occupies a worker. Run it from
+    cron, or keep it running with `--follow`.
+    """
+    help = 'Refresh recommendations of changed blogs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follow', action='store_true', help='Keep waiting for changed blogs.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait for changed blogs.')
+
+    def handle(self, *args, **options):
+        if related.numpy is None:
+            raise CommandError('NumPy is not installed.')
+        try:
+            while True:
+                queued, updated = related.process()
+                if queued:
+                    self.stdout.write('Refreshed recommendations of %d blogs for %d changed blogs.' % (updated, queued))
+                if not options['follow']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            # Blogs being refreshed are still queued.
+            pass
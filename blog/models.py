@@ -1,8 +1,22 @@
 from django.db import models
 
 
+class Tag(models.Model):
+    name = models.CharField(max_length=64, unique=True)
+    # Number of blogs with this tag, maintained on publish so that the tag cloud never has to count.
+    count = models.IntegerField(default=0, db_index=True)
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=64, unique=True)
+    # Number of blogs in this category, maintained on publish.
+    count = models.IntegerField(default=0, db_index=True)
+
+
 class Blog(models.Model):
-    publish_path = models.CharField(max_length=64)
+    # The unique constraint also creates an index. On PostgreSQL, django additionally creates a `varchar_pattern_ops`
+    # index for it, so that prefix searches (i.e. `publish_path__startswith`) are index scans as well.
+    publish_path = models.CharField(max_length=64, unique=True)
     publish_date = models.DateField()
     publish_desc = models.CharField(max_length=64)
     content_name = models.CharField(max_length=64)
@@ -11,3 +25,106 @@ class Blog(models.Model):
     content_tags = models.TextField()
     content_desc = models.TextField()
     content_text = models.TextField()
+    # Normalized forms of the first part of publish path and of content tags, which are kept as the source of truth.
+    # They are maintained by `blog.taxonomy`, and should never be set directly.
+    category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.SET_NULL, related_name='blogs')
+    tags = models.ManyToManyField(Tag, blank=True, related_name='blogs')
+
+    # First parts of publish paths routed to other pages than blogs (see `blog.urls`), where blogs would be unreachable.
+    RESERVED = frozenset({'indices', 'publish', 'feed', 'tags'})
+
+    @staticmethod
+    def reserved(path):
+        """
+        Check whether blogs can not be published at a path, since it is routed to another page.
+        :rtype bool
+        """
+        return path.split('/')[0] in Blog.RESERVED
+
+
+class Related(models.Model):
+    """
+    Precomputed recommendation: `target` is one of the blogs most similar to `blog`, maintained by `blog.related`.
+    """
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='related')
+    target = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.IntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['blog', 'rank'])]
+
+
+class Document(models.Model):
+    """
+    A generated feed or sitemap with its precompressed variants, regenerated by `blog.feeds` after blogs change, so
+    that serving it never generates anything.
+    """
+    name = models.CharField(max_length=32, primary_key=True)
+    etag = models.CharField(max_length=34)
+    identity = models.BinaryField()
+    gzip = models.BinaryField(null=True)
+    br = models.BinaryField(null=True)
+
+
+class Regeneration(models.Model):
+    """
+    Request to regenerate feeds and sitemaps by `blog.feeds`, queued whenever blogs change. All queued requests are
+    consumed at once, in order of IDs.
+    """
+
+
+class Terms(models.Model):
+    """
+    Term counts of a blog (a JSON object), maintained by `blog.related`, so that refreshing recommendations never
+    tokenizes unchanged blogs again.
+    """
+    blog = models.OneToOneField(Blog, primary_key=True, on_delete=models.CASCADE, related_name='terms')
+    data = models.TextField()
+
+
+class Outdated(models.Model):
+    """
+    Blog whose recommendations, and those of blogs affected by it, are to be refreshed by `blog.related`. Blogs may be
+    queued several times, the queue is consumed in order of IDs.
+    """
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='+')
+
+
+class Views(models.Model):
+    """
+    Number of views of a blog, merged periodically from counters of all workers by `blog.counters`.
+    """
+    blog = models.OneToOneField(Blog, primary_key=True, on_delete=models.CASCADE, related_name='views')
+    count = models.BigIntegerField(default=0, db_index=True)
+
+
+class Source(models.Model):
+    """
+    Digest of the file a blog was last imported from or exported to, maintained by `blog.archive`, so that unchanged
+    files are skipped when importing again.
+    """
+    blog = models.OneToOneField(Blog, primary_key=True, on_delete=models.CASCADE, related_name='source')
+    digest = models.CharField(max_length=32)
+
+
+class Revision(models.Model):
+    """
+    A version of the content of a blog, maintained by `blog.revisions`. The content is stored compressed, either in
+    full (a snapshot), or as a delta against the previous revision.
+    """
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='revisions')
+    # Revisions of every blog are numbered from one.
+    number = models.PositiveIntegerField()
+    # Number of the snapshot the chain of deltas starts from, which is the number itself for snapshots.
+    base = models.PositiveIntegerField()
+    created = models.DateTimeField()
+    content_type = models.CharField(max_length=16)
+    # Digest of the content type and text, see `blog.rendering.digest`.
+    digest = models.CharField(max_length=32)
+    # Number of characters of the content text.
+    length = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['blog', 'number'], name='blog_revision_unique')]
@@ -0,0 +1,246 @@
+import json
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from blog import caches
+from blog.models import Blog, Outdated, Related, Terms
+
+# NumPy is only required for computing recommendations. Without it, the related posts card is simply empty.
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+# CJK texts have no spaces between words, so we use overlapping character bigrams as their terms instead.
+RE_TOKEN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+|[a-z0-9_]{2,}')
+RE_CJK = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]')
+# Titles and tags describe a blog much better than its body, so their terms are repeated.
+TITLE_WEIGHT, TAGS_WEIGHT = 3, 3
+# Upper bound of the vocabulary, which bounds the size of the document-term matrix.
+MAX_FEATURES = 4096
+
+
+def count():
+    """
+    Get the number of related blogs stored for each blog, configured by `BLOG_RELATED_COUNT` (default five).
+    :rtype int
+    """
+    return getattr(settings, 'BLOG_RELATED_COUNT', 5)
+
+
+def tokenize(text):
+    """
+    Split a text into terms: latin words and numbers as they are, CJK runs as character bigrams (or the character
+    itself for single character runs).
+    :rtype list
+    """
+    terms = []
+    for token in RE_TOKEN.findall(text.lower()):
+        if RE_CJK.match(token):
+            terms.extend([token[i:i + 2] for i in range(len(token) - 1)] if len(token) > 1 else [token])
+        else:
+            terms.append(token)
+    return terms
+
+
+def document(blog):
+    return Counter(tokenize(blog.content_name) * TITLE_WEIGHT +
+                   tokenize(blog.content_tags.replace(',', ' ')) * TAGS_WEIGHT +
+                   tokenize(blog.content_text))
+
+
+def documents(changed=()):
+    """
+    Get term counts of all blogs. Only changed blogs and blogs never tokenized are loaded and tokenized, term counts of
+    others are read from `Terms`.
+    :param changed: IDs of blogs whose stored term counts are outdated.
+    :return: IDs of all blogs in order, and their term counts.
+    :rtype list, list
+    """
+    changed = set(changed)
+    stored = {blog_id: data for blog_id, data in Terms.objects.values_list('blog_id', 'data') if blog_id not in changed}
+    ids = list(Blog.objects.order_by('id').values_list('id', flat=True))
+    missing = [blog_id for blog_id in ids if blog_id not in stored]
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        terms = [Terms(blog_id=blog.id, data=json.dumps(document(blog), ensure_ascii=False)) for blog in
+                 Blog.objects.filter(id__in=chunk).only('id', 'content_name', 'content_tags', 'content_text')]
+        with transaction.atomic():
+            Terms.objects.filter(blog_id__in=chunk).delete()
+            Terms.objects.bulk_create(terms)
+        stored.update((term.blog_id, term.data) for term in terms)
+    # Blogs may have been deleted meanwhile.
+    ids = [blog_id for blog_id in ids if blog_id in stored]
+    return ids, [json.loads(stored[blog_id]) for blog_id in ids]
+
+
+def vectorize(documents_):
+    """
+    Build L2-normalized TF-IDF vectors of blogs, using sublinear term frequencies.
+    Only the most common terms (appearing in at least two but not more than half of the blogs, if there are enough of
+    them) are kept as features, so that the matrix stays small.
+    :param documents_: Term counts of blogs, see `documents`.
+    :return: A matrix, one row for each blog.
+    :rtype numpy.ndarray
+    """
+    frequencies = Counter(term for doc in documents_ for term in doc)
+    candidates = [term for term, df in frequencies.items() if 2 <= df <= max(2, len(documents_) // 2)] or \
+        list(frequencies)
+    candidates.sort(key=lambda term: frequencies[term], reverse=True)
+    vocabulary = {term: i for i, term in enumerate(candidates[:MAX_FEATURES])}
+    # Collect all non-zero entries first and fill the matrix with one vectorized assignment.
+    rows, cols, values = [], [], []
+    for i, doc in enumerate(documents_):
+        for term, tf in doc.items():
+            if term in vocabulary:
+                rows.append(i)
+                cols.append(vocabulary[term])
+                values.append(tf)
+    matrix = numpy.zeros((len(documents_), max(len(vocabulary), 1)), dtype=numpy.float32)
+    matrix[rows, cols] = values
+    numpy.log1p(matrix, out=matrix)
+    df = numpy.zeros(matrix.shape[1], dtype=numpy.float32)
+    for term, i in vocabulary.items():
+        df[i] = frequencies[term]
+    matrix *= numpy.log((1 + len(documents_)) / (1 + df)) + 1
+    norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def top_k(similarities, k, exclude):
+    """
+    Select the k most similar blogs of every row of a similarity matrix.
+    :param similarities: Similarity matrix, one row for each source blog and one column for each candidate.
+    :param k: Number of blogs to select.
+    :param exclude: Column index of the source blog itself of every row.
+    :return: Indices and scores, both matrices of k columns sorted by scores descending.
+    :rtype numpy.ndarray, numpy.ndarray
+    """
+    similarities = similarities.copy()
+    similarities[numpy.arange(len(exclude)), exclude] = -1
+    k = min(k, similarities.shape[1] - 1)
+    if k <= 0:
+        return numpy.zeros((len(exclude), 0), dtype=int), numpy.zeros((len(exclude), 0))
+    indices = numpy.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    scores = numpy.take_along_axis(similarities, indices, axis=1)
+    order = numpy.argsort(-scores, axis=1)
+    return numpy.take_along_axis(indices, order, axis=1), numpy.take_along_axis(scores, order, axis=1)
+
+
+def store(ids, sources, indices, scores):
+    """
+    Replace stored recommendations of the given source blogs. Blogs without any common terms are not recommended.
+    :param ids: IDs of all blogs, which indices refer to.
+    """
+    rows = []
+    for source, targets, values in zip(sources, indices, scores):
+        rank = 0
+        for target, score in zip(targets, values):
+            if score > 0:
+                rows.append(Related(blog_id=ids[source], target_id=ids[target], score=float(score), rank=rank))
+                rank += 1
+    with transaction.atomic():
+        Related.objects.filter(blog_id__in=[ids[source] for source in sources]).delete()
+        Related.objects.bulk_create(rows, batch_size=500)
+
+
+def rebuild():
+    """
+    Recompute recommendations of all blogs from scratch, tokenizing all blogs again.
+    :return: Number of blogs processed.
+    :rtype int
+    """
+    ids, documents_ = documents(Blog.objects.values_list('id', flat=True))
+    if not ids:
+        return 0
+    matrix = vectorize(documents_)
+    # Compute similarities in blocks, so that the full similarity matrix never has to be held in memory.
+    for start in range(0, len(ids), 512):
+        sources = numpy.arange(start, min(start + 512, len(ids)))
+        indices, scores = top_k(matrix[sources] @ matrix.T, count(), sources)
+        store(ids, sources, indices, scores)
+    return len(ids)
+
+
+def refresh(blog_ids):
+    """
+    Update recommendations affected by created or modified blogs: their own ones, those which currently include them,
+    and those which they now deserve to enter. Others are left untouched, although document frequencies may have
+    changed slightly, a full rebuild fixes that. Only the changed blogs are tokenized.
+    :param blog_ids: IDs of changed blogs.
+    :return: Number of blogs whose recommendations are updated.
+    :rtype int
+    """
+    blog_ids = set(blog_ids)
+    ids, documents_ = documents(blog_ids)
+    positions = {blog_id: i for i, blog_id in enumerate(ids)}
+    changed = sorted(positions[blog_id] for blog_id in blog_ids if blog_id in positions)
+    if not changed:
+        return 0
+    matrix = vectorize(documents_)
+    # The most similar changed blog of every blog, other than itself.
+    similarities = matrix @ matrix[changed].T
+    similarities[changed, numpy.arange(len(changed))] = -1
+    best = similarities.max(axis=1)
+    affected = set(changed)
+    affected.update(positions[source] for source in Related.objects.filter(target_id__in=blog_ids)
+                    .values_list('blog_id', flat=True) if source in positions)
+    stored = {row['blog_id']: row for row in
+              Related.objects.values('blog_id').annotate(lowest=Min('score'), total=Count('id'))}
+    for position, blog_id in enumerate(ids):
+        row = stored.get(blog_id)
+        if best[position] > 0 and (row is None or row['total'] < count() or row['lowest'] < best[position]):
+            affected.add(position)
+    sources = numpy.array(sorted(affected))
+    indices, scores = top_k(matrix[sources] @ matrix.T, count(), sources)
+    store(ids, sources, indices, scores)
+    return len(sources)
+
+
+def enqueue(blog_ids):
+    """
+    Queue changed blogs, whose recommendations are refreshed by `process` in a process of its own (see the
+    `refreshrelated` management command), so that serving workers never compute them.
+    """
+    if numpy is not None:
+        Outdated.objects.bulk_create([Outdated(blog_id=blog_id) for blog_id in set(blog_ids)])
+
+
+def enqueue_referrers(blog_id):
+    """
+    Queue blogs recommending a blog which is about to be deleted, since their recommendations become short.
+    """
+    enqueue(Related.objects.filter(target_id=blog_id).exclude(blog_id=blog_id).values_list('blog_id', flat=True))
+
+
+def process():
+    """
+    Refresh recommendations of all queued blogs at once. Blogs queued meanwhile are left for the next time.
+    :return: Number of queued blogs, and number of blogs whose recommendations are updated.
+    :rtype int, int
+    """
+    last = Outdated.objects.aggregate(last=Max('id'))['last']
+    if last is None:
+        return 0, 0
+    blog_ids = set(Outdated.objects.filter(id__lte=last).values_list('blog_id', flat=True))
+    updated = refresh(blog_ids)
+    Outdated.objects.filter(id__lte=last).delete()
+    if updated:
+        # Cached pages showing the old recommendations must be rebuilt.
+        caches.invalidate()
+    return len(blog_ids), updated
+
+
+def lookup(blog_id):
+    """
+    Get recommendations of a blog with a single indexed query.
+    :return: A list of title, publish date and publish path of related blogs.
+    :rtype list
+    """
+    return [(related.target.content_name, related.target.publish_date, related.target.publish_path)
+            for related in Related.objects.filter(blog_id=blog_id).order_by('rank').select_related('target')]
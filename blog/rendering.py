@@ -0,0 +1,95 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.text import slugify
+from markdown import Markdown
+
+from endportal import metrics
+
+markdown = Markdown(
+    extensions=['markdown.extensions.extra', 'markdown.extensions.toc', 'markdown.extensions.codehilite', 'arithmatex'],
+    extension_configs={
+        # Enable line numbers.
+        'markdown.extensions.codehilite': {'linenums': True},
+        # Enable generic mode for katex, disable smart dollar because it breaks inline math.
+        'arithmatex': {'generic': True, 'smart_dollar': False}
+    },
+    # They said that this can help to improve Chinese character issues.
+    slugify=slugify)
+
+
+def render(content_type, content_text):
+    """
+    Process the content of a blog into HTML, along with a menu list.
+    :param content_type: Content type of the blog.
+    :param content_text: Raw content text of the blog.
+    :return: A dictionary of `content_text` (HTML) and `content_menu`, or None if the content type is unrecognizable.
+    :rtype dict | None
+    """
+    # Enumerate every content type that is supported.
+    if content_type == 'markdown':
+        with metrics.timer('markdown'):
+            html = markdown.convert(content_text)
+        # For markdowns, the only thing to do is to generate a menu list.
+        # In order to do this, we collect all <h2> and <h3> fragments and their ids. The <h2> will be the outer layer,
+        # while <h3> will be the inner layer. Too much layers will cause visual inconvenience so we have at most two.
+        # We do not use the official markdown TOC plugin since it can not customize the number of layers we wanted.
+        menu = []
+        for header in re.finditer(r'<h([23])\s+id="([^"]+)">(.+)</h', html):
+            # Group one is the header type (i.e. <h2> or <h3>), group two and three are the id and title, respectively.
+            pair = (header.group(3), header.group(2))
+            if header.group(1) == '2':
+                menu.append(pair)
+            else:
+                if len(menu) != 0 and menu[-1][0] is None:
+                    # If the last item in the menu is already a list, all we have to do is to append the current <h3> to
+                    # it.
+                    menu[-1][1].append(pair)
+                else:
+                    menu.append((None, [pair]))
+        return {'content_text': html, 'content_menu': menu}
+    return None
+
+
+def digest(content_type, content_text):
+    """
+    Get the digest of a content, which tells whether two contents are the same.
+    :rtype str
+    """
+    return hashlib.md5((content_type + '\0' + content_text).encode()).hexdigest()
+
+
+def key(content_type, content_text):
+    """
+    Get the key of a content in the render cache, which is its digest, so that modified blogs are never served stale.
+    Revisions (see `blog.revisions`) record the same digests, so a content is rendered once whichever revision it is.
+    :rtype str
+    """
+    return 'blog:rendered:%s' % digest(content_type, content_text)
+
+
+def store(content_type, content_text, result):
+    """
+    Put a rendered content into the render cache, e.g. one rendered in another process.
+    """
+    cache.set(key(content_type, content_text), result, getattr(settings, 'BLOG_RENDER_TIMEOUT', 86400))
+
+
+def rendered(content_type, content_text):
+    """
+    Get the rendered content of a blog from the render cache, rendering it only if it is not cached yet.
+    The render cache is django's default cache, configure a shared one (e.g. memcached) to render each blog only once
+    for all workers.
+    :rtype dict | None
+    """
+    result = cache.get(key(content_type, content_text))
+    if result is None:
+        metrics.count('cache_miss', 'render')
+        result = render(content_type, content_text)
+        if result is not None:
+            store(content_type, content_text, result)
+    else:
+        metrics.count('cache_hit', 'render')
+    return result
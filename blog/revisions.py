@@ -0,0 +1,136 @@
+import difflib
+import json
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from blog import rendering
+from blog.models import Blog, Revision
+
+
+def interval():
+    """
+    Get the maximum number of revisions in a chain of deltas, configured by `BLOG_REVISION_SNAPSHOT` (default 16).
+    Every revision is rebuilt from a snapshot by applying at most this number minus one deltas.
+    :rtype int
+    """
+    return getattr(settings, 'BLOG_REVISION_SNAPSHOT', 16)
+
+
+def timeout():
+    """
+    Get the number of seconds texts of revisions are cached once rebuilt, configured by `BLOG_REVISION_TIMEOUT`
+    (default one hour). Texts are only rebuilt for recording the next revision and for browsing history, so they are
+    not worth keeping long.
+    :rtype float
+    """
+    return getattr(settings, 'BLOG_REVISION_TIMEOUT', 3600)
+
+
+def delta(base, text):
+    """
+    Encode a text as a delta against a base text: a JSON list of line ranges of the base (`[start, end]`) and inserted
+    texts, in order. Blogs are mostly edited a few lines at a time, so deltas are much smaller than texts.
+    :rtype str
+    """
+    old, new, operations = base.splitlines(True), text.splitlines(True), []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            operations.append([i1, i2])
+        elif j2 > j1:
+            operations.append(''.join(new[j1:j2]))
+    return json.dumps(operations, ensure_ascii=False, separators=(',', ':'))
+
+
+def patch(base, delta_):
+    """
+    Rebuild a text from its base text and its delta, see `delta`.
+    :rtype str
+    """
+    old = base.splitlines(True)
+    return ''.join(''.join(old[item[0]:item[1]]) if isinstance(item, list) else item for item in json.loads(delta_))
+
+
+def latest(blog_ids):
+    """
+    Get the latest revisions of blogs with a single query.
+    :return: Latest revisions by blog ID, blogs without revisions are absent.
+    :rtype dict
+    """
+    last = Revision.objects.filter(blog_id=OuterRef('blog_id')).order_by('-number').values('number')[:1]
+    return {revision.blog_id: revision for revision in Revision.objects.defer('data').filter(
+        blog_id__in=blog_ids, number=Subquery(last))}
+
+
+def text(revision):
+    """
+    Get the content text of a revision. Texts are cached once rebuilt, since revisions never change.
+    :rtype str
+    """
+    key = 'blog:revision:%d' % revision.id
+    result = cache.get(key)
+    if result is None:
+        chain = Revision.objects.filter(blog_id=revision.blog_id, number__gte=revision.base,
+                                        number__lte=revision.number).order_by('number').values_list('data', flat=True)
+        for data in chain:
+            data = zlib.decompress(data).decode()
+            result = data if result is None else patch(result, data)
+        cache.set(key, result, timeout())
+    return result
+
+
+def build(blog, previous):
+    """
+    Build the revision following the previous one (or the first one if it is None) for the current content of a blog.
+    It is a snapshot if the chain of deltas is long enough, or if a delta would not be smaller.
+    :rtype Revision
+    """
+    number = previous.number + 1 if previous is not None else 1
+    data, base = zlib.compress(blog.content_text.encode(), 9), number
+    if previous is not None and number - previous.base < interval():
+        compressed = zlib.compress(delta(text(previous), blog.content_text).encode(), 9)
+        if len(compressed) < len(data):
+            data, base = compressed, previous.base
+    return Revision(blog_id=blog.id, number=number, base=base, created=timezone.now(), content_type=blog.content_type,
+                    digest=rendering.digest(blog.content_type, blog.content_text), length=len(blog.content_text),
+                    data=data)
+
+
+@transaction.atomic
+def record_many(blogs):
+    """
+    Record the current contents of blogs as new revisions, unless they are the same as the latest revisions.
+    :param blogs: Blog objects, which do not have to be saved with their current contents yet.
+    :return: Revisions created, whose IDs are only set if the database returns them (see `bulk_create`).
+    :rtype list
+    """
+    blogs = list(blogs)
+    # Concurrent publishes of a blog are serialized, so that revision numbers never conflict.
+    list(Blog.objects.select_for_update().filter(id__in=[blog.id for blog in blogs]).values_list('id'))
+    previous, created = latest([blog.id for blog in blogs]), []
+    for blog in blogs:
+        revision = previous.get(blog.id)
+        if revision is None or revision.digest != rendering.digest(blog.content_type, blog.content_text):
+            created.append(build(blog, revision))
+    return Revision.objects.bulk_create(created)
+
+
+def record(blog):
+    return record_many([blog])
+
+
+def diff(old, new):
+    """
+    Compare the content texts of two revisions of a blog.
+    :return: The unified diff.
+    :rtype str
+    """
+    def lines(text_):
+        # The last line is compared with a line break as well, so that the diff stays readable.
+        return (text_ + '\n' if text_ and not text_.endswith('\n') else text_).splitlines(True)
+
+    return ''.join(difflib.unified_diff(lines(text(old)), lines(text(new)), 'r%d' % old.number, 'r%d' % new.number))
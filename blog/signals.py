@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from blog import caches, feeds, related, revisions, taxonomy
+from blog.models import Blog
+
+
+@receiver(pre_save, sender=Blog)
+def blog_saving(instance, **_):
+    """
+    Record the content of a blog about to be modified as its first revision, if it was published before revisions were
+    recorded, so that its history starts with the content being overwritten.
+    """
+    if instance.id is not None and not instance.revisions.exists():
+        revisions.record_many(Blog.objects.filter(id=instance.id))
+
+
+@receiver(post_save, sender=Blog)
+def blog_saved(instance, **_):
+    """
+    Record the content of a created or modified blog as a new revision, and synchronize its normalized category and
+    tags, then invalidate caches of all workers. Caches must be invalidated after synchronizing, otherwise other
+    workers may rebuild them with outdated counts, and only once the transaction commits, otherwise they may rebuild
+    them before the changes are visible. Feeds, sitemaps and recommendations affected by the blog are queued to be
+    regenerated by other processes, see `blog.feeds.process` and `blog.related.process`.
+    """
+    revisions.record(instance)
+    taxonomy.sync(instance)
+    feeds.enqueue()
+    transaction.on_commit(caches.invalidate)
+    related.enqueue([instance.id])
+
+
+@receiver(pre_delete, sender=Blog)
+def blog_deleting(instance, **_):
+    taxonomy.detach(instance)
+    related.enqueue_referrers(instance.id)
+
+
+@receiver(post_delete, sender=Blog)
+def blog_deleted(**_):
+    feeds.enqueue()
+    transaction.on_commit(caches.invalidate)
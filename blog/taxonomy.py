@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import Count, F
+
+from blog.models import Blog, Category, Tag
+
+
+def tag_names(content_tags):
+    """
+    Split the comma-joined tags of a blog into a set of tag names, ignoring empty ones and surrounding whitespaces.
+    :rtype set
+    """
+    return {tag.strip() for tag in content_tags.split(',') if tag.strip() != ''}
+
+
+def category_name(publish_path):
+    """
+    Get the major category of a publish path, which is the first part of it after splitting it by slashes.
+    :rtype str
+    """
+    return publish_path.split('/')[0]
+
+
+@transaction.atomic
+def sync(blog):
+    """
+    Bring the normalized category and tags of a blog in line with its publish path and content tags, maintaining the
+    counts of affected categories and tags.
+    :param blog: A saved blog object.
+    """
+    old_tags = {tag.name: tag for tag in blog.tags.all()}
+    new_names = tag_names(blog.content_tags)
+    removed = [tag for name, tag in old_tags.items() if name not in new_names]
+    added = [Tag.objects.get_or_create(name=name)[0] for name in new_names if name not in old_tags]
+    if removed:
+        blog.tags.remove(*removed)
+        Tag.objects.filter(id__in=[tag.id for tag in removed]).update(count=F('count') - 1)
+    if added:
+        blog.tags.add(*added)
+        Tag.objects.filter(id__in=[tag.id for tag in added]).update(count=F('count') + 1)
+    category, _ = Category.objects.get_or_create(name=category_name(blog.publish_path))
+    if blog.category_id != category.id:
+        if blog.category_id is not None:
+            Category.objects.filter(id=blog.category_id).update(count=F('count') - 1)
+        Category.objects.filter(id=category.id).update(count=F('count') + 1)
+        # Update the column only, saving the whole object again would trigger signals recursively.
+        Blog.objects.filter(id=blog.id).update(category=category)
+        blog.category = category
+
+
+def recount(model, ids):
+    """
+    Count blogs of categories or tags from scratch.
+    """
+    objects = list(model.objects.filter(id__in=ids).annotate(total=Count('blogs')))
+    for obj in objects:
+        obj.count = obj.total
+    model.objects.bulk_update(objects, ['count'])
+
+
+@transaction.atomic
+def sync_many(blogs):
+    """
+    Do the same as `sync` for many blogs at once (e.g. imported in bulk), with a constant number of queries. Counts of
+    affected categories and tags are recounted instead of maintained.
+    :param blogs: Saved blog objects.
+    """
+    blogs = list(blogs)
+    through = Blog.tags.through
+    ids = [blog.id for blog in blogs]
+    affected_tags = set(through.objects.filter(blog_id__in=ids).values_list('tag_id', flat=True))
+    affected_categories = {blog.category_id for blog in blogs if blog.category_id is not None}
+    names = {blog.id: tag_names(blog.content_tags) for blog in blogs}
+    Tag.objects.bulk_create([Tag(name=name) for name in set().union(*names.values())], ignore_conflicts=True)
+    tags = dict(Tag.objects.filter(name__in=set().union(*names.values())).values_list('name', 'id'))
+    through.objects.filter(blog_id__in=ids).delete()
+    through.objects.bulk_create([through(blog_id=blog_id, tag_id=tags[name])
+                                 for blog_id, names_ in names.items() for name in names_])
+    Category.objects.bulk_create([Category(name=category_name(blog.publish_path)) for blog in blogs],
+                                 ignore_conflicts=True)
+    categories = dict(Category.objects.filter(name__in={category_name(blog.publish_path) for blog in blogs})
+                      .values_list('name', 'id'))
+    for blog in blogs:
+        blog.category_id = categories[category_name(blog.publish_path)]
+    # Update the column only, saving the whole objects again would trigger signals.
+    Blog.objects.bulk_update(blogs, ['category'])
+    recount(Tag, affected_tags | set(tags.values()))
+    recount(Category, affected_categories | set(categories.values()))
+
+
+@transaction.atomic
+def detach(blog):
+    """
+    Decrease the counts of the category and tags of a blog which is about to be deleted.
+    :param blog: A blog object which is not deleted yet.
+    """
+    Tag.objects.filter(blogs=blog).update(count=F('count') - 1)
+    if blog.category_id is not None:
+        Category.objects.filter(id=blog.category_id).update(count=F('count') - 1)
+
+
+def backfill():
+    """
+    Rebuild normalized categories and tags of all blogs from their publish paths and content tags, then recount
+    everything from scratch.
+    :return: A generator yielding one line of progress for every blog, and a summary at last.
+    """
+    for blog in Blog.objects.all().only('id', 'publish_path', 'content_tags', 'category'):
+        sync(blog)
+        yield 'Synchronized %s\n' % blog.publish_path
+    # Counts are recalculated, in case they were maintained by a buggy version or modified manually.
+    for tag in Tag.objects.all():
+        tag.count = tag.blogs.count()
+        tag.save(update_fields=['count'])
+    for category in Category.objects.all():
+        category.count = category.blogs.count()
+        category.save(update_fields=['count'])
+    yield '\n%d tags and %d categories in use.\n' % (Tag.objects.filter(count__gt=0).count(),
+                                                    Category.objects.filter(count__gt=0).count())
@@ -69,7 +69,8 @@ class BlogTagsNode(template.Node):
         html = ''
         for tag in self.tags.resolve(context):
             html += \
-                f'<a class="badge bg-secondary text-decoration-none" href="{reverse("blog-indices")}?keyword={tag}">' \
+                f'<a class="badge bg-secondary text-decoration-none"' \
+                f'   href="{reverse("blog-tag", kwargs={"name": tag})}">' \
                 f'    {tag}' \
                 f'</a>\n'
         return html
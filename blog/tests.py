@@ -0,0 +1,193 @@
+import io
+import os
+import tempfile
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from blog import archive, caches, feeds, rendering, revisions
+from blog.models import Blog, Document, Regeneration, Views
+from logs.models import Log
+
+# Stamps of the tests never invalidate caches of running workers, and views do not write logs.
+STAMP = os.path.join(tempfile.gettempdir(), 'endportal-blog-tests.stamp')
+
+
+def create_blog(path, tags='', text='# Title\n\nContent.\n'):
+    return Blog.objects.create(publish_path=path, publish_date=date(2020, 1, 1), publish_desc='', content_name=path,
+                               content_type='markdown', content_urls='', content_tags=tags, content_desc='',
+                               content_text=text)
+
+
+@override_settings(BLOG_CACHE_STAMP=STAMP, CACHE_BUS_URL=None, LOGS_INGEST_HITS=True)
+class PageTestCase(TestCase):
+    """
+    Test case requesting blog pages. Caches are invalidated by commits, which never happen in test cases, so they are
+    invalidated explicitly once data is prepared.
+    """
+
+    def invalidate(self):
+        caches.invalidate()
+        cache.clear()
+
+
+class TagTests(PageTestCase):
+    def test_tag_with_slash(self):
+        create_blog('net/tcp', 'TCP/IP, 网络')
+        self.invalidate()
+        for url in ('/blog/', '/blog/net/', '/blog/net/tcp/'):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        url = reverse('blog-tag', kwargs={'name': 'TCP/IP'})
+        self.assertEqual(url, '/blog/tags/TCP/IP/')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/blog/net/tcp/')
+
+
+@override_settings(BLOG_VIEWS_FLUSH_INTERVAL=0)
+class PopularTests(PageTestCase):
+    def test_popular(self):
+        blog = create_blog('net/tcp')
+        self.invalidate()
+        self.client.get('/blog/net/tcp/', HTTP_USER_AGENT='curl/7.68.0')
+        self.assertFalse(Views.objects.exists())
+        response = self.client.get('/blog/net/tcp/', HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertNotContains(response, '热门')
+        # Counters are merged once the response has been sent.
+        self.assertEqual(Views.objects.get(blog=blog).count, 1)
+        # Cached pages show popular articles of their epoch, until the next one.
+        self.assertNotContains(self.client.get('/blog/'), '热门')
+        with mock.patch.object(caches, 'epoch', return_value=caches.epoch() + 1):
+            self.assertContains(self.client.get('/blog/'), '热门')
+
+
+class ArchiveTests(SimpleTestCase):
+    def test_round_trip(self):
+        blog = Blog(publish_path='net/tcp', publish_date=date(2020, 1, 31), publish_desc='', content_name=' 标题',
+                    content_type='markdown', content_tags='TCP/IP,网络', content_desc='第一行\n第二行',
+                    content_urls='名称:::https://example.com/\nRFC:::https://rfc-editor.org/',
+                    content_text='# Title\n\n---\n')
+        fields = archive.loads(archive.dumps(blog), 'other')
+        for field in Blog._meta.fields:
+            if field.name not in ('id', 'category'):
+                self.assertEqual(fields[field.name], getattr(blog, field.name), field.name)
+
+    def test_defaults(self):
+        fields = archive.loads('---\ndate: 2020-01-31\ntags: a, b\n---\nText', 'a/b')
+        self.assertEqual(fields['publish_path'], 'a/b')
+        self.assertEqual(fields['content_type'], 'markdown')
+        self.assertEqual(fields['content_tags'], 'a,b')
+        self.assertEqual(fields['content_name'], '')
+        self.assertEqual(fields['content_text'], 'Text')
+
+    def test_malformed(self):
+        for text in ('date: 2020-01-31\n', '---\ndate: 2020-01-31\n',
+                     # Only lists may have items.
+                     '---\ndate: 2020-01-31\ntitle:\n  - a\n---\n', '---\ndate: 2020-01-31\ntitle:\n---\n',
+                     '---\ndate:\n  - 2020-01-31\n---\n', '---\n  - a\ndate: 2020-01-31\n---\n',
+                     '---\ndate: 2020-01-31\nauthor: a\n---\n', '---\ndate: 2020-01-31\ndate: 2020-02-01\n---\n',
+                     '---\ntitle: a\n---\n', '---\ndate: 2020-01-32\n---\n',
+                     '---\ndate: 2020-01-31\npath: a/../b\n---\n', '---\ndate: 2020-01-31\npath: tags/a\n---\n',
+                     '---\ndate: 2020-01-31\ntitle: "a\n---\n'):
+            with self.assertRaises(ValueError, msg=text):
+                archive.loads(text, 'a')
+
+    def test_render_errors(self):
+        with mock.patch.object(rendering, 'render', side_effect=RuntimeError('broken')):
+            self.assertEqual(archive.render_all([('markdown', 'a'), ('markdown', 'b')], 1),
+                             ['RuntimeError: broken'] * 2)
+
+
+class RevisionTests(PageTestCase):
+    def test_delta(self):
+        texts = ['', 'a\nb\nc\n', 'a\nb\nc', 'a\nx\nc\nd\n', 'd\nc\nb\na\n', 'a\r\nb\r\n', '标题\n\n内容\n',
+                 'a\n\n\n']
+        for base in texts:
+            for text in texts:
+                self.assertEqual(revisions.patch(base, revisions.delta(base, text)), text, (base, text))
+
+    @override_settings(BLOG_REVISION_SNAPSHOT=3)
+    def test_chain(self):
+        cache.clear()
+        lines = ['line %d\n' % i for i in range(100)]
+        blog, texts = create_blog('a', text=''.join(lines)), [''.join(lines)]
+        for i in range(5):
+            lines[i * 10] = 'changed %d\n' % i
+            blog.content_text = ''.join(lines)
+            blog.save()
+            texts.append(blog.content_text)
+        # Saving without changes records nothing.
+        blog.save()
+        history = list(blog.revisions.order_by('number'))
+        self.assertEqual([revision.number for revision in history], [1, 2, 3, 4, 5, 6])
+        self.assertEqual([revision.base for revision in history], [1, 1, 1, 4, 4, 4])
+        cache.clear()
+        self.assertEqual([revisions.text(revision) for revision in history], texts)
+
+
+class FeedTests(PageTestCase):
+    def test_queued(self):
+        create_blog('net/tcp')
+        self.assertEqual(Regeneration.objects.count(), 1)
+        # Nothing is generated until the queue is processed.
+        self.assertEqual(self.client.get('/blog/feed/').status_code, 404)
+        self.assertEqual(feeds.process(), (1, 3))
+        self.assertFalse(Regeneration.objects.exists())
+        self.invalidate()
+        self.assertContains(self.client.get('/blog/feed/'), '/blog/net/tcp/')
+        # Documents which have not changed are not written again.
+        feeds.enqueue()
+        self.assertEqual(feeds.process(), (1, 0))
+
+    @override_settings(BLOG_SITEMAP_SIZE=2)
+    def test_shards(self):
+        for path in ('a', 'b'):
+            create_blog(path)
+        feeds.rebuild()
+        self.assertEqual(set(Document.objects.values_list('name', flat=True)),
+                         {'feed-rss', 'feed-atom', 'sitemap-None'})
+        create_blog('c')
+        self.assertEqual(feeds.rebuild(), 5)
+        self.invalidate()
+        self.assertContains(self.client.get('/sitemap.xml'), '/sitemap-2.xml')
+        self.assertContains(self.client.get('/sitemap-2.xml'), '/blog/c/')
+        self.assertEqual(self.client.get('/sitemap-3.xml').status_code, 404)
+
+
+class PublishTests(PageTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'password'))
+        # Logs live in a database of their own.
+        patcher = mock.patch.object(Log, 'new_log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def publish(self, path, **fields):
+        return self.client.post(reverse('blog-publish'), dict({
+            'publish_path': path, 'publish_date': '2020-01-01', 'publish_desc': '', 'content_name': path,
+            'content_type': 'markdown', 'content_urls': '', 'content_tags': '', 'content_desc': '',
+            'content_text': '# Title\n'}, **fields))
+
+    def test_reserved(self):
+        for path in ('feed', 'feed/rss', 'tags/a', 'publish'):
+            self.assertEqual(self.publish(path).json(), {'error': path + '是保留路径'})
+        self.assertFalse(Blog.objects.exists())
+        self.assertRedirects(self.publish('feeds/rss'), '/blog/feeds/rss/', fetch_redirect_response=False)
+
+    def test_rename_reserved(self):
+        blog, other = create_blog('tags/a'), create_blog('feed')
+        call_command('dedupepaths', stdout=io.StringIO())
+        self.assertEqual(Blog.objects.get(id=blog.id).publish_path, 'tags-%d/a' % blog.id)
+        self.assertEqual(Blog.objects.get(id=other.id).publish_path, 'feed-%d' % other.id)
+
+    def test_concurrent(self):
+        create_blog('a')
+        # Another request publishes at the same path right after the check.
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            self.assertEqual(self.publish('a').json(), {'error': 'a已存在'})
+        self.assertEqual(Blog.objects.count(), 1)
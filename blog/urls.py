@@ -2,8 +2,15 @@ from django.conf.urls import url
 
 from blog import views
 
+# Routes before `blog-content` must start with one of `Blog.RESERVED`, which blogs can not be published at.
 urlpatterns = [
     url(r'^indices/$', views.indices, name='blog-indices'),
     url(r'^publish/$', views.publish, name='blog-publish'),
-    url(r'^(?P<path>([-\w]*/)*)$', views.content, name='blog-content'),
+    url(r'^feed/$', views.feed, name='blog-feed-rss'),
+    url(r'^feed/(?P<kind>rss|atom)/$', views.feed, name='blog-feed'),
+    # Tags may contain slashes (e.g. `TCP/IP`), like the `path` converter.
+    url(r'^tags/(?P<name>.+)/$', views.tag, name='blog-tag'),
+    # A single quantifier followed by a fixed character, so that matching takes linear time even for long and malformed
+    # paths. Nested quantifiers such as `([-\w]*/)*` backtrack exponentially on them.
+    url(r'^(?P<path>(?:[-\w/]*/)?)$', views.content, name='blog-content'),
 ]
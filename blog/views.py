@@ -1,32 +1,20 @@
 import os
-import re
 from urllib.parse import unquote
 
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.forms import model_to_dict
-from django.http import Http404, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render, redirect
-from django.utils.text import slugify
 from django.views.decorators.http import require_GET
-from markdown import Markdown
 
-from blog.models import Blog
-from endportal import utils
+from blog import caches, counters, feeds, related, rendering
+from blog.models import Blog, Tag
+from endportal import pagecache, utils
 from logs.models import Log
 
-markdown = Markdown(
-    extensions=['markdown.extensions.extra', 'markdown.extensions.toc', 'markdown.extensions.codehilite', 'arithmatex'],
-    extension_configs={
-        # Enable line numbers.
-        'markdown.extensions.codehilite': {'linenums': True},
-        # Enable generic mode for katex, disable smart dollar because it breaks inline math.
-        'arithmatex': {'generic': True, 'smart_dollar': False}
-    },
-    # They said that this can help to improve Chinese character issues.
-    slugify=slugify)
-
 
 def get_universal_context(path, sub_dir):
     """
@@ -37,31 +25,14 @@ def get_universal_context(path, sub_dir):
     :return Default context dictionary.
     :rtype dict
     """
-    # We use sets to prevent duplication.
-    categories, tags, subdirectories = set(), set(), set()
-    # We collect major categories and tags first.
-    # A major category is the first part of access path string after splitting it by slashes.
-    for blog in Blog.objects.all().only('publish_path', 'content_tags'):
-        categories.add(blog.publish_path.split('/')[0])
-        for tag in blog.content_tags.split(','):
-            tags.add(tag)
-    # We then collect recent articles.
-    # We do not need all the information of those articles, just access path, publish date and title is enough.
-    # TODO make the number of recent articles configurable.
-    recent = Blog.objects.all().order_by('-publish_date').only('publish_path', 'publish_date', 'content_name')
-    recent = recent[:min(5, len(recent))]
-    recent = [(blog.content_name, blog.publish_date, blog.publish_path) for blog in recent]
+    index, navigation = caches.paths(), caches.navigation()
+    # Major categories come from the path index, while tags and recent articles come from the navigation cache. Neither
+    # of them queries the database unless a blog has been published since they were built.
+    categories, tags, recent, popular = \
+        index.categories, navigation['tags'], navigation['recent'], navigation['popular']
     # We then get subdirectories if the current path is not root, since the subdirectories of root path is identical to
     # major categories.
-    if sub_dir and path != '':
-        for blog in Blog.objects.filter(publish_path__startswith=path):
-            # Ignore the current path.
-            if blog.publish_path == path:
-                continue
-            sub_path = blog.publish_path[len(path) + 1:].split('/')[0]
-            # Ignore articles. We only want directories.
-            if path + '/' + sub_path != blog.publish_path:
-                subdirectories.add(sub_path)
+    subdirectories = set(index.subdirectories(path)) if sub_dir and path != '' else set()
     # The front-end template can not recognize empty sets, so we change them into nones.
     subdirectories = subdirectories or None
     # Parse requested access path. If the path is empty, leave it as an empty string instead.
@@ -69,7 +40,7 @@ def get_universal_context(path, sub_dir):
         href, path = '', path.split('/')
         for i in range(len(path)):
             href, path[i] = href + path[i] + '/', (href + path[i] + '/', path[i])
-    return {'cate': categories, 'tags': tags, 'rect': recent, 'subd': subdirectories, 'path': path}
+    return {'cate': categories, 'tags': tags, 'rect': recent, 'popu': popular, 'subd': subdirectories, 'path': path}
 
 
 def blog_to_dict(blog, process_content=True):
@@ -86,34 +57,15 @@ def blog_to_dict(blog, process_content=True):
         blog['content_urls'] = [tuple(url.strip().split(':::')) for url in blog['content_urls'].split('\n')]
     else:
         blog['content_urls'] = None
-    blog['content_tags'] = blog['content_tags'].split(',')
+    blog['content_tags'] = [tag.strip() for tag in blog['content_tags'].split(',') if tag.strip() != '']
     if not process_content:
         return blog
-    # Now, we should handle content text.
-    # Enumerate every content type that is supported, trigger a 404 error if none of them matches.
-    if blog['content_type'] == 'markdown':
-        blog['content_text'] = markdown.convert(blog['content_text'])
-        # For markdowns, the only thing to do is to generate a menu list.
-        # In order to do this, we collect all <h2> and <h3> fragments and their ids. The <h2> will be the outer layer,
-        # while <h3> will be the inner layer. Too much layers will cause visual inconvenience so we have at most two.
-        # We do not use the official markdown TOC plugin since it can not customize the number of layers we wanted.
-        blog['content_menu'] = []
-        for header in re.finditer(r'<h([23])\s+id="([^"]+)">(.+)</h', blog['content_text']):
-            # Group one is the header type (i.e. <h2> or <h3>), group two and three are the id and title, respectively.
-            pair = (header.group(3), header.group(2))
-            if header.group(1) == '2':
-                blog['content_menu'].append(pair)
-            else:
-                if len(blog['content_menu']) != 0 and blog['content_menu'][-1][0] is None:
-                    # If the last item in the menu is already a list, all we have to do is to append the current <h3> to
-                    # it.
-                    blog['content_menu'][-1][1].append(pair)
-                else:
-                    blog['content_menu'].append((None, [pair]))
-        return blog
-
-    # Unrecognizable content type.
-    raise Http404()
+    # Now, we should handle content text. Trigger a 404 error if the content type is unrecognizable.
+    content = rendering.rendered(blog['content_type'], blog['content_text'])
+    if content is None:
+        raise Http404()
+    blog.update(content)
+    return blog
 
 
 @require_GET
@@ -127,23 +79,42 @@ def content(request, path):
     """
     path = unquote('/'.join(path[:-1].split('/')))  # remove the trailing slash
     # Add log even if the request failed.
-    Log.new_log(request, 'blog', 'access', path)
+    Log.new_hit(request, 'blog', 'access', path)
+    # Views are counted in memory, the path index tells articles apart without querying the database.
+    blog_id = caches.paths().article(path)
+    if blog_id is not None:
+        counters.hit(request, blog_id)
+    # Pages are cached once rendered, they are only rendered again after any blog is changed or popular articles are
+    # refreshed.
+    return pagecache.serve(request, caches.version(), lambda: render_content(request, path))
+
+
+def render_content(request, path):
     context = get_universal_context(path, True)
-    # Assume that there is a matching blog.
-    try:
-        context.update(blog_to_dict(Blog.objects.get(publish_path=path)))
-        return render(request, 'blog-content.html', context)
-    except Blog.DoesNotExist:
-        # If the blog specified by this path does not exists, then check if there are any blogs under this directory. If
-        # yes, display an index page. Otherwise, return 404.
-        query_set = Blog.objects.filter(publish_path__startswith=path).order_by('-publish_date')
-        # Note that empty path (i.e. root) will never raise 404, otherwise there will be no entrance if there are no
-        # blogs online.
-        if len(query_set) == 0 and path != '':
+    # Whether the path is an article, a directory or nothing is decided by the path index, without querying the
+    # database.
+    index = caches.paths()
+    blog_id = index.article(path)
+    if blog_id is not None:
+        try:
+            context.update(blog_to_dict(Blog.objects.get(id=blog_id)))
+            context['rela'] = related.lookup(blog_id)
+            return render(request, 'blog-content.html', context)
+        except Blog.DoesNotExist:
+            # The blog has been deleted after the index was built.
             raise Http404()
-        context['page'], context['plim'], context['pcnt'], context['blog'] = utils.paginate(request, 10, query_set)
-        context['blog'] = [blog_to_dict(blog, False) for blog in context['blog']]
-        return render(request, 'blog-indices.html', context)
+    # If the blog specified by this path does not exists, then check if there are any blogs under this directory. If
+    # yes, display an index page. Otherwise, return 404.
+    # Note that empty path (i.e. root) will never raise 404, otherwise there will be no entrance if there are no blogs
+    # online.
+    if not index.is_directory(path):
+        raise Http404()
+    query_set = Blog.objects.order_by('-publish_date')
+    if path != '':
+        query_set = query_set.filter(publish_path__startswith=path + '/')
+    context['page'], context['plim'], context['pcnt'], context['blog'] = utils.paginate(request, 10, query_set)
+    context['blog'] = [blog_to_dict(blog, False) for blog in context['blog']]
+    return render(request, 'blog-indices.html', context)
 
 
 @require_GET
@@ -153,7 +124,14 @@ def indices(request):
     """
     keyword = unquote(request.GET.get('keyword', ''))
     # Add log in all cases.
-    Log.new_log(request, 'blog', 'search', keyword)
+    Log.new_hit(request, 'blog', 'search', keyword)
+    # Results of keywords are not cached, since every keyword would take an entry of its own.
+    if keyword != '':
+        return render_indices(request, keyword)
+    return pagecache.serve(request, caches.version(), lambda: render_indices(request, keyword))
+
+
+def render_indices(request, keyword):
     # We should disable subdirectories since this is not a real access path.
     context = get_universal_context('', False)
     query_set = Blog.objects \
@@ -166,6 +144,66 @@ def indices(request):
     return render(request, 'blog-indices.html', context)
 
 
+@require_GET
+def tag(request, name):
+    """
+    Tag page: list all blogs with the given tag as an index page.
+    """
+    Log.new_hit(request, 'blog', 'tag', name)
+    return pagecache.serve(request, caches.version(), lambda: render_tag(request, name))
+
+
+def render_tag(request, name):
+    try:
+        tag_ = Tag.objects.get(name=name)
+    except Tag.DoesNotExist:
+        raise Http404()
+    # We should disable subdirectories since this is not a real access path.
+    context = get_universal_context('', False)
+    query_set = tag_.blogs.order_by('-publish_date')
+    context['page'], context['plim'], context['pcnt'], context['blog'] = utils.paginate(request, 10, query_set)
+    context['blog'] = [blog_to_dict(blog, False) for blog in context['blog']]
+    # This parameter is used to fill out the breadcrumb and the title.
+    context['stag'] = name
+    return render(request, 'blog-indices.html', context)
+
+
+def cached_document(request, document, content_type):
+    """
+    Serve a generated document of `blog.feeds` with its entity tag, answering conditional requests with 304.
+    """
+    if document is None:
+        raise Http404()
+    variants, etag = document
+    # Entity tags are weak, since the same one is shared by all precompressed variants, so they are compared weakly.
+    if etag in (tag_.strip().replace('W/', '', 1) for tag_ in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(variants['identity'], content_type=content_type)
+        response.variants = variants
+    response['ETag'] = 'W/' + etag
+    response['Cache-Control'] = 'public, max-age=%d' % getattr(settings, 'BLOG_FEED_MAX_AGE', 600)
+    return response
+
+
+# Feeds and sitemaps are mostly fetched by crawlers, they are not logged so that serving them requires no writes at all.
+@require_GET
+def feed(request, kind='rss'):
+    """
+    Feed of the latest blogs, either RSS or Atom.
+    """
+    content_type = 'application/atom+xml' if kind == 'atom' else 'application/rss+xml'
+    return cached_document(request, feeds.feed(kind), content_type + '; charset=utf-8')
+
+
+@require_GET
+def sitemap(request, shard=None):
+    """
+    Sitemap of all blogs, or one of its shards.
+    """
+    return cached_document(request, feeds.sitemap(shard), 'application/xml; charset=utf-8')
+
+
 def publish(request):
     """
     Publish page: Simply render the publish form if the request method is GET, or actually publishes (create or modify)
@@ -192,14 +230,15 @@ def publish(request):
         return render(request, 'blog-publish.html', context)
 
     if request.method == 'POST':
+        # Blogs are read from the default database, since the replica may not have the latest changes yet.
         if 'id' in request.POST:
             try:
-                blog = Blog.objects.get(id=int(request.POST.get('id')))
+                blog = Blog.objects.using('default').get(id=int(request.POST.get('id')))
             except Blog.DoesNotExist or ValueError:
                 raise Http404()
         else:
-            # This is required because django refuses to create a new blog object with empty publish date.
-            blog = Blog.objects.create(publish_date=request.POST.get('publish_date'))
+            # The new blog is saved only after all fields are filled, since publish paths must be unique.
+            blog = Blog()
         # Handle static resources first.
         # Validate the uploaded files first, if any of them is invalid, the whole publish request will not be handled.
         for image in request.FILES.getlist('static_files'):
@@ -215,9 +254,18 @@ def publish(request):
         # Iterate through all fields and update them. It is guaranteed that the POST parameters' name is the same as
         # database columns.
         for field in Blog._meta.fields:
-            if field.name != 'id':
+            if field.name not in ('id', 'category'):
                 blog.__setattr__(field.name, request.POST.get(field.name, ''))
-        blog.save()
+        if Blog.reserved(blog.publish_path):
+            return JsonResponse({'error': blog.publish_path + '是保留路径'})
+        if Blog.objects.using('default').filter(publish_path=blog.publish_path).exclude(id=blog.id).exists():
+            return JsonResponse({'error': blog.publish_path + '已存在'})
+        # Another request may publish at the same path right after the check, which the unique constraint rejects.
+        try:
+            with transaction.atomic():
+                blog.save()
+        except IntegrityError:
+            return JsonResponse({'error': blog.publish_path + '已存在'})
         # Since publishing blogs require certain privileges, we only log if a publish succeeded.
         Log.new_log(request, 'blog', 'publish', str(blog.id))
         return redirect('blog-content', path=blog.publish_path + '/')  # the trailing slash is vital
@@ -0,0 +1,278 @@
+import base64
+import hashlib
+import json
+import os
+import posixpath
+import re
+from urllib.request import urlopen
+
+from django.conf import settings
+
+from endportal import staticfiles
+
+# Third party libraries, which used to be loaded from jsDelivr, with their subresource integrity hashes. Vendored
+# copies are verified against these hashes. Libraries are stored under `vendor/` with the same layout as the CDN, so
+# that relative URLs in stylesheets (e.g. fonts of KaTeX) still resolve.
+CDN = 'https://cdn.jsdelivr.net/npm/'
+LIBRARIES = {
+    'bootstrap.css': ('bootstrap@5.0.0-alpha1/dist/css/bootstrap.min.css',
+                      'sha256-IdfIcUlaMBNtk4Hjt0Y6WMMZyMU0P9PN/pH+DFzKxbI='),
+    'markdown.css': ('github-markdown-css@4.0.0/github-markdown.min.css', None),
+    'fileinput.css': ('bootstrap-fileinput@5.1.2/css/fileinput.min.css',
+                      'sha256-lSTPYy8G5/BZ5CnHF5YxUqnq0jJ37x5Vvu1NGFDkZV4='),
+    'katex.css': ('katex@0.12.0/dist/katex.min.css', 'sha256-tn6hZ2YGDv0w1/DaFL4MiUoXuAVclrtFZs13ch3TB9M='),
+    'animate.css': ('animate.css@4.1.0/animate.min.css', 'sha256-6hqHMqXTVEds1R8HgKisLm3l/doneQs+rS1a5NLmwwo='),
+    'jquery.js': ('jquery@2.2.4/dist/jquery.min.js', 'sha256-BbhdlvQf/xTY9gja0Dq3HiwQF8LaCRTXxZKRutelT44='),
+    'bootstrap.js': ('bootstrap@5.0.0-alpha1/dist/js/bootstrap.min.js',
+                     'sha256-u+Q/eQIe6P5wU4K8maihJOQkhqBbf7K1NN68GwTpNz0='),
+    'katex.js': ('katex@0.12.0/dist/katex.min.js', 'sha256-1qhJwAgsSPVSSjlQVTewHS49eaoAbOz651dveUANVBI='),
+    'auto-render.js': ('katex@0.12.0/dist/contrib/auto-render.min.js',
+                       'sha256-oEuQVLwO5Ii6subChtLbrY5gx7NDRU+UJJ9jvvau+FI='),
+}
+# Bundles of every page type. Items are either names of libraries or paths of static files. Critical CSS of a bundle
+# is extracted for the classes used by its templates.
+BUNDLES = {
+    'reader': {
+        'css': ['bootstrap.css', 'markdown.css', 'katex.css', 'animate.css', 'css/blog.css'],
+        'js': ['jquery.js', 'bootstrap.js', 'katex.js', 'auto-render.js', 'js/animations.min.js'],
+        'templates': ['blog.html', 'blog-content.html', 'blog-indices.html'],
+    },
+    # Additional assets of the publish page, on top of the reader bundle.
+    'editor': {
+        'css': ['fileinput.css'],
+        'js': ['js/publish.min.js'],
+        'templates': [],
+    },
+}
+MANIFEST = 'bundles.json'
+# Root of the project, where apps live.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RE_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+RE_BLANKS = re.compile(r'\s+')
+RE_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+RE_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+RE_CLASS_ATTR = re.compile(r'class="([^"]*)"')
+RE_SELECTOR_CLASS = re.compile(r'\.(-?[_a-zA-Z][-\w]*)')
+
+
+def enabled():
+    """
+    Check whether pages load the local bundles, configured by `ASSETS_BUNDLED` (default false). Bundles must have been
+    built by `build` before enabling it, otherwise pages load the CDN instead.
+    :rtype bool
+    """
+    return getattr(settings, 'ASSETS_BUNDLED', False)
+
+
+def vendor_dir():
+    """
+    Get the directory where libraries are vendored, configured by `ASSETS_VENDOR_DIR` (default to the static directory
+    of `_pub`, so that static file finders pick them up).
+    :rtype str
+    """
+    return getattr(settings, 'ASSETS_VENDOR_DIR', os.path.join(BASE_DIR, '_pub', 'static'))
+
+
+def static_path(item):
+    """
+    Get the path of a bundle item relative to the static root.
+    :rtype str
+    """
+    return posixpath.join('vendor', LIBRARIES[item][0]) if item in LIBRARIES else item
+
+
+def cdn_url(item):
+    return (CDN + LIBRARIES[item][0], LIBRARIES[item][1]) if item in LIBRARIES else (None, None)
+
+
+def integrity(data):
+    return 'sha256-' + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+def vendor(force=False):
+    """
+    Download all libraries from the CDN into the vendor directory, verifying their integrity. Relative URLs referenced
+    by stylesheets are downloaded as well.
+    :param force: Whether to download files which already exist.
+    :return: A generator yielding one line for every downloaded file, and a summary at last.
+    """
+    pending, done, downloaded = [library for library, _ in LIBRARIES.values()], set(), 0
+    hashes = {library: digest for library, digest in LIBRARIES.values()}
+    while pending:
+        path = pending.pop()
+        if path in done:
+            continue
+        done.add(path)
+        target = os.path.join(vendor_dir(), 'vendor', *path.split('/'))
+        if force or not os.path.exists(target):
+            with urlopen(CDN + path, timeout=30) as response:
+                data = response.read()
+            if hashes.get(path) is not None and integrity(data) != hashes[path]:
+                raise ValueError('Integrity check failed for %s.' % path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            downloaded += 1
+            yield 'Downloaded %s\n' % path
+        if path.endswith('.css'):
+            with open(target, encoding='utf-8') as f:
+                for _, url in RE_URL.findall(f.read()):
+                    if not url.startswith(('data:', 'http:', 'https:', '/', '#')):
+                        url = re.split(r'[?#]', url)[0]
+                        pending.append(posixpath.normpath(posixpath.join(posixpath.dirname(path), url)))
+    yield '\n%d files downloaded into %s, %d up to date.\n' % (downloaded, vendor_dir(), len(done) - downloaded)
+
+
+def minify_css(css):
+    css = RE_COMMENT.sub('', css)
+    css = RE_BLANKS.sub(' ', css)
+    return RE_PUNCTUATION.sub(r'\1', css).replace(';}', '}').strip()
+
+
+def rebase(css, path):
+    """
+    Turn relative URLs of a stylesheet into absolute ones, so that it still works after being bundled or inlined.
+    :param css: Content of the stylesheet.
+    :param path: Path of the stylesheet relative to the static root.
+    :rtype str
+    """
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+        return 'url(%s)' % (settings.STATIC_URL + posixpath.normpath(posixpath.join(posixpath.dirname(path), url)))
+
+    return RE_URL.sub(replace, css)
+
+
+def split_rules(css):
+    """
+    Split minified CSS into top-level blocks, each one is a pair of its prelude (selectors or at-rule) and its body.
+    Statements without bodies (e.g. `@charset`) are dropped.
+    :rtype list
+    """
+    blocks, depth, start, prelude = [], 0, 0, None
+    for i, char in enumerate(css):
+        if char == '{':
+            if depth == 0:
+                prelude, start = css[start:i].strip(), i + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                blocks.append((prelude, css[start:i]))
+                start = i + 1
+        elif char == ';' and depth == 0:
+            start = i + 1
+    return blocks
+
+
+def split_selectors(prelude):
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(prelude):
+        depth += char == '('
+        depth -= char == ')'
+        if char == ',' and depth == 0:
+            selectors.append(prelude[start:i])
+            start = i + 1
+    selectors.append(prelude[start:])
+    return selectors
+
+
+def critical(css, classes):
+    """
+    Extract the critical CSS needed for the first paint: rules whose selectors only use classes appearing in the
+    templates of the page, including rules without classes at all (e.g. the reboot of bootstrap). Fonts and animations
+    are not critical. Rules in `@media` and `@supports` are filtered recursively.
+    :param css: Minified CSS.
+    :param classes: Set of classes used by the page.
+    :rtype str
+    """
+    output = []
+    for prelude, body in split_rules(css):
+        if prelude.startswith(('@media', '@supports')):
+            inner = critical(body, classes)
+            if inner:
+                output.append('%s{%s}' % (prelude, inner))
+        elif not prelude.startswith('@'):
+            selectors = [selector for selector in split_selectors(prelude)
+                         if set(RE_SELECTOR_CLASS.findall(selector)) <= classes]
+            if selectors:
+                output.append('%s{%s}' % (','.join(selectors), body))
+    return ''.join(output)
+
+
+def used_classes(templates):
+    """
+    Collect classes used by the given templates, and by component tags which generate HTML in python.
+    :rtype set
+    """
+    from django.template.loader import get_template
+    sources = [get_template(name).template.source for name in templates]
+    for app in ('_pub', 'blog'):
+        directory = os.path.join(BASE_DIR, app, 'templatetags')
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if name.endswith('.py'):
+                with open(os.path.join(directory, name), encoding='utf-8') as f:
+                    sources.append(f.read())
+    return {name for source in sources for value in RE_CLASS_ATTR.findall(source) for name in value.split()
+            if '{' not in name and '%' not in name}
+
+
+def build(precompress=False):
+    """
+    Build fingerprinted bundles of all page types from collected static files, and write a manifest for the `assets`
+    template tag. Fingerprinted names never change content, so they can be served with `Cache-Control: immutable`.
+    Stylesheets are minified, scripts are only concatenated since all of them are minified already.
+    :param precompress: Whether to generate precompressed siblings of bundles.
+    :return: A generator yielding one line for every bundle, and a summary at last.
+    """
+    root = settings.STATIC_ROOT
+    manifest = {}
+    for name, bundle in BUNDLES.items():
+        entry = {}
+        for kind in ('css', 'js'):
+            parts = []
+            for item in bundle[kind]:
+                path = static_path(item)
+                with open(os.path.join(root, *path.split('/')), encoding='utf-8') as f:
+                    content = f.read()
+                parts.append(minify_css(rebase(content, path)) if kind == 'css' else content.rstrip().rstrip(';'))
+            content = ('\n' if kind == 'css' else ';\n').join(parts)
+            data = content.encode()
+            path = staticfiles.hashed_name(posixpath.join('bundles', name + '.' + kind), hashlib.md5(data).hexdigest())
+            os.makedirs(os.path.join(root, 'bundles'), exist_ok=True)
+            with open(os.path.join(root, *path.split('/')), 'wb') as f:
+                f.write(data)
+            if precompress:
+                staticfiles.compress(os.path.join(root, *path.split('/')))
+            entry[kind] = path
+            if kind == 'css' and bundle['templates']:
+                entry['critical'] = critical(content, used_classes(bundle['templates']))
+            yield 'Bundled %s (%d bytes)\n' % (path, len(data))
+        manifest[name] = entry
+    with open(os.path.join(root, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    yield '\n%d bundles built.\n' % len(manifest)
+
+
+_manifest = (None, {})
+
+
+def bundles():
+    """
+    Get the manifest of bundles, reloaded whenever it is modified.
+    :return: A dictionary from page types to their bundles, empty if bundles have never been built.
+    :rtype dict
+    """
+    global _manifest
+    path = os.path.join(settings.STATIC_ROOT, MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    if _manifest[0] != mtime:
+        with open(path) as f:
+            _manifest = (mtime, json.load(f))
+    return _manifest[1]
@@ -0,0 +1,119 @@
+import copy
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from endportal import bus, metrics
+
+# Upper bound of users cached by every process, the caches are simply cleared once it is reached.
+MAX_USERS = 1024
+
+_users, _permissions = {}, {}
+
+
+def stamp_path():
+    """
+    Get the path of the stamp file, whose modification time is the time users and permissions were last changed. It
+    works the same way as the stamp of blog data (see `blog.caches`), so that caches of all workers are invalidated at
+    once.
+    :rtype str
+    """
+    return getattr(settings, 'AUTH_CACHE_STAMP', os.path.join(tempfile.gettempdir(), 'endportal-auth.stamp'))
+
+
+def changed():
+    try:
+        return os.stat(stamp_path()).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def generation():
+    """
+    Get the current generation of users and permissions, the version of the invalidation bus if it is configured,
+    otherwise the time of the last change, the same way as `blog.caches.generation`.
+    :rtype int
+    """
+    version = bus.version('auth')
+    return version if version is not None else changed()
+
+
+def invalidate(broadcast=True):
+    """
+    Start a new generation of users and permissions, invalidating caches of all workers, and those of other nodes
+    through the invalidation bus.
+    """
+    now = max(time.time_ns(), changed() + 1)
+    with open(stamp_path(), 'a'):
+        os.utime(stamp_path(), ns=(now, now))
+    if broadcast:
+        bus.publish('auth')
+
+
+def cached(name, store, key, build):
+    current = generation()
+    entry = store.get(key)
+    if entry is not None and entry[0] == current:
+        metrics.count('cache_hit', name)
+        return entry[1]
+    metrics.count('cache_miss', name)
+    value = build()
+    if len(store) >= MAX_USERS:
+        store.clear()
+    store[key] = (current, value)
+    return value
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Model backend caching users and their permissions in every process, so that authenticated requests (e.g. every
+    command submitted to the web commandline, which checks permissions of commands) do not query them again and again.
+    Caches are invalidated whenever any user, group or permission changes, which is rare.
+    Enable it by setting `AUTHENTICATION_BACKENDS` to `['endportal.auth.CachedModelBackend']`. Sessions are cached by
+    setting `SESSION_ENGINE` to `django.contrib.sessions.backends.cached_db`, which reads the database only if a
+    session is not in the cache.
+    """
+
+    def get_user(self, user_id):
+        user = cached('auth_users', _users, user_id, lambda: super(CachedModelBackend, self).get_user(user_id))
+        # Every request gets a copy, since attributes (e.g. the permission cache of `ModelBackend`) are set on users.
+        return copy.copy(user) if user is not None else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = cached('auth_permissions', _permissions, user_obj.pk, lambda: frozenset(
+                super(CachedModelBackend, self).get_all_permissions(user_obj)))
+        return user_obj._perm_cache
+
+
+def model_changed(update_fields=None, **_):
+    """
+    Invalidate caches once the current transaction commits, otherwise workers may rebuild them before the changes are
+    visible. Connected to changes of users, groups, permissions and their relations. Logging in only saves the time of
+    the last login, which is not worth invalidating caches of all workers on all nodes for.
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(invalidate)
+
+
+def relations_changed(action, **_):
+    # Relations are changed after `pre_*` actions, and `post_*` actions are always sent as well.
+    if action.startswith('post_'):
+        model_changed()
+
+
+bus.register('auth', lambda: invalidate(broadcast=False))
+for sender in (User, Group, Permission):
+    post_save.connect(model_changed, sender=sender, dispatch_uid='auth-invalidate-save-' + sender.__name__)
+    post_delete.connect(model_changed, sender=sender, dispatch_uid='auth-invalidate-delete-' + sender.__name__)
+for sender in (User.groups.through, User.user_permissions.through, Group.permissions.through):
+    m2m_changed.connect(relations_changed, sender=sender, dispatch_uid='auth-invalidate-m2m-' + sender.__name__)
@@ -0,0 +1,238 @@
+import fcntl
+import json
+import logging
+import os
+import time
+from threading import Lock, Thread
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import transaction
+
+# Redis is only required by the Redis transport.
+try:
+    import redis
+except ModuleNotFoundError:
+    redis = None
+
+# Prefix of keys and channels in Redis.
+PREFIX = 'endportal:bus:'
+# Errors of transports, which never fail requests: caches fall back to stamp files of this node meanwhile.
+ERRORS = (OSError, ValueError) + ((redis.RedisError,) if redis is not None else ())
+
+logger = logging.getLogger(__name__)
+
+# Functions invalidating caches of this process, by channel.
+_listeners = {}
+# The latest version of every channel applied by this process.
+_seen = {}
+_lock = Lock()
+_transport, _pid = None, None
+
+
+def url():
+    """
+    Get the URL of the invalidation bus, configured by `CACHE_BUS_URL`, either `redis://host:port/db` for multiple
+    nodes or `file:///path/to/directory` for a single node (e.g. testing). Default to None, in which case caches are
+    only invalidated on the node where data is changed, since stamp files are shared by workers of a node only.
+    :rtype str | None
+    """
+    return getattr(settings, 'CACHE_BUS_URL', None)
+
+
+def register(channel, listener):
+    """
+    Register the function invalidating caches of this process, which is called whenever another process publishes a
+    newer version of the channel. It must not publish again.
+    """
+    _listeners[channel] = listener
+
+
+def receive(channel, version):
+    """
+    Apply a version of a channel published by a process. Versions are increasing numbers assigned by the transport, so
+    that late or duplicated messages (with versions not newer than what has been applied) are ignored, and never
+    invalidate caches which have been rebuilt since.
+    """
+    with _lock:
+        if version <= _seen.get(channel, 0):
+            return
+        _seen[channel] = version
+    listener = _listeners.get(channel)
+    if listener is not None:
+        listener()
+
+
+def connect():
+    """
+    Connect this process to the bus if it is configured, and start listening in a background thread. This is cheap
+    once connected, and connects again in forked processes, which do not inherit threads. If the transport fails, the
+    error is logged and the next call tries to connect again.
+    :return: The transport, or None if the bus is not configured or not connected.
+    :rtype FileTransport | RedisTransport | None
+    """
+    global _transport, _pid
+    if url() is None:
+        return None
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                parsed = urlparse(url())
+                try:
+                    transport = {'file': FileTransport, 'redis': RedisTransport}[parsed.scheme](url())
+                    # Versions published before this process connected have nothing to invalidate.
+                    versions = transport.versions(list(_listeners))
+                except ERRORS:
+                    logger.exception('Failed to connect to the invalidation bus.')
+                    return None
+                _seen.update(versions)
+                _transport = transport
+                Thread(target=_transport.listen, args=(receive,), daemon=True).start()
+                _pid = os.getpid()
+    return _transport
+
+
+def version(channel):
+    """
+    Get the latest version of a channel applied by this process, which is the same on all nodes once they have applied
+    the same messages, so that it can key entries of caches shared by nodes.
+    :return: The version, or None if the bus is not configured or not connected, in which case caches are keyed by
+             stamp files of this node instead.
+    :rtype int | None
+    """
+    if connect() is None:
+        return None
+    return _seen.get(channel, 0)
+
+
+def publish(channel):
+    """
+    Tell all other processes (on all nodes) to invalidate caches of a channel. Caches of this process must have been
+    invalidated already. The message is only sent once the current transaction (if any) commits, otherwise other
+    processes may rebuild their caches before the changes are visible to them.
+    """
+    if url() is not None:
+        transaction.on_commit(lambda: send(channel))
+
+
+def send(channel):
+    # Runs after the transaction has committed, so failing would only fail the request which changed data.
+    transport = connect()
+    if transport is None:
+        return
+    try:
+        version_ = transport.publish(channel)
+    except ERRORS:
+        logger.exception('Failed to publish an invalidation of %s.', channel)
+        return
+    with _lock:
+        _seen[channel] = max(_seen.get(channel, 0), version_)
+
+
+class FileTransport:
+    """
+    Transport through files in a directory: versions of channels are stored in `versions.json`, and messages are
+    appended to `events` under an exclusive lock, which every process polls. Once `events` grows beyond `MAX_EVENTS`,
+    it is replaced by a new file, and processes catch up with `versions.json` as if they had reconnected. It only works
+    for processes sharing the directory, such as workers of a single node, and is meant for testing.
+    """
+    # Seconds between polls of new messages.
+    INTERVAL = 0.5
+    # Bytes of messages after which the file of messages is replaced.
+    MAX_EVENTS = 1 << 20
+
+    def __init__(self, url_):
+        self.directory = urlparse(url_).path
+        os.makedirs(self.directory, exist_ok=True)
+        self.versions_path = os.path.join(self.directory, 'versions.json')
+        self.events_path = os.path.join(self.directory, 'events')
+        open(self.events_path, 'a').close()
+        stat = os.stat(self.events_path)
+        self.inode, self.offset = stat.st_ino, stat.st_size
+
+    def versions(self, channels):
+        try:
+            with open(self.versions_path) as f:
+                versions = json.load(f)
+        except (OSError, ValueError):
+            versions = {}
+        return {channel: versions.get(channel, 0) for channel in channels}
+
+    def publish(self, channel):
+        with open(self.versions_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            versions = json.loads(f.read() or '{}')
+            versions[channel] = version = versions.get(channel, 0) + 1
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(versions))
+            f.flush()
+            line = '%s %d\n' % (channel, version)
+            if os.path.getsize(self.events_path) < self.MAX_EVENTS:
+                with open(self.events_path, 'a') as events:
+                    events.write(line)
+            else:
+                # Publishers hold the lock, so the file is never replaced while another one appends to it.
+                with open(self.events_path + '.new', 'w') as events:
+                    events.write(line)
+                os.replace(self.events_path + '.new', self.events_path)
+        return version
+
+    def listen(self, receive_):
+        while True:
+            time.sleep(self.INTERVAL)
+            with open(self.events_path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self.inode:
+                    # Messages appended to the replaced file since the last poll are lost, versions catch up with them.
+                    self.inode, self.offset = stat.st_ino, 0
+                    for channel, version in self.versions(list(_listeners)).items():
+                        receive_(channel, version)
+                if stat.st_size <= self.offset:
+                    continue
+                f.seek(self.offset)
+                data = f.read()
+            # Only complete lines are consumed.
+            data = data[:data.rfind(b'\n') + 1]
+            self.offset += len(data)
+            for line in data.decode().splitlines():
+                channel, version = line.split()
+                receive_(channel, int(version))
+
+
+class RedisTransport:
+    """
+    Transport through Redis: versions of channels are counters incremented atomically, and messages are published to
+    a pub/sub channel. Messages published while a process is disconnected are lost, so counters are compared after
+    every reconnection to catch up.
+    """
+    # Seconds to wait before reconnecting.
+    RETRY = 1
+
+    def __init__(self, url_):
+        if redis is None:
+            raise ImportError('The redis package is required by the Redis transport of the invalidation bus.')
+        self.client = redis.Redis.from_url(url_)
+
+    def versions(self, channels):
+        values = self.client.mget([PREFIX + channel for channel in channels]) if channels else []
+        return {channel: int(value or 0) for channel, value in zip(channels, values)}
+
+    def publish(self, channel):
+        version = self.client.incr(PREFIX + channel)
+        self.client.publish(PREFIX + 'events', '%s %d' % (channel, version))
+        return version
+
+    def listen(self, receive_):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(PREFIX + 'events')
+                for channel, version in self.versions(list(_listeners)).items():
+                    receive_(channel, version)
+                for message in pubsub.listen():
+                    channel, version = message['data'].decode().split()
+                    receive_(channel, int(version))
+            except redis.RedisError:
+                time.sleep(self.RETRY)
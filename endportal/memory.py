@@ -0,0 +1,172 @@
+import linecache
+import os
+import signal
+import time
+import tracemalloc
+from threading import local
+
+from django.conf import settings
+from django.core.signals import request_finished
+
+# UWSGI is only provided in production environment, workers are never recycled without it.
+try:
+    import uwsgi
+except ModuleNotFoundError:
+    uwsgi = None
+
+# Peak allocations of requests of this process, by view: number of requests, sum and maximum of peaks in bytes. Only
+# recorded while tracemalloc is tracing, and on Python 3.9 or later where peaks can be reset.
+_peaks = {}
+PEAKS = hasattr(tracemalloc, 'reset_peak')
+_local = local()
+_checked = 0.0
+# The snapshot `diff` compares with.
+_baseline = None
+
+
+def budget():
+    """
+    Get the resident memory a worker may use in megabytes, configured by `MEMORY_BUDGET_MB`. A worker using more is
+    recycled gracefully after the request it is serving. Default to None, never recycling.
+    :rtype int | None
+    """
+    return getattr(settings, 'MEMORY_BUDGET_MB', None)
+
+
+def rss():
+    """
+    Get the resident memory of the current process in bytes. Falls back to the peak of it on systems without `/proc`.
+    :rtype int
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def begin():
+    if PEAKS and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        _local.start = tracemalloc.get_traced_memory()[0]
+
+
+def end(view):
+    """
+    Record the peak allocation of a finished request, since `begin`. With threads, allocations of concurrent requests
+    are included as well.
+    """
+    start = getattr(_local, 'start', None)
+    _local.start = None
+    if start is None or not tracemalloc.is_tracing():
+        return
+    # Memory held before the request is not allocated by it.
+    peak = max(tracemalloc.get_traced_memory()[1] - start, 0)
+    stat = _peaks.setdefault(view, [0, 0, 0])
+    stat[0], stat[1], stat[2] = stat[0] + 1, stat[1] + peak, max(stat[2], peak)
+
+
+def snapshot():
+    """
+    Get a serializable snapshot of the memory of the current process, published along with metrics.
+    :rtype dict
+    """
+    return {'rss': rss(), 'tracing': tracemalloc.is_tracing(), 'peaks': _peaks}
+
+
+def summary(snapshots, limit=10):
+    """
+    Summarize memory of workers, for displaying on the index page.
+    :param snapshots: Snapshots of metrics of living workers, see `endportal.metrics.snapshots`.
+    :param limit: Number of views listed.
+    :return: Resident memory of every worker, the budget, and views with the largest peak allocations.
+    :rtype dict
+    """
+    workers, peaks = [], {}
+    for data in snapshots:
+        memory = data.get('memory')
+        if memory is None:
+            continue
+        workers.append({'pid': data['pid'], 'rss': memory['rss'] / 1048576, 'tracing': memory['tracing']})
+        for view, (count, total, peak) in memory['peaks'].items():
+            merged = peaks.setdefault(view, [0, 0, 0])
+            merged[0], merged[1], merged[2] = merged[0] + count, merged[1] + total, max(merged[2], peak)
+    return {
+        'budget': budget(),
+        'workers': sorted(workers, key=lambda item: item['pid']),
+        'peaks': [{'view': view, 'count': count, 'mean': total / count / 1024, 'max': peak / 1024}
+                  for view, (count, total, peak) in sorted(peaks.items(), key=lambda item: -item[1][2])[:limit]],
+    }
+
+
+def check(**_):
+    """
+    Recycle the current worker gracefully if it uses more memory than the budget. Connected to `request_finished`, and
+    checks at most once in `MEMORY_CHECK_INTERVAL` seconds (default ten). UWSGI workers finish the current request on
+    `SIGHUP` before exiting, and the master spawns a new one.
+    """
+    global _checked
+    if budget() is None or uwsgi is None:
+        return
+    if time.monotonic() - _checked < getattr(settings, 'MEMORY_CHECK_INTERVAL', 10):
+        return
+    _checked = time.monotonic()
+    if rss() > budget() * 1048576:
+        os.kill(os.getpid(), signal.SIGHUP)
+
+
+def take():
+    # Allocations of tracemalloc itself are not interesting.
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def start(frames):
+    global _baseline
+    tracemalloc.start(frames)
+    _baseline = take()
+
+
+def stop():
+    global _baseline
+    tracemalloc.stop()
+    _peaks.clear()
+    _baseline = None
+
+
+def format_statistics(statistics, limit):
+    lines = ['%10s %8s  %s' % ('size', 'count', 'location')]
+    for stat in statistics[:limit]:
+        frame = stat.traceback[0]
+        lines.append('%8.1fKB %8d  %s:%d %s' % (
+            getattr(stat, 'size_diff', stat.size) / 1024, getattr(stat, 'count_diff', stat.count), frame.filename,
+            frame.lineno, linecache.getline(frame.filename, frame.lineno).strip()))
+    return '\n'.join(lines)
+
+
+def top(limit):
+    """
+    Format the source lines holding the most memory allocated since tracing started.
+    :rtype str
+    """
+    return format_statistics(take().statistics('lineno'), limit)
+
+
+def diff(limit):
+    """
+    Format the source lines whose memory grew the most since the last diff (or since tracing started), which is where
+    memory accumulates.
+    :rtype str
+    """
+    global _baseline
+    current = take()
+    if _baseline is None:
+        # Tracing was started by `PYTHONTRACEMALLOC`, there is nothing to compare with yet.
+        _baseline = current
+        return 'No earlier snapshot, diff again later.'
+    statistics = current.compare_to(_baseline, 'lineno')
+    _baseline = current
+    return format_statistics(statistics, limit)
+
+
+request_finished.connect(check, dispatch_uid='memory-check')
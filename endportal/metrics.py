@@ -0,0 +1,309 @@
+import bisect
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from endportal import memory
+
+# Upper bounds of histogram buckets, in milliseconds. Anything slower than the last bound falls into an implicit
+# overflow bucket.
+BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Per-process state. Histograms and counters are plain lists and integers, updated without any locking: uwsgi workers
+# are single-threaded by default, and with threads enabled the GIL makes a lost increment rare enough not to matter for
+# statistics like these.
+# A histogram is stored as `[bucket_0, ..., bucket_n, overflow, sum, count]`.
+_histograms = {}
+_counters = {}
+_recent = deque(maxlen=256)
+_last_flush = 0.0
+
+
+def enabled():
+    """
+    Check whether instrumentation is turned on. Controlled by the `METRICS_ENABLED` setting, default to be off.
+    :rtype bool
+    """
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+def metrics_dir():
+    """
+    Get the directory where workers publish their snapshots. Defaults to a directory in `/dev/shm` (which is backed by
+    shared memory) if available, or in the system temporary directory otherwise.
+    :rtype str
+    """
+    default = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return getattr(settings, 'METRICS_DIR', os.path.join(default, 'endportal-metrics'))
+
+
+def observe(metric, label, value):
+    """
+    Record a single observation into a histogram.
+    :param metric: Name of the metric, such as `view` or `template`.
+    :param label: Label distinguishing different series of the same metric, such as the view name.
+    :param value: Observed value, in milliseconds.
+    """
+    key = (metric, label)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = [0] * (len(BUCKETS) + 3)
+    histogram[bisect.bisect_left(BUCKETS, value)] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def count(name, label='', value=1):
+    """
+    Increase a counter. Counters are always maintained, even if instrumentation is disabled, since they are cheap and
+    some of them (e.g. cache hits) are interesting on their own.
+    :param name: Name of the counter.
+    :param label: Label distinguishing different series of the same counter.
+    :param value: Increment.
+    """
+    key = (name, label)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+class Timer:
+    """
+    Context manager measuring the wall time of its body and recording it into a histogram.
+    """
+
+    def __init__(self, metric, label):
+        self.metric, self.label, self.start = metric, label, 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        observe(self.metric, self.label, (time.perf_counter() - self.start) * 1000)
+
+
+def timer(metric, label=''):
+    """
+    Get a context manager timing its body into the given histogram, or a no-op one if instrumentation is disabled.
+    :rtype Timer | nullcontext
+    """
+    return Timer(metric, label) if enabled() else nullcontext()
+
+
+class QueryCounter:
+    """
+    Database execution wrapper counting queries and the time spent on them.
+    """
+
+    def __init__(self):
+        self.count, self.time = 0, 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += (time.perf_counter() - start) * 1000
+
+
+def record_request(view, path, elapsed, queries):
+    """
+    Record a finished request: its wall time, database time and query count. Also remember it as a recent request.
+    :param view: Name of the view (i.e. url name).
+    :param path: Requested path.
+    :param elapsed: Wall time, in milliseconds.
+    :param queries: Query counter used while processing the request.
+    """
+    observe('view', view, elapsed)
+    observe('db', view, queries.time)
+    count('queries', view, queries.count)
+    _recent.append({'view': view, 'path': path, 'time': round(elapsed, 3), 'db_time': round(queries.time, 3),
+                    'queries': queries.count, 'at': time.time(), 'pid': os.getpid()})
+    flush()
+
+
+def instrument_templates():
+    """
+    Wrap the rendering method of django templates so that rendering time of every template is recorded. This is done
+    only once, and only if instrumentation is enabled, so that there is no overhead otherwise.
+    """
+    from django.template.backends.django import Template
+    if getattr(Template.render, 'instrumented', False):
+        return
+    render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        with timer('template', self.origin.template_name):
+            return render(self, context, request)
+
+    timed_render.instrumented = True
+    Template.render = timed_render
+
+
+def snapshot():
+    """
+    Get a serializable snapshot of the metrics of the current process.
+    :rtype dict
+    """
+    return {
+        'pid': os.getpid(),
+        'histograms': [[metric, label, values] for (metric, label), values in _histograms.items()],
+        'counters': [[name, label, value] for (name, label), value in _counters.items()],
+        'recent': list(_recent),
+        'memory': memory.snapshot(),
+    }
+
+
+def flush(force=False):
+    """
+    Publish the snapshot of the current process so that other workers can aggregate it. To keep the overhead low, this
+    only happens once in `METRICS_FLUSH_INTERVAL` seconds (default five) unless forced.
+    """
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        return
+    _last_flush = now
+    directory = metrics_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write into a temporary file first and rename it afterwards, so that readers never see half-written files.
+        name = os.path.join(directory, '%d.json' % os.getpid())
+        with open(name + '.tmp', 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(name + '.tmp', name)
+    except OSError:
+        pass
+
+
+def snapshots():
+    """
+    Get snapshots of all living workers, including the current one whose live data is used instead of its published
+    snapshot. Snapshots of dead workers are removed.
+    :rtype list
+    """
+    result = [snapshot()]
+    directory = metrics_dir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith('.json') or name == '%d.json' % os.getpid():
+            continue
+        try:
+            os.kill(int(name[:-5]), 0)
+        except (ValueError, ProcessLookupError):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+            continue
+        except PermissionError:
+            pass
+        try:
+            with open(os.path.join(directory, name)) as f:
+                result.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+def collect():
+    """
+    Aggregate snapshots of all living workers, see `snapshots`.
+    :return: Merged histograms, counters and recent requests.
+    :rtype dict, dict, list
+    """
+    histograms, counters, recent = {}, {}, []
+    for data in snapshots():
+        for metric, label, values in data['histograms']:
+            merged = histograms.setdefault((metric, label), [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+        for name, label, value in data['counters']:
+            counters[(name, label)] = counters.get((name, label), 0) + value
+        recent.extend(data['recent'])
+    return histograms, counters, recent
+
+
+def quantile(histogram, q):
+    """
+    Estimate a quantile from a histogram by linear interpolation inside the bucket containing it.
+    :param histogram: Histogram list.
+    :param q: Quantile, between zero and one.
+    :return: Estimated value in milliseconds.
+    :rtype float
+    """
+    total, rank, seen = histogram[-1], histogram[-1] * q, 0
+    if total == 0:
+        return 0.0
+    for i, bound in enumerate(BUCKETS):
+        if seen + histogram[i] >= rank:
+            lower = BUCKETS[i - 1] if i > 0 else 0
+            return lower + (bound - lower) * ((rank - seen) / histogram[i] if histogram[i] else 0)
+        seen += histogram[i]
+    return float(BUCKETS[-1])
+
+
+def summary():
+    """
+    Summarize aggregated metrics per view, for displaying on the index page.
+    :return: A list of dictionaries, one for each view, sorted by total time spent descending.
+    :rtype list
+    """
+    histograms, counters, _ = collect()
+    rows = []
+    for (metric, label), values in histograms.items():
+        if metric != 'view' or values[-1] == 0:
+            continue
+        db = histograms.get(('db', label))
+        rows.append({
+            'view': label,
+            'count': values[-1],
+            'mean': values[-2] / values[-1],
+            'p50': quantile(values, 0.5),
+            'p95': quantile(values, 0.95),
+            'db_mean': db[-2] / db[-1] if db and db[-1] else 0.0,
+            'queries': counters.get(('queries', label), 0) / values[-1],
+        })
+    rows.sort(key=lambda row: row['mean'] * row['count'], reverse=True)
+    return rows
+
+
+def exposition():
+    """
+    Render aggregated metrics in Prometheus text exposition format. Histograms are exported in seconds, as Prometheus
+    suggests.
+    :rtype str
+    """
+    histograms, counters, _ = collect()
+    lines, metrics = [], {}
+    for (metric, label), values in sorted(histograms.items()):
+        metrics.setdefault(metric, []).append((label, values))
+    for metric, series in metrics.items():
+        name = 'endportal_%s_seconds' % metric
+        lines.append('# TYPE %s histogram' % name)
+        for label, values in series:
+            label = label.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, value in zip(BUCKETS, values):
+                cumulative += value
+                lines.append('%s_bucket{label="%s",le="%g"} %d' % (name, label, bound / 1000, cumulative))
+            lines.append('%s_bucket{label="%s",le="+Inf"} %d' % (name, label, values[-1]))
+            lines.append('%s_sum{label="%s"} %f' % (name, label, values[-2] / 1000))
+            lines.append('%s_count{label="%s"} %d' % (name, label, values[-1]))
+    names = {}
+    for (name, label), value in sorted(counters.items()):
+        names.setdefault(name, []).append((label, value))
+    for name, series in names.items():
+        lines.append('# TYPE endportal_%s_total counter' % name)
+        for label, value in series:
+            label = label.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append('endportal_%s_total{label="%s"} %d' % (name, label, value))
+    return '\n'.join(lines) + '\n'
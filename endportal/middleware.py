@@ -0,0 +1,66 @@
+import time
+from contextlib import ExitStack
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from endportal import memory, metrics, pagecache
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, database query count and database time of every request, grouped by view, and peak allocations
+    while tracemalloc is tracing (see `endportal.memory`).
+    The middleware removes itself from the chain if instrumentation is disabled, so it costs nothing in that case.
+    """
+
+    def __init__(self, get_response):
+        if not metrics.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        metrics.instrument_templates()
+
+    def __call__(self, request):
+        queries = metrics.QueryCounter()
+        memory.begin()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+        # The resolver match is only available after the request has been routed.
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match is not None else 'unresolved'
+        metrics.record_request(view, request.path, elapsed, queries)
+        memory.end(view)
+        return response
+
+
+class PrecompressedMiddleware:
+    """
+    Choose one of the precompressed bodies of a response from the page cache (see `endportal.pagecache`) according to
+    the `Accept-Encoding` header of the request. Other responses are passed through untouched, nothing is compressed
+    per request. Entity tags of responses with variants are weakened.
+    Place it above any middleware which may modify the response body.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        variants = getattr(response, 'variants', None)
+        if variants is None:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # Variants are not the same bytes, so they never share a strong entity tag.
+        if response.has_header('ETag') and not response['ETag'].startswith('W/'):
+            response['ETag'] = 'W/' + response['ETag']
+        coding = pagecache.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), variants.keys() - {'identity'})
+        if coding != 'identity':
+            response.content = variants[coding]
+            response['Content-Encoding'] = coding
+            response['Content-Length'] = str(len(response.content))
+        return response
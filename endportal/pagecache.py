@@ -0,0 +1,231 @@
+import gzip
+import hashlib
+import re
+import time
+from threading import Lock, Thread
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from endportal import metrics
+
+# Brotli is optional, pages are simply not cached in brotli if it is not installed.
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+# Whitespaces are significant inside these elements, they are never minified. Line breaks also end TeX comments (`%`)
+# in math rendered by KaTeX, see `arithmatex`.
+RE_VERBATIM = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>'
+                         r'|<(span|div)\b[^>]*\bclass="arithmatex"[^>]*>.*?</\3\s*>)', re.IGNORECASE | re.DOTALL)
+# Only ASCII whitespaces, `\s` also matches no-break spaces which are significant.
+RE_BLANKS = re.compile(r'[ \t\r\n\f]+')
+RE_ENCODING = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def minify(html):
+    """
+    Collapse every run of whitespaces into a single space, except inside elements where whitespaces are significant.
+    This mostly removes the indentation of the HTML generated by component tags (e.g. `navigator`, `footer` and
+    `sidecard`), and renders exactly the same as the original.
+    :rtype str
+    """
+    parts = RE_VERBATIM.split(html)
+    # Splitting with three groups yields the text, the verbatim element and two tag names (one of which is None),
+    # repeatedly.
+    return ''.join(RE_BLANKS.sub(' ', part) if i % 4 == 0 else part if i % 4 == 1 else ''
+                   for i, part in enumerate(parts))
+
+
+def encode(content):
+    """
+    Produce all encoded variants of a response body. Variants which are not smaller than the original are dropped.
+    :param content: The original response body.
+    :return: A dictionary from content codings to bodies, `identity` is always included.
+    :rtype dict
+    """
+    variants = {'identity': content, 'gzip': gzip.compress(content, 9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content)
+    return {coding: body for coding, body in variants.items() if coding == 'identity' or len(body) < len(content)}
+
+
+def negotiate(accept_encoding, codings):
+    """
+    Choose a content coding according to an `Accept-Encoding` header, preferring brotli to gzip.
+    :param accept_encoding: Value of the header.
+    :param codings: Available content codings, except `identity`.
+    :return: The chosen content coding, or `identity`.
+    :rtype str
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        match = RE_ENCODING.match(item)
+        if match is not None:
+            try:
+                qualities[match.group(1).lower()] = float(match.group(2)) if match.group(2) else 1.0
+            except ValueError:
+                pass
+    for coding in ('br', 'gzip'):
+        if coding in codings and qualities.get(coding, qualities.get('*', 0)) > 0:
+            return coding
+    return 'identity'
+
+
+def threshold():
+    """
+    Get the number of pages a worker may serve concurrently, beyond which it is overloaded and sheds load, configured
+    by `PAGE_SHED_THRESHOLD`. Default to None, never shedding.
+    Pages are counted per process, so this requires workers serving requests with threads (e.g. `threads` of uWSGI,
+    or the `gthread` worker class of Gunicorn), and is the number of threads of a worker which may render pages. A
+    single-threaded worker serves one page at a time and is never overloaded, load must be shed in front of it instead
+    (e.g. by limiting the `listen` queue of uWSGI).
+    :rtype int | None
+    """
+    return getattr(settings, 'PAGE_SHED_THRESHOLD', None)
+
+
+def retry_after():
+    return getattr(settings, 'PAGE_RETRY_AFTER', 5)
+
+
+def respond(entry):
+    _, content_type, variants = entry
+    response = HttpResponse(variants['identity'], content_type=content_type)
+    # Picked by `PrecompressedMiddleware` according to the request.
+    response.variants = variants
+    return response
+
+
+def unavailable():
+    response = HttpResponse('服务繁忙，请稍后再试。', status=503, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after())
+    return response
+
+
+def render(key, version, build):
+    """
+    Render a page and cache it if it is cacheable.
+    :return: The response, and the cache entry of it or None if it is not cacheable.
+    :rtype (HttpResponse, tuple | None)
+    """
+    response = build()
+    if response.status_code != 200 or response.streaming or response.has_header('Content-Encoding'):
+        return response, None
+    content = response.content
+    if getattr(settings, 'HTML_MINIFY', False) and response['Content-Type'].startswith('text/html'):
+        content = minify(content.decode(response.charset)).encode(response.charset)
+    entry = (version, response['Content-Type'], encode(content))
+    cache.set(key, entry, getattr(settings, 'PAGE_CACHE_TIMEOUT', 86400))
+    return response, entry
+
+
+def refresh(key, version, build):
+    """
+    Render a page in the background, then release the lock of rendering it.
+    """
+    try:
+        render(key, version, build)
+    except Exception:
+        # Requests coming later render it again.
+        metrics.count('refresh_failed', 'pages')
+    finally:
+        cache.delete(key + ':lock')
+        # Threads have their own database connections, which must be closed explicitly.
+        connections.close_all()
+
+
+# Number of pages being served by threads of this process, see `threshold`.
+_inflight, _inflight_lock = 0, Lock()
+
+
+def key_of(request, params):
+    """
+    Get the cache key of a page, from its path and the query parameters it depends on. Other parameters (e.g. tracking
+    ones) never create entries of their own.
+    :param params: Names of the query parameters which the page depends on.
+    :rtype str
+    """
+    query = urlencode(sorted((name, request.GET[name]) for name in params if name in request.GET))
+    return 'page:' + hashlib.md5((request.path + '?' + query).encode()).hexdigest()
+
+
+def serve(request, version, build, params=('page',)):
+    """
+    Serve a page from the page cache, rendering it with the given function only if it is not cached yet. The page is
+    minified (if `HTML_MINIFY` is set) and compressed once when it is cached, so that following requests cost neither.
+    Only pages of anonymous users are cached, since pages of others contain their user names. Only successful responses
+    are cached.
+    Pages of older versions are kept as the last known good renderings. A page is rendered by only one request at a
+    time (across workers sharing the cache), others serve its last known good rendering meanwhile, or wait for it if
+    there is none. A worker serving more pages than `threshold` at the same time is overloaded, it never renders pages
+    itself, but serves the last known good rendering (or a 503 response if there is none) and renders in the
+    background.
+    :param request: The HTTP request object.
+    :param version: Version of the data the page is built from, pages of other versions are only served as the last
+                    known good renderings. It must be the same on all nodes sharing the cache (e.g. a version of the
+                    invalidation bus, see `endportal.bus`), otherwise nodes keep replacing pages of each other.
+    :param build: Function returning the response of the page.
+    :param params: Names of the query parameters which the page depends on, see `key_of`.
+    :rtype HttpResponse
+    """
+    global _inflight
+    with _inflight_lock:
+        _inflight += 1
+        overloaded = threshold() is not None and _inflight > threshold()
+    try:
+        if request.user.is_authenticated:
+            response = build()
+        else:
+            response = serve_anonymous(request, key_of(request, params), version, build, overloaded)
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
+    # Whether the page is cached depends on the session.
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def serve_anonymous(request, key, version, build, overloaded):
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version:
+        metrics.count('cache_hit', 'pages')
+        return respond(entry)
+    stale = entry
+    # The lock expires in case the worker holding it is killed.
+    if cache.add(key + ':lock', 1, getattr(settings, 'PAGE_RENDER_TIMEOUT', 30)):
+        if overloaded:
+            metrics.count('cache_stale' if stale is not None else 'shed', 'pages')
+            Thread(target=refresh, args=(key, version, build), daemon=True).start()
+            return respond(stale) if stale is not None else unavailable()
+        metrics.count('cache_miss', 'pages')
+        try:
+            response, entry = render(key, version, build)
+        finally:
+            cache.delete(key + ':lock')
+        return respond(entry) if entry is not None else response
+    # Another request is rendering the page.
+    if stale is not None:
+        metrics.count('cache_stale', 'pages')
+        return respond(stale)
+    deadline = time.monotonic() + getattr(settings, 'PAGE_COALESCE_WAIT', 5)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            metrics.count('cache_coalesced', 'pages')
+            return respond(entry)
+        if cache.get(key + ':lock') is None:
+            # The page is not cacheable (e.g. not found), or failed to render.
+            break
+    if overloaded:
+        metrics.count('shed', 'pages')
+        return unavailable()
+    metrics.count('cache_miss', 'pages')
+    response, entry = render(key, version, build)
+    return respond(entry) if entry is not None else response
@@ -0,0 +1,89 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+def logs_database():
+    """
+    Get the alias of the database storing logs, configured by `LOGS_DATABASE`. Default to `logs` if such a database is
+    configured, otherwise logs stay in the default database.
+    :rtype str
+    """
+    return getattr(settings, 'LOGS_DATABASE', 'logs' if 'logs' in settings.DATABASES else 'default')
+
+
+def blog_read_database():
+    """
+    Get the alias of the read replica of blogs, configured by `BLOG_READ_DATABASE`, or None if there is not.
+    :rtype str | None
+    """
+    return getattr(settings, 'BLOG_READ_DATABASE', None)
+
+
+def replica_lag():
+    """
+    Get the number of seconds after blogs are changed during which blogs are read from the default database rather than
+    the replica, configured by `BLOG_REPLICA_LAG` (default five). It must cover the replication lag, otherwise caches
+    rebuilt right after the change may be built from outdated data, and kept for the whole generation.
+    :rtype float
+    """
+    return getattr(settings, 'BLOG_REPLICA_LAG', 5)
+
+
+def recently_changed():
+    """
+    Check whether blogs were changed within the replica lag. Caches are invalidated whenever blogs are changed, on every
+    node, which records the time they were last changed.
+    :rtype bool
+    """
+    from blog import caches
+    return time.time_ns() - caches.changed() < replica_lag() * 1e9
+
+
+class DatabaseRouter:
+    """
+    Keep logs in a database of their own, so that bursts of log inserts never contend with (or on SQLite, lock) the
+    database serving blogs. Blogs may additionally be read from a replica, except shortly after they are changed (see
+    `replica_lag`).
+    Enable it by adding `endportal.routers.DatabaseRouter` to `DATABASE_ROUTERS`, and create tables of logs with
+    `manage.py migrate --database logs`. Only logs are migrated to the logs database, and logs are never migrated to
+    others. Users are referenced by logs across databases, so that reference can not be a database constraint.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'logs':
+            return logs_database()
+        if model._meta.app_label == 'blog' and blog_read_database() is not None:
+            # Objects stick to the database they were loaded from, and reads inside a transaction must see its own
+            # writes, which have not been replicated yet.
+            instance = hints.get('instance')
+            if instance is not None and instance._state.db is not None:
+                return instance._state.db
+            if connections['default'].in_atomic_block or recently_changed():
+                return 'default'
+            return blog_read_database()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'logs':
+            return logs_database()
+        if model._meta.app_label == 'blog':
+            return 'default'
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the default database.
+        databases = {obj1._state.db, obj2._state.db} - {blog_read_database()}
+        if len(databases) <= 1:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'logs':
+            return db == logs_database()
+        if db == logs_database() and db != 'default':
+            return False
+        if db == blog_read_database():
+            return False
+        return None
@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+
+# Brotli is optional, `.br` siblings are simply not generated if it is not installed.
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+# Name of the manifest recording the state of the previous run, relative to the static root.
+MANIFEST = 'collect.json'
+# Manifest in the format of `ManifestStaticFilesStorage`, so that `{% static %}` resolves hashed filenames if that
+# storage is enabled.
+STORAGE_MANIFEST = 'staticfiles.json'
+IGNORE_PATTERNS = ['CVS', '.*', '*~']
+# Only these files are worth compressing. Images and fonts are already compressed.
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.map')
+SIBLINGS = ('.gz', '.br')
+# References of stylesheets, which are rewritten in fingerprinted copies.
+RE_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'"()\s]+)\1\s*\)''')
+
+
+def sources():
+    """
+    List all static files found by the configured finders. The first finder providing a file wins, the same as
+    `collectstatic`.
+    :return: A dictionary from target paths (relative to the static root) to absolute source paths.
+    :rtype dict
+    """
+    found = {}
+    for finder in get_finders():
+        for path, storage in finder.list(IGNORE_PATTERNS):
+            prefix = getattr(storage, 'prefix', None)
+            found.setdefault(os.path.join(prefix, path) if prefix else path, storage.path(path))
+    return found
+
+
+def digest(source):
+    md5 = hashlib.md5()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def hashed_name(path, hexdigest):
+    """
+    Get the fingerprinted name of a file, in the same format as `ManifestStaticFilesStorage`.
+    """
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, hexdigest[:12], ext)
+
+
+def discard(target, suffixes=SIBLINGS):
+    # Siblings left by previous runs would be served by nginx in place of the changed file.
+    for suffix in suffixes:
+        try:
+            os.remove(target + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def compress(target):
+    """
+    Write precompressed `.gz` (and `.br`, if brotli is available) siblings of a file, for nginx `gzip_static` and
+    `brotli_static`. Siblings which are not smaller than the original are not written, and existing ones are removed.
+    """
+    with open(target, 'rb') as f:
+        data = f.read()
+    variants = [('.gz', lambda: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(data)))
+    discard(target)
+    for suffix, compressor in variants:
+        compressed = compressor()
+        if len(compressed) < len(data):
+            with open(target + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def rewrite(path, content, files):
+    """
+    Rewrite relative references of a stylesheet to fingerprinted names, like `ManifestStaticFilesStorage` does.
+    Absolute references, data URIs and references to other stylesheets (whose fingerprinted names depend on their own
+    rewriting) are kept.
+    :param path: Path of the stylesheet relative to the static root.
+    :param content: Content of the stylesheet.
+    :param files: Records of collected files by their paths, see `collect`.
+    :rtype str
+    """
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('/', '#', 'data:')) or ':' in url.split('/')[0]:
+            return match.group(0)
+        # Query strings and fragments (e.g. `font.eot?#iefix`) are kept as they are.
+        name, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), name))
+        if target not in files or target.endswith('.css'):
+            return match.group(0)
+        hashed = posixpath.basename(hashed_name(target, files[target]['hash']))
+        return 'url(%s%s%s)' % (match.group(1), posixpath.join(posixpath.dirname(name), hashed) + suffix,
+                                match.group(1))
+
+    return RE_CSS_URL.sub(replace, content)
+
+
+def collect(incremental=True, workers=8, hashed=False, precompress=False):
+    """
+    Collect static files into the static root directory.
+    In incremental mode, a file is only copied if its content hash differs from the one recorded by the previous run.
+    The hash is not even computed if the size and modification time of the source are unchanged. Copying is done over
+    a thread pool.
+    :param incremental: Whether to skip unchanged files.
+    :param workers: Number of copying threads.
+    :param hashed: Whether to generate fingerprinted copies and a manifest for `ManifestStaticFilesStorage`.
+    :param precompress: Whether to generate precompressed siblings of compressible files.
+    :return: A generator yielding one line of output for every copied file, and a summary at last.
+    """
+    root = settings.STATIC_ROOT
+    os.makedirs(root, exist_ok=True)
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            previous = json.load(f) if incremental else {}
+    except (OSError, ValueError):
+        previous = {}
+    # Options are part of the state, a file collected without fingerprinting must be processed again if it is needed.
+    options = {'hashed': hashed, 'precompress': precompress}
+    if previous.get('options') != options:
+        previous = {}
+    previous = previous.get('files', {})
+
+    def process(path, source):
+        stat = os.stat(source)
+        record = previous.get(path)
+        target = os.path.join(root, path)
+        if record is not None and os.path.exists(target):
+            if record['size'] == stat.st_size and record['mtime'] == stat.st_mtime_ns:
+                return path, record, False
+            hexdigest = digest(source)
+            if record['hash'] == hexdigest:
+                return path, dict(record, mtime=stat.st_mtime_ns), False
+        else:
+            hexdigest = digest(source)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(source, target)
+        targets = [target]
+        # Fingerprinted copies of stylesheets are written at last, once all names they refer to are known.
+        if hashed and not path.endswith('.css'):
+            targets.append(os.path.join(root, hashed_name(path, hexdigest)))
+            shutil.copy2(source, targets[-1])
+        for name in targets:
+            if precompress and path.endswith(COMPRESSIBLE):
+                compress(name)
+            else:
+                discard(name)
+        return path, {'hash': hexdigest, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}, True
+
+    files, copied = {}, 0
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(process, path, source) for path, source in sources().items()]
+        for future in as_completed(futures):
+            path, record, changed = future.result()
+            files[path] = record
+            if changed:
+                copied += 1
+                yield "Copying '%s'\n" % path
+    names = {path: hashed_name(path, record['hash']) for path, record in files.items()}
+    if hashed:
+        # Stylesheets are fingerprinted by their rewritten contents, which change whenever any file they refer to does.
+        for path in sorted(path for path in files if path.endswith('.css')):
+            with open(os.path.join(root, path), encoding='utf-8', errors='surrogateescape') as f:
+                content = rewrite(path, f.read(), files).encode('utf-8', errors='surrogateescape')
+            names[path] = hashed_name(path, hashlib.md5(content).hexdigest())
+            target = os.path.join(root, names[path])
+            with open(target, 'wb') as f:
+                f.write(content)
+            if precompress:
+                compress(target)
+            else:
+                discard(target)
+    with open(os.path.join(root, MANIFEST), 'w') as f:
+        json.dump({'options': options, 'files': files}, f)
+    if hashed:
+        with open(os.path.join(root, STORAGE_MANIFEST), 'w') as f:
+            json.dump({'paths': names, 'version': '1.0'}, f)
+    yield '\n%d static files copied to \'%s\', %d unmodified.\n' % (copied, root, len(files) - copied)
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from blog import caches
+from blog.models import Blog, Tag
+from endportal import bus
+from endportal.routers import DatabaseRouter
+from logs.models import Log
+
+STAMP = os.path.join(tempfile.gettempdir(), 'endportal-router-tests.stamp')
+BUS = 'file://' + os.path.join(tempfile.gettempdir(), 'endportal-bus-tests')
+
+
+@override_settings(BLOG_CACHE_STAMP=STAMP, CACHE_BUS_URL=None, LOGS_DATABASE='logs', BLOG_READ_DATABASE='replica',
+                   BLOG_REPLICA_LAG=5)
+class DatabaseRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = DatabaseRouter()
+        # Blogs were changed long ago.
+        with open(STAMP, 'a'):
+            os.utime(STAMP, ns=(0, 0))
+
+    def test_logs(self):
+        self.assertEqual(self.router.db_for_read(Log), 'logs')
+        self.assertEqual(self.router.db_for_write(Log), 'logs')
+        self.assertTrue(self.router.allow_migrate('logs', 'logs'))
+        self.assertFalse(self.router.allow_migrate('default', 'logs'))
+        self.assertFalse(self.router.allow_migrate('logs', 'blog'))
+
+    def test_blogs(self):
+        self.assertEqual(self.router.db_for_read(Blog), 'replica')
+        self.assertEqual(self.router.db_for_read(Tag), 'replica')
+        self.assertEqual(self.router.db_for_write(Blog), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'blog'))
+        self.assertIsNone(self.router.allow_migrate('default', 'blog'))
+
+    def test_other_apps(self):
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertIsNone(self.router.db_for_write(User))
+        self.assertIsNone(self.router.allow_migrate('default', 'auth'))
+
+    def test_instance_sticks(self):
+        blog = Blog()
+        blog._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(Blog, instance=blog), 'default')
+
+    def test_recently_changed(self):
+        os.utime(STAMP, ns=(time.time_ns(), time.time_ns()))
+        self.assertEqual(self.router.db_for_read(Blog), 'default')
+        with self.settings(BLOG_REPLICA_LAG=0):
+            self.assertEqual(self.router.db_for_read(Blog), 'replica')
+
+    def test_relations(self):
+        blog, replica = Blog(), Blog()
+        blog._state.db, replica._state.db = 'default', 'replica'
+        self.assertTrue(self.router.allow_relation(blog, replica))
+
+    @override_settings(BLOG_READ_DATABASE=None)
+    def test_without_replica(self):
+        self.assertIsNone(self.router.db_for_read(Blog))
+        self.assertEqual(self.router.db_for_write(Blog), 'default')
+
+
+@override_settings(BLOG_CACHE_STAMP=STAMP, CACHE_BUS_URL=BUS)
+class BusTests(SimpleTestCase):
+    def setUp(self):
+        bus._transport, bus._pid = None, None
+        self.addCleanup(setattr, bus, '_pid', None)
+        with open(STAMP, 'a'):
+            os.utime(STAMP, ns=(1, 1))
+
+    def test_connect_failed(self):
+        with mock.patch.object(bus.FileTransport, 'versions', side_effect=OSError('unreachable')), \
+                self.assertLogs('endportal.bus', 'ERROR'):
+            self.assertIsNone(bus.version('blog'))
+            # Caches fall back to the stamp of this node.
+            self.assertEqual(caches.generation(), 1)
+        # Connecting is tried again.
+        self.assertIsNotNone(bus.version('blog'))
+
+    def test_publish_failed(self):
+        self.assertIsNotNone(bus.connect())
+        with mock.patch.object(bus.FileTransport, 'publish', side_effect=OSError('unreachable')), \
+                self.assertLogs('endportal.bus', 'ERROR'):
+            bus.send('blog')
+
+
+class AuthTests(TestCase):
+    def test_login_keeps_caches(self):
+        with mock.patch.object(transaction, 'on_commit') as on_commit:
+            user = User.objects.create_user('user', password='password')
+            self.assertEqual(on_commit.call_count, 1)
+            self.assertTrue(self.client.login(username='user', password='password'))
+            self.assertEqual(on_commit.call_count, 1)
+            user.first_name = 'name'
+            user.save(update_fields=['first_name', 'last_login'])
+            self.assertEqual(on_commit.call_count, 2)
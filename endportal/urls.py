@@ -16,9 +16,13 @@ Including another URLconf
 from django.urls import include, path
 
 from _pub import views
+from blog import views as blog_views
 
 urlpatterns = [
-    path('', views.index),
+    path('', views.index, name='index'),
+    path('metrics/', views.metrics_exposition, name='metrics'),
+    path('sitemap.xml', blog_views.sitemap, name='sitemap'),
+    path('sitemap-<int:shard>.xml', blog_views.sitemap, name='sitemap-shard'),
     path('blog/', include('blog.urls')),
     path('logs/', include('logs.urls')),
     path('wcmd/', include('wcmd.urls')),
@@ -16,4 +16,4 @@ def paginate(request, limit, query_set):
         page = int(request.GET.get('page', 1))
     except ValueError:
         raise Http404
-    return page, limit, (len(query_set) + limit - 1) // limit, query_set[(page - 1) * limit: page * limit]
+    return page, limit, (query_set.count() + limit - 1) // limit, query_set[(page - 1) * limit: page * limit]
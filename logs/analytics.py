@@ -0,0 +1,176 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from logs import partitions
+from logs.models import Behavior, Category, Hits, Visitor, Watermark, unpack_address
+
+# NumPy is only required for summarizing aggregates. Without it, the analytics page is simply empty.
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+# Logs are inserted in short transactions, so all logs older than this are visible. Aggregation stops at the first log
+# newer than this, otherwise a log committed late with a smaller ID than the watermark would be skipped forever.
+SETTLE = timedelta(minutes=1)
+# Number of articles whose hits are listed day by day.
+TREND_COUNT = 5
+
+
+def day_of(time):
+    return timezone.localtime(time).date() if timezone.is_aware(time) else time.date()
+
+
+def key_of(value):
+    # Binary fields are loaded as memoryview by some backends, which is not hashable.
+    return bytes(value) if isinstance(value, memoryview) else value
+
+
+def upsert(model, counter, fields):
+    """
+    Add counts to rows of an aggregate, creating rows which do not exist yet.
+    :param model: Model of the aggregate, which has a `hits` field.
+    :param counter: Counts, keyed by tuples of values of the given fields.
+    :param fields: Fields identifying a row.
+    """
+    lookup = {field + '__in': {key[i] for key in counter} for i, field in enumerate(fields)}
+    rows = {tuple(key_of(getattr(row, field)) for field in fields): row for row in model.objects.filter(**lookup)}
+    for key, count in counter.items():
+        if key in rows:
+            rows[key].hits += count
+    model.objects.bulk_update([rows[key] for key in counter if key in rows], ['hits'], batch_size=1000)
+    model.objects.bulk_create([model(hits=count, **dict(zip(fields, key)))
+                               for key, count in counter.items() if key not in rows], batch_size=1000)
+
+
+def merge(rows):
+    """
+    Add logs, given as tuples of ID, address, time, category, behavior and detail, to the aggregates.
+    """
+    hits, visitors = Counter(), Counter()
+    for _, address, time, category, behavior, detailed in rows:
+        day = day_of(time)
+        hits[day, category, behavior, detailed[:Hits._meta.get_field('detailed').max_length]] += 1
+        if address is not None:
+            visitors[day, bytes(address)] += 1
+    upsert(Hits, hits, ('day', 'category', 'behavior', 'detailed'))
+    upsert(Visitor, visitors, ('day', 'src_addr'))
+
+
+def update(batch=5000):
+    """
+    Aggregate logs written since the last run, oldest first. Every partition has a watermark, which is the largest ID
+    aggregated, so that only new logs are read. Logs are aggregated in the order of IDs up to the first one which has
+    not settled, so that every log below the watermark has been aggregated. Every batch is merged and its watermark
+    moved in one transaction, so that the aggregation can be interrupted and resumed at any time without counting logs
+    twice.
+    :param batch: Number of logs aggregated in each transaction.
+    :return: A generator yielding one line of progress for every batch, and a summary at last.
+    """
+    existing = {partitions.model(month)._meta.db_table: month for month in partitions.months()}
+    # Aggregates of dropped partitions are kept, but their watermarks are useless.
+    Watermark.objects.filter(name__startswith='logs_entry_').exclude(name__in=existing).delete()
+    cutoff, aggregated = timezone.now() - SETTLE, 0
+    for name, month in sorted(existing.items(), key=lambda item: item[1]):
+        watermark, _ = Watermark.objects.get_or_create(name=name)
+        while True:
+            rows = list(partitions.model(month).objects
+                        .filter(id__gt=watermark.position).order_by('id')
+                        .values_list('id', 'src_addr', 'src_time', 'category', 'behavior', 'detailed')[:batch])
+            # Logs after the first one which has not settled are left to the next run as well.
+            unsettled = next((i for i, row in enumerate(rows) if row[2] >= cutoff), None)
+            if unsettled is not None:
+                rows = rows[:unsettled]
+            if not rows:
+                break
+            # Aggregates live in the same database as partitions.
+            with transaction.atomic(using=partitions.database()):
+                merge(rows)
+                watermark.position = rows[-1][0]
+                watermark.save(update_fields=['position'])
+            aggregated += len(rows)
+            yield 'Aggregated %d logs, up to %s\n' % (aggregated, rows[-1][2].isoformat())
+            if unsettled is not None:
+                break
+    yield '\n%d logs aggregated.\n' % aggregated
+
+
+def ranking(keys, weights, count):
+    """
+    Sum weights of equal keys, and get the keys with the largest sums.
+    :param keys: NumPy array of keys.
+    :param weights: NumPy array of weights, in the same order as keys.
+    :param count: Maximum number of keys returned.
+    :return: Indices of the largest sums in the unique keys (largest first), the unique keys, the inverse indices of
+             keys into them, and the sums.
+    :rtype (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    sums = numpy.bincount(inverse, weights=weights, minlength=len(unique))
+    return numpy.argsort(-sums, kind='stable')[:count], unique, inverse, sums
+
+
+def summarize(start, end, count=10):
+    """
+    Summarize aggregates of a range of days, which are vectorized with NumPy, so that the cost only depends on the size
+    of the aggregates but not the number of logs.
+    :param start: First day, included.
+    :param end: Last day, included.
+    :param count: Length of rankings.
+    :return: Daily hits of blogs and unique visitors, and hits of the most accessed articles day by day, rankings of
+             articles, search keywords and addresses, and totals of the range. None if NumPy is not installed.
+    :rtype dict | None
+    """
+    if numpy is None:
+        return None
+    days = (end - start).days + 1
+    rows = list(Hits.objects.filter(day__range=(start, end), category=Category.BLOG)
+                .values_list('day', 'behavior', 'detailed', 'hits'))
+    offset = numpy.array([(row[0] - start).days for row in rows], dtype=numpy.int64)
+    behavior = numpy.array([row[1] for row in rows], dtype=numpy.int64)
+    detailed = numpy.array([row[2] for row in rows], dtype=object)
+    hits = numpy.array([row[3] for row in rows], dtype=numpy.int64)
+    rows = list(Visitor.objects.filter(day__range=(start, end)).values_list('day', 'src_addr', 'hits'))
+    visitor_offset = numpy.array([(row[0] - start).days for row in rows], dtype=numpy.int64)
+    address = numpy.frombuffer(b''.join(bytes(row[1]) for row in rows), dtype='V16')
+    visitor_hits = numpy.array([row[2] for row in rows], dtype=numpy.int64)
+
+    access = behavior == Behavior.ACCESS
+    daily_hits = numpy.bincount(offset[access], weights=hits[access], minlength=days)
+    # Every row of a day is a unique address.
+    daily_visitors = numpy.bincount(visitor_offset, minlength=days)
+
+    # Hits of the most accessed articles day by day, as a matrix of days and articles.
+    order, unique, inverse, sums = ranking(detailed[access], hits[access], count)
+    rank = numpy.full(len(unique), -1, dtype=numpy.int64)
+    rank[order[:TREND_COUNT]] = numpy.arange(min(len(order), TREND_COUNT))
+    ranked = rank[inverse]
+    mask = ranked >= 0
+    width = min(len(order), TREND_COUNT)
+    trend = numpy.bincount(offset[access][mask] * width + ranked[mask], weights=hits[access][mask],
+                           minlength=days * width).reshape(days, width)
+    articles = [(unique[i], int(sums[i])) for i in order]
+
+    search = (behavior == Behavior.SEARCH) & (detailed != '')
+    order, unique, _, sums = ranking(detailed[search], hits[search], count)
+    keywords = [(unique[i], int(sums[i])) for i in order]
+
+    order, unique, _, sums = ranking(address, visitor_hits, count)
+    addresses = [(unpack_address(bytes(unique[i])), int(sums[i])) for i in order]
+    visitors = len(unique)
+
+    peak = max(int(daily_visitors.max()) if days else 0, 1)
+    return {
+        'days': [{'day': start + timedelta(days=i), 'hits': int(daily_hits[i]), 'visitors': int(daily_visitors[i]),
+                  'ratio': int(daily_visitors[i]) * 100 // peak, 'trend': [int(value) for value in trend[i]]}
+                 for i in reversed(range(days))],
+        'trend': [path for path, _ in articles[:TREND_COUNT]],
+        'articles': articles,
+        'keywords': keywords,
+        'addresses': addresses,
+        'hits': int(daily_hits.sum()),
+        'visitors': visitors,
+    }
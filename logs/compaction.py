@@ -0,0 +1,53 @@
+from django.db import transaction
+
+from logs import partitions
+from logs.models import Entry, Log, classify, pack_address
+
+
+def convert(legacy):
+    """
+    Convert a log in the original schema into the fields of the compact one. Addresses which can not be parsed are
+    dropped, unknown categories and behaviors are kept in the detailed text so that nothing is lost.
+    :rtype dict
+    """
+    try:
+        address = pack_address(legacy.src_addr) if legacy.src_addr else None
+    except ValueError:
+        address = None
+    category, behavior, detailed = classify(legacy.category, legacy.behavior, legacy.detailed)
+    return {'src_user_id': legacy.src_user or None, 'src_addr': address, 'src_time': legacy.src_time,
+            'category': category, 'behavior': behavior, 'detailed': detailed}
+
+
+def copy(entry):
+    """
+    Get the fields of a log which is in the compact schema already, but not partitioned.
+    :rtype dict
+    """
+    return {'src_user_id': entry.src_user_id, 'src_addr': entry.src_addr, 'src_time': entry.src_time,
+            'category': entry.category, 'behavior': entry.behavior, 'detailed': entry.detailed}
+
+
+def migrate(batch=1000):
+    """
+    Move all logs in the original schema, and those in the compact schema but not partitioned, into partitions, oldest
+    first. Every batch is inserted and removed from the original table in one transaction, so that the migration can be
+    interrupted and resumed at any time without losing or duplicating logs, and the original tables shrink as it goes.
+    :param batch: Number of logs moved in each transaction.
+    :return: A generator yielding one line of progress for every batch, and a summary at last.
+    """
+    moved = 0
+    for model, fields in ((Log, convert), (Entry, copy)):
+        while True:
+            rows = list(model.objects.order_by('id')[:batch])
+            if not rows:
+                break
+            # Partitions must be created outside of the transaction, since some databases commit DDL implicitly.
+            for month in {partitions.month_of(row.src_time) for row in rows}:
+                partitions.ensure(month)
+            with transaction.atomic(using=partitions.database()):
+                partitions.bulk_insert([fields(row) for row in rows])
+                model.objects.filter(id__lte=rows[-1].id).delete()
+            moved += len(rows)
+            yield 'Moved %d logs, up to %s\n' % (moved, rows[-1].src_time.isoformat())
+    yield '\n%d logs moved into partitions.\n' % moved
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.db import transaction
+from django.http import QueryDict
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from logs import partitions
+from logs.models import Behavior, Category, Watermark, pack_address
+
+# The `combined` format of nginx, only the fields needed are matched:
+# `$remote_addr - $remote_user [$time_local] "$request" $status ...`
+RE_NGINX = re.compile(r'^(\S+) \S+ \S+ \[([^\]]+)\] "(\S+) (\S+)[^"]*" (\d{3}) ')
+# The default request logging format of uWSGI:
+# `[pid: 1|app: 0|req: 1/1] 1.2.3.4 () {40 vars in 600 bytes} [Sun Oct 18 12:00:00 2026] GET /blog/ => generated ...`
+RE_UWSGI = re.compile(r'^\[pid: [^]]*\] (\S+) \([^)]*\) \{[^}]*\} \[([^\]]+)\] (\S+) (\S+) '
+                      r'=> generated .*?\(\S+ (\d{3})\)')
+MONTHS = {name: i + 1 for i, name in enumerate(('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+                                                'Nov', 'Dec'))}
+
+
+def enabled():
+    """
+    Check whether hits of pages are ingested from access logs of the reverse proxy instead of being logged by views,
+    configured by `LOGS_INGEST_HITS` (default false). Other logs (e.g. publishing) are always logged by views, since
+    they are not in access logs.
+    :rtype bool
+    """
+    return getattr(settings, 'LOGS_INGEST_HITS', False)
+
+
+@lru_cache(maxsize=64)
+def parse_offset(text):
+    return datetime.strptime(text, '%z').tzinfo
+
+
+def parse_nginx_time(text):
+    # `18/Oct/2026:12:00:00 +0800`, parsed by position since `strptime` is rather slow.
+    return datetime(int(text[7:11]), MONTHS[text[3:6]], int(text[0:2]), int(text[12:14]), int(text[15:17]),
+                    int(text[18:20]), tzinfo=parse_offset(text[21:]))
+
+
+def parse_uwsgi_time(text):
+    # `Sun Oct  8 12:00:00 2026` in local time.
+    _, month, day, clock, year = text.split()
+    time_ = datetime(int(year), MONTHS[month], int(day), int(clock[0:2]), int(clock[3:5]), int(clock[6:8]))
+    return timezone.make_aware(time_) if settings.USE_TZ else time_
+
+
+FORMATS = {'nginx': (RE_NGINX, parse_nginx_time), 'uwsgi': (RE_UWSGI, parse_uwsgi_time)}
+
+
+@lru_cache(maxsize=4096)
+def route(path):
+    """
+    Map the path of a URL to the category, behavior and detail views would log for it, except searches whose details
+    are in query strings.
+    :return: A tuple of category, behavior and detail, or None if hits of the URL are not logged.
+    :rtype (Category, Behavior, str) | None
+    """
+    try:
+        match = resolve(unquote(path))
+    except Resolver404:
+        return None
+    if match.url_name == 'blog-content':
+        return Category.BLOG, Behavior.ACCESS, unquote('/'.join(match.kwargs['path'][:-1].split('/')))
+    if match.url_name == 'blog-tag':
+        return Category.BLOG, Behavior.TAG, match.kwargs['name']
+    if match.url_name == 'blog-indices':
+        return Category.BLOG, Behavior.SEARCH, ''
+    return None
+
+
+def parse(line, kind):
+    """
+    Parse a line of an access log into fields of a log. Only successful hits of pages whose views log them are kept.
+    :param line: The line, in bytes.
+    :param kind: Format of the access log, one of `FORMATS`.
+    :return: Fields of the log, or None if the line is malformed or not a hit of a page.
+    :rtype dict | None
+    """
+    pattern, parse_time = FORMATS[kind]
+    match = pattern.match(line.decode('utf-8', 'replace'))
+    if match is None:
+        return None
+    address, time_, method, url, status = match.groups()
+    # Errors (e.g. probes and scans for missing pages) are not hits, while pages not modified are still viewed.
+    if method not in ('GET', 'HEAD') or not (status.startswith('2') or status == '304'):
+        return None
+    path, _, query = url.partition('?')
+    hit = route(path)
+    if hit is None:
+        return None
+    category, behavior, detailed = hit
+    if behavior == Behavior.SEARCH:
+        detailed = unquote(QueryDict(query).get('keyword', ''))
+    try:
+        address = pack_address(address)
+    except ValueError:
+        address = None
+    try:
+        time_ = parse_time(time_)
+    except (KeyError, ValueError):
+        return None
+    return {'src_user_id': None, 'src_addr': address, 'src_time': time_, 'category': category, 'behavior': behavior,
+            'detailed': detailed}
+
+
+def ingest(path, kind, batch=5000, follow=False, interval=1.0):
+    """
+    Insert hits of pages in an access log into partitions. The offset read up to is checkpointed with the inserted
+    logs in one transaction, so that ingestion can be interrupted and resumed at any time without losing or
+    duplicating logs. If the file is rotated (or truncated), the new one is read from the beginning, lines written to
+    the old one after the last checkpoint are lost, so ingest it right before rotating (e.g. in `prerotate` of
+    logrotate) or keep following it.
+    :param path: Path of the access log.
+    :param kind: Format of the access log, one of `FORMATS`.
+    :param batch: Number of lines read in each transaction.
+    :param follow: Whether to keep waiting for new lines, like `tail -f`.
+    :param interval: Seconds to wait for new lines when following.
+    :return: A generator yielding one line of progress for every batch, and a summary at last if not following.
+    """
+    checkpoint, _ = Watermark.objects.get_or_create(
+        name='ingest:' + hashlib.md5(os.path.abspath(path).encode()).hexdigest())
+    lines_read = inserted = 0
+    while True:
+        stat = os.stat(path)
+        identity = '%d:%d' % (stat.st_dev, stat.st_ino)
+        if checkpoint.identity != identity or stat.st_size < checkpoint.position:
+            checkpoint.identity, checkpoint.position = identity, 0
+        with open(path, 'rb') as f:
+            f.seek(checkpoint.position)
+            while True:
+                lines = list(islice(f, batch))
+                if lines and not lines[-1].endswith(b'\n'):
+                    # The line is still being written, it is read again next time.
+                    lines.pop()
+                if not lines:
+                    break
+                rows = [row for row in (parse(line, kind) for line in lines) if row is not None]
+                # Partitions must be created outside of the transaction, since some databases commit DDL implicitly.
+                for month in {partitions.month_of(row['src_time']) for row in rows}:
+                    partitions.ensure(month)
+                # Checkpoints live in the same database as partitions.
+                with transaction.atomic(using=partitions.database()):
+                    partitions.bulk_insert(rows)
+                    checkpoint.position += sum(map(len, lines))
+                    checkpoint.save(update_fields=['identity', 'position'])
+                lines_read, inserted = lines_read + len(lines), inserted + len(rows)
+                yield 'Read %d lines, %d logs inserted\n' % (lines_read, inserted)
+                if len(lines) < batch:
+                    break
+        if not follow:
+            break
+        time.sleep(interval)
+    yield '\n%d lines read from %s, %d logs inserted.\n' % (lines_read, path, inserted)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from logs import analytics
+
+
+class Command(BaseCommand):
+    """
+    Aggregate logs written since the last run for the analytics page, see `logs.analytics.update`. Unlike the web
+    command, this runs in a process of its own, so that it can be run periodically by cron without a browser.
+    """
+    help = 'Aggregate new logs for analytics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=5000, help='Number of logs aggregated in each transaction.')
+
+    def handle(self, *args, **options):
+        if options['batch'] <= 0:
+            raise CommandError('Batch size must be positive.')
+        try:
+            for line in analytics.update(options['batch']):
+                self.stdout.write(line, ending='')
+        except KeyboardInterrupt:
+            # Every batch aggregated has moved its watermark.
+            pass
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from logs import ingest
+
+
+class Command(BaseCommand):
+    """
+    Ingest hits of pages from an access log of nginx or uWSGI. Unlike web commands, this runs in a process of its own,
+    so that following an access log never occupies a worker. Set `LOGS_INGEST_HITS` so that views stop logging hits.
+    """
+    help = 'Ingest hits of pages from an access log.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the access log.')
+        parser.add_argument('--format', choices=sorted(ingest.FORMATS), default='nginx',
+                            help='Format of the access log, nginx for the combined format.')
+        parser.add_argument('--batch', type=int, default=5000, help='Number of lines read in each transaction.')
+        parser.add_argument('--follow', action='store_true', help='Keep waiting for new lines.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait for new lines.')
+
+    def handle(self, *args, **options):
+        if options['batch'] <= 0:
+            raise CommandError('Batch size must be positive.')
+        try:
+            for line in ingest.ingest(options['path'], options['format'], options['batch'], options['follow'],
+                                      options['interval']):
+                self.stdout.write(line, ending='')
+        except OSError as e:
+            raise CommandError(e)
+        except KeyboardInterrupt:
+            # Everything read has been checkpointed.
+            pass
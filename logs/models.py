@@ -1,10 +1,95 @@
+import ipaddress
 from datetime import datetime, timezone
 
+from django.contrib.auth.models import User
 from django.db import models
 from ipware import get_client_ip
 
 
+def pack_address(text):
+    """
+    Pack an IP address into 16 bytes, IPv4 addresses are mapped into IPv6 (i.e. `::ffff:a.b.c.d`). Packed addresses
+    compare in the same order as addresses, so that a network is a range of them.
+    :raise ValueError: If the text is not an IP address.
+    :rtype bytes
+    """
+    address = ipaddress.ip_address(text)
+    if address.version == 4:
+        address = ipaddress.IPv6Address('::ffff:' + str(address))
+    return address.packed
+
+
+def unpack_address(data):
+    """
+    Get the text form of a packed IP address, IPv4-mapped addresses are displayed as IPv4.
+    :rtype str
+    """
+    if data is None:
+        return ''
+    address = ipaddress.IPv6Address(bytes(data))
+    return str(address.ipv4_mapped or address)
+
+
+def pack_network(text):
+    """
+    Get the range of packed addresses of a network (e.g. `10.0.0.0/8`), both ends are included.
+    :raise ValueError: If the text is not a network.
+    :rtype bytes, bytes
+    """
+    network = ipaddress.ip_network(text, strict=False)
+    return pack_address(network.network_address), pack_address(network.broadcast_address)
+
+
+class Labelled(models.IntegerChoices):
+    """
+    Small integer enumeration stored in place of a text, which is its label. Every subclass should have an `OTHER`
+    member.
+    """
+
+    @classmethod
+    def of(cls, label):
+        """
+        Get the member with the given label, unknown labels are mapped to `OTHER`.
+        """
+        return next((member for member in cls if member.label == label), cls.OTHER)
+
+
+class Category(Labelled):
+    OTHER = 0, 'other'
+    BLOG = 1, 'blog'
+    WCMD = 2, 'wcmd'
+
+
+class Behavior(Labelled):
+    OTHER = 0, 'other'
+    ACCESS = 1, 'access'
+    SEARCH = 2, 'search'
+    TAG = 3, 'tag'
+    PUBLISH = 4, 'publish'
+    EXECUTE = 5, 'execute'
+
+
+def classify(category, behavior, detailed):
+    """
+    Get the members of a category and a behavior given as labels. Unknown labels are kept in the detailed text, so that
+    nothing is lost.
+    :return: The category, the behavior and the detailed text.
+    :rtype Category, Behavior, str
+    """
+    category_, behavior_ = Category.of(category), Behavior.of(behavior)
+    if (category_ == Category.OTHER and category not in ('', Category.OTHER.label)) or \
+            (behavior_ == Behavior.OTHER and behavior not in ('', Behavior.OTHER.label)):
+        detailed = '[%s/%s] %s' % (category, behavior, detailed)
+    return category_, behavior_, detailed
+
+
 class Log(models.Model):
+    """
+    Log in the original schema, where addresses, categories and behaviors are texts. New logs are written in the compact
+    schema of `Entry` into monthly partitions (see `logs.partitions`) by `new_log`, and existing rows are moved into
+    them by `logs.compaction`, leaving this table empty. This model is kept since `new_log` is the API of logging, and
+    the permission to view logs belongs to it.
+    """
     src_user = models.IntegerField()
     src_addr = models.CharField(max_length=15)
     src_time = models.DateTimeField()
@@ -14,12 +99,85 @@ class Log(models.Model):
 
     @staticmethod
     def new_log(request, category, behavior='', detailed=''):
+        # Partitions are built from this module, so they can not be imported at the top.
+        from logs import partitions
         ip, _ = get_client_ip(request)
-        Log.objects.create(
-            src_user=request.user.id if request.user.is_authenticated else 0,
-            src_addr=ip,
+        category, behavior, detailed = classify(category, behavior, detailed)
+        partitions.insert(
+            src_user_id=request.user.id if request.user.is_authenticated else None,
+            src_addr=pack_address(ip) if ip is not None else None,
             src_time=datetime.now(tz=timezone.utc),
             category=category,
             behavior=behavior,
             detailed=detailed
-        ).save()
+        )
+
+    @staticmethod
+    def new_hit(request, category, behavior='', detailed=''):
+        """
+        Log a hit of a page, unless hits are ingested from access logs instead (see `logs.ingest`).
+        """
+        from logs import ingest
+        if not ingest.enabled():
+            Log.new_log(request, category, behavior, detailed)
+
+
+class Entry(models.Model):
+    """
+    Log in the compact schema, stored without partitioning. Only logs written before partitioning are stored here, they
+    are moved into partitions by `logs.compaction`.
+    """
+    # Users live in the default database, while logs may not (see `endportal.routers`), so this can not be a database
+    # constraint. Anonymous users are null.
+    src_user = models.ForeignKey(User, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                                 related_name='+')
+    # Packed by `pack_address`, which fits IPv6 as well.
+    src_addr = models.BinaryField(max_length=16, null=True)
+    src_time = models.DateTimeField()
+    category = models.PositiveSmallIntegerField(choices=Category.choices)
+    behavior = models.PositiveSmallIntegerField(choices=Behavior.choices)
+    detailed = models.TextField()
+
+    class Meta:
+        indexes = [models.Index(fields=['src_time']), models.Index(fields=['src_addr', 'src_time'])]
+
+
+class Hits(models.Model):
+    """
+    Number of logs of a day with the same category, behavior and detail (e.g. an accessed path or a searched keyword),
+    maintained incrementally by `logs.analytics`. Details are truncated to the length of the field.
+    """
+    day = models.DateField()
+    category = models.PositiveSmallIntegerField(choices=Category.choices)
+    behavior = models.PositiveSmallIntegerField(choices=Behavior.choices)
+    detailed = models.CharField(max_length=255)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'category', 'behavior', 'detailed'],
+                                               name='logs_hits_unique')]
+        indexes = [models.Index(fields=['category', 'behavior', 'day'])]
+
+
+class Visitor(models.Model):
+    """
+    Number of logs of a day from the same address, maintained incrementally by `logs.analytics`. The number of rows of
+    a day is the number of unique visitors of it.
+    """
+    day = models.DateField()
+    src_addr = models.BinaryField(max_length=16)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'src_addr'], name='logs_visitor_unique')]
+
+
+class Watermark(models.Model):
+    """
+    Position up to which a source has been processed: the largest ID of a partition aggregated by `logs.analytics`, or
+    the offset of an access log ingested by `logs.ingest`.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    position = models.BigIntegerField(default=0)
+    # Device and inode of an access log, which changes once it is rotated.
+    identity = models.CharField(max_length=64, blank=True, default='')
@@ -0,0 +1,213 @@
+import re
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from django.apps.registry import Apps
+from django.conf import settings
+from django.db import DatabaseError, connections, models, router
+from django.db.models import Q
+
+from logs.models import Behavior, Category
+
+# Partitions are created at runtime, so they are registered separately, out of sight of migrations.
+registry = Apps()
+RE_TABLE = re.compile(r'^logs_entry_(\d{4})(\d{2})$')
+
+_models, _created, _lock = {}, set(), Lock()
+
+
+def month_of(time):
+    """
+    Get the month (in UTC) a time belongs to.
+    :rtype (int, int)
+    """
+    time = time.astimezone(timezone.utc) if time.tzinfo is not None else time
+    return time.year, time.month
+
+
+def shift(month, delta):
+    """
+    Get the month a number of months after (or before, if negative) the given one.
+    :rtype (int, int)
+    """
+    index = month[0] * 12 + month[1] - 1 + delta
+    return index // 12, index % 12 + 1
+
+
+def model(month):
+    """
+    Get the model of the partition holding logs of the given month, which is a table named `logs_entry_YYYYMM` in the
+    compact schema of `Entry`. Users are referenced by ID only, since partitions live outside of the app registry.
+    :rtype type
+    """
+    if month not in _models:
+        suffix = '%04d%02d' % month
+        meta = type('Meta', (), {
+            'apps': registry, 'app_label': 'logs', 'db_table': 'logs_entry_' + suffix,
+            'indexes': [models.Index(fields=['src_time'], name='logs_%s_time' % suffix),
+                        models.Index(fields=['src_addr', 'src_time'], name='logs_%s_addr' % suffix)],
+        })
+        _models[month] = type('Entry' + suffix, (models.Model,), {
+            '__module__': __name__,
+            'Meta': meta,
+            'src_user_id': models.IntegerField(null=True),
+            'src_addr': models.BinaryField(max_length=16, null=True),
+            'src_time': models.DateTimeField(),
+            'category': models.PositiveSmallIntegerField(choices=Category.choices),
+            'behavior': models.PositiveSmallIntegerField(choices=Behavior.choices),
+            'detailed': models.TextField(),
+        })
+    return _models[month]
+
+
+def database():
+    return router.db_for_write(model((1970, 1)))
+
+
+def months():
+    """
+    List months which have a partition, newest first. This costs one query to the catalog of the database, so that
+    partitions created by other workers are never missed.
+    :rtype list
+    """
+    tables = connections[database()].introspection.table_names()
+    return sorted(((int(match.group(1)), int(match.group(2))) for match in map(RE_TABLE.match, tables) if match),
+                  reverse=True)
+
+
+def ensure(month):
+    """
+    Create the partition of a month if it does not exist yet. Creation is checked once per process and month.
+    """
+    if month in _created:
+        return
+    with _lock:
+        if month in _created:
+            return
+        if month not in months():
+            try:
+                with connections[database()].schema_editor() as editor:
+                    editor.create_model(model(month))
+            except DatabaseError:
+                # Another worker may have created it at the same time.
+                if month not in months():
+                    raise
+            else:
+                if retention() is not None:
+                    prune(retention())
+        _created.add(month)
+
+
+def insert(**fields):
+    """
+    Insert a log into the partition of its time.
+    """
+    month = month_of(fields['src_time'])
+    ensure(month)
+    model(month).objects.create(**fields)
+
+
+def bulk_insert(rows):
+    """
+    Insert logs, given as dictionaries of fields, into partitions of their times.
+    """
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(month_of(row['src_time']), []).append(row)
+    for month, items in grouped.items():
+        ensure(month)
+        model(month).objects.bulk_create([model(month)(**item) for item in items], batch_size=1000)
+
+
+def drop(month):
+    """
+    Drop the partition of a month with all its logs, which costs the same no matter how many logs it has.
+    """
+    with connections[database()].schema_editor() as editor:
+        editor.delete_model(model(month))
+    _created.discard(month)
+
+
+def prune(keep):
+    """
+    Drop partitions older than the given number of months, counting the current month.
+    :return: Months dropped.
+    :rtype list
+    """
+    oldest = shift(month_of(datetime.now(tz=timezone.utc)), 1 - keep)
+    dropped = [month for month in months() if month < oldest]
+    for month in dropped:
+        drop(month)
+    return dropped
+
+
+def retention():
+    """
+    Get the number of months of logs to keep, configured by `LOGS_RETENTION_MONTHS`. If it is set, old partitions are
+    dropped whenever the partition of a new month is created. Default to None, keeping all logs.
+    :rtype int | None
+    """
+    return getattr(settings, 'LOGS_RETENTION_MONTHS', None)
+
+
+class PartitionedQuerySet:
+    """
+    A query over all partitions, ordered by time descending, supporting the operations the logs view needs: filtering,
+    counting, slicing and iterating. Partitions are disjoint ranges of time, so the results of partitions are simply
+    concatenated from the newest one. Partitions outside of the time range given by `between` are never queried.
+    """
+
+    def __init__(self, months_=None, filters=()):
+        self.months = months() if months_ is None else months_
+        self.filters = filters
+        self._counts = None
+
+    def filter(self, *args, **kwargs):
+        return PartitionedQuerySet(self.months, self.filters + (Q(*args, **kwargs),))
+
+    def between(self, start=None, end=None):
+        """
+        Prune partitions which can not contain logs of the given time range. Logs are not filtered by it, so filter
+        them as well. Times may be naive or in any timezone, so partitions adjacent to the range are kept.
+        :param start: Earliest time, or None for no bound.
+        :param end: Latest time, or None for no bound.
+        :rtype PartitionedQuerySet
+        """
+        first = month_of(start - timedelta(days=1)) if start is not None else None
+        last = month_of(end + timedelta(days=1)) if end is not None else None
+        return PartitionedQuerySet([month for month in self.months if (first is None or month >= first) and
+                                    (last is None or month <= last)], self.filters)
+
+    def partition(self, month):
+        return model(month).objects.filter(*self.filters).order_by('-src_time', '-id')
+
+    def counts(self):
+        if self._counts is None:
+            self._counts = [self.partition(month).count() for month in self.months]
+        return self._counts
+
+    def count(self):
+        return sum(self.counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('Only slices without steps are supported.')
+        start, stop = item.start or 0, item.stop
+        rows = []
+        for month, count in zip(self.months, self.counts()):
+            if stop is not None and stop <= 0:
+                break
+            if start < count:
+                rows.extend(self.partition(month)[start:stop])
+            start, stop = max(start - count, 0), stop - count if stop is not None else None
+        return rows
+
+    def iterator(self, chunk_size=2000):
+        for month in self.months:
+            yield from self.partition(month).iterator(chunk_size=chunk_size)
+
+    def __iter__(self):
+        return self.iterator()
@@ -0,0 +1,65 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+
+from logs import analytics, ingest, partitions
+from logs.models import Behavior, Category, Hits, Visitor, Watermark, pack_address
+
+
+class AnalyticsTests(TransactionTestCase):
+    databases = {'default', 'logs'}
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.month = partitions.month_of(self.now)
+        partitions.ensure(self.month)
+
+    def tearDown(self):
+        partitions.drop(self.month)
+
+    def insert(self, age, path, address='127.0.0.1'):
+        return partitions.model(self.month).objects.create(
+            src_user_id=None, src_addr=pack_address(address), src_time=self.now - age,
+            category=Category.BLOG, behavior=Behavior.ACCESS, detailed=path).id
+
+    def hits(self):
+        return dict(Hits.objects.values_list('detailed', 'hits'))
+
+    def watermark(self):
+        return Watermark.objects.get(name=partitions.model(self.month)._meta.db_table).position
+
+    def test_update(self):
+        self.insert(timedelta(hours=1), 'a')
+        self.insert(timedelta(hours=1), 'a', '127.0.0.2')
+        last = self.insert(timedelta(hours=1), 'b')
+        list(analytics.update(batch=2))
+        self.assertEqual(self.hits(), {'a': 2, 'b': 1})
+        self.assertEqual(Visitor.objects.count(), 2)
+        self.assertEqual(self.watermark(), last)
+        # Logs already aggregated are never counted again.
+        list(analytics.update())
+        self.assertEqual(self.hits(), {'a': 2, 'b': 1})
+
+    def test_unsettled(self):
+        first = self.insert(timedelta(hours=1), 'a')
+        self.insert(timedelta(0), 'b')
+        # A log with a larger ID but an older time, e.g. one committed late.
+        self.insert(timedelta(hours=1), 'c')
+        list(analytics.update())
+        self.assertEqual(self.hits(), {'a': 1})
+        self.assertEqual(self.watermark(), first)
+        with mock.patch.object(analytics, 'SETTLE', timedelta(minutes=-1)):
+            list(analytics.update())
+        self.assertEqual(self.hits(), {'a': 1, 'b': 1, 'c': 1})
+
+
+class IngestTests(SimpleTestCase):
+    LINE = '1.2.3.4 - - [18/Oct/2026:12:00:00 +0800] "GET /blog/a/ HTTP/1.1" %s 512 "-" "-"'
+
+    def test_status(self):
+        self.assertEqual(ingest.parse((self.LINE % 200).encode(), 'nginx')['detailed'], 'a')
+        self.assertEqual(ingest.parse((self.LINE % 304).encode(), 'nginx')['detailed'], 'a')
+        self.assertIsNone(ingest.parse((self.LINE % 404).encode(), 'nginx'))
+        self.assertIsNone(ingest.parse((self.LINE % 500).encode(), 'nginx'))
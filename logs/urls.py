@@ -4,4 +4,5 @@ from logs import views
 
 urlpatterns = [
     path('', views.logs, name="logs"),
+    path('analytics/', views.dashboard, name="logs-analytics"),
 ]
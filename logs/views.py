@@ -1,32 +1,81 @@
+import csv
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.models import User
 from django.core.exceptions import SuspiciousOperation
 from django.db.models import Q
 from django.forms import model_to_dict
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import urlencode
 
 from endportal import utils
-from logs.models import Log
+from logs import analytics, partitions
+from logs.models import Behavior, Category, pack_address, pack_network, unpack_address
+
+# Columns of exported logs.
+EXPORT_FIELDS = ('id', 'src_user', 'src_name', 'src_addr', 'src_time', 'category', 'behavior', 'detailed')
+# Number of logs fetched from the database, and whose usernames are resolved, at a time when exporting.
+EXPORT_CHUNK = 2000
 
 
-def log_to_dict(log):
+def usernames(ids):
+    """
+    Get usernames of users with one query.
+    :param ids: IDs of users, None (i.e. anonymous users) is ignored.
+    :return: A dictionary from IDs to usernames, deleted users are absent.
+    :rtype dict
+    """
+    ids = set(ids) - {None}
+    return dict(User.objects.filter(id__in=ids).values_list('id', 'username')) if ids else {}
+
+
+def log_to_dict(log, names):
     """
     Transforms a log object into a dictionary. Source username field will be added.
-    :param log: Log object.
+    :param log: Log entry object.
+    :param names: Usernames of users, see `usernames`.
     :return: Dictionary form of the given log.
     :rtype dict
     """
-    log = model_to_dict(log)
-    log['src_name'] = User.objects.get(id=log['src_user']) if log['src_user'] != 0 else '未登录用户'
-    return log
+    result = model_to_dict(log)
+    result['id'] = log.id
+    result['src_user'] = log.src_user_id or 0
+    result['src_name'] = names.get(log.src_user_id, '') if log.src_user_id is not None else '未登录用户'
+    result['src_addr'] = unpack_address(log.src_addr)
+    result['category'] = log.get_category_display()
+    result['behavior'] = log.get_behavior_display()
+    return result
 
 
-@permission_required('logs.view_log', raise_exception=True)
-def logs(request):
+def parse_time(text):
     """
-    Log page: render logs according to certain searching criteria. The current user must have permission to view logs.
+    Parse a time or a date (as the beginning of that day) given in a search criteria.
+    :raise ValueError: If the text is neither.
+    :rtype datetime
+    """
+    time = parse_datetime(text)
+    if time is None:
+        date = parse_date(text)
+        if date is None:
+            raise ValueError(text)
+        time = datetime.combine(date, datetime.min.time())
+    return time
+
+
+def search_logs(request):
     """
-    query_set, search = Log.objects.all().order_by('-src_time'), dict()
+    Filter logs according to searching criteria given in GET parameters.
+    :raise SuspiciousOperation: If any criteria is malformed.
+    :return: Filtered logs and the criteria given.
+    :rtype PartitionedQuerySet, dict
+    """
+    query_set, search = partitions.PartitionedQuerySet(), dict()
     try:
         src_time_s = request.GET.get('src_time_s', '')
         src_time_e = request.GET.get('src_time_e', '')
@@ -35,25 +84,110 @@ def logs(request):
         keyword = request.GET.get('keyword', '')
         if src_time_s != '':
             search['src_time_s'] = src_time_s
-            query_set = query_set.filter(src_time__gte=src_time_s)
+            query_set = query_set.filter(src_time__gte=src_time_s).between(start=parse_time(src_time_s))
         if src_time_e != '':
             search['src_time_e'] = src_time_e
-            query_set = query_set.filter(src_time__lte=src_time_e)
+            query_set = query_set.filter(src_time__lte=src_time_e).between(end=parse_time(src_time_e))
         if src_user != '':
             search['src_user'] = src_user
-            query_set = query_set.filter(src_user=int(src_user))
+            src_user = int(src_user)
+            query_set = query_set.filter(src_user_id=src_user if src_user != 0 else None)
         if src_addr != '':
             search['src_addr'] = src_addr
-            query_set = query_set.filter(src_addr=src_addr)
+            # Networks (e.g. `10.0.0.0/8`) are ranges of packed addresses, which are index scans as well.
+            if '/' in src_addr:
+                first, last = pack_network(src_addr)
+                query_set = query_set.filter(src_addr__gte=first, src_addr__lte=last)
+            else:
+                query_set = query_set.filter(src_addr=pack_address(src_addr))
         if keyword != '':
             search['keyword'] = keyword
-            query_set = query_set.filter(Q(category__icontains=keyword) |
-                                         Q(behavior__icontains=keyword) |
-                                         Q(detailed__icontains=keyword))
+            # Categories and behaviors are stored as integers, so match their labels here.
+            query = Q(detailed__icontains=keyword)
+            for field, choices in (('category', Category), ('behavior', Behavior)):
+                values = [member.value for member in choices if keyword.lower() in member.label]
+                if values:
+                    query |= Q(**{field + '__in': values})
+            query_set = query_set.filter(query)
     except ValueError:
         raise SuspiciousOperation()
+    return query_set, search
+
+
+def export_chunks(query_set, kind):
+    """
+    Serialize logs chunk by chunk, so that memory usage does not depend on the number of logs. Logs are fetched with
+    `iterator`, which uses server-side cursors if the database supports them, and usernames of every chunk are resolved
+    with one query.
+    :param query_set: Logs to be exported.
+    :param kind: Either `csv` or `jsonl`.
+    :return: A generator yielding serialized chunks of logs, and the header first if there is one.
+    """
+    class Echo:
+        # CSV writers only write to files, and this one returns what is written instead.
+        def write(self, value):
+            return value
+
+    writer = csv.writer(Echo())
+    if kind == 'csv':
+        yield writer.writerow(EXPORT_FIELDS)
+    rows = query_set.iterator(chunk_size=EXPORT_CHUNK)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK))
+        if not chunk:
+            return
+        names = usernames(log.src_user_id for log in chunk)
+        chunk = [log_to_dict(log, names) for log in chunk]
+        for result in chunk:
+            result['src_time'] = result['src_time'].isoformat()
+        if kind == 'csv':
+            yield ''.join(writer.writerow([result[field] for field in EXPORT_FIELDS]) for result in chunk)
+        else:
+            yield ''.join(json.dumps({field: result[field] for field in EXPORT_FIELDS}, ensure_ascii=False) + '\n'
+                          for result in chunk)
+
+
+@permission_required('logs.view_log', raise_exception=True)
+def logs(request):
+    """
+    Log page: render logs according to certain searching criteria. The current user must have permission to view logs.
+    If `export` is given (either `csv` or `jsonl`), all logs matching the criteria are downloaded in that format instead.
+    """
+    query_set, search = search_logs(request)
+    export = request.GET.get('export', '')
+    if export != '':
+        if export not in ('csv', 'jsonl'):
+            raise SuspiciousOperation()
+        response = StreamingHttpResponse(export_chunks(query_set, export), content_type={
+            'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}[export])
+        response['Content-Disposition'] = 'attachment; filename="logs-%s.%s"' % (
+            timezone.localtime().strftime('%Y%m%d%H%M%S'), export)
+        return response
     context = dict()
     context['page'], context['plim'], context['pcnt'], context['logs'] = utils.paginate(request, 50, query_set)
-    context['logs'] = [log_to_dict(log) for log in context['logs']]
+    names = usernames(log.src_user_id for log in context['logs'])
+    context['logs'] = [log_to_dict(log, names) for log in context['logs']]
     context['search'] = search
+    # Criteria of export links, which are the same as the page.
+    context['query'] = urlencode(search)
     return render(request, 'logs.html', context)
+
+
+@permission_required('logs.view_log', raise_exception=True)
+def dashboard(request):
+    """
+    Analytics page: render statistics of a range of days (the last 30 days by default) from aggregates of logs, which
+    are maintained by the `aggregate` command. The current user must have permission to view logs.
+    """
+    search = dict()
+    try:
+        end = request.GET.get('end', '')
+        start = request.GET.get('start', '')
+        end = parse_date(end) if end != '' else timezone.localdate()
+        start = parse_date(start) if start != '' else end - timedelta(days=29)
+        if start is None or end is None or start > end:
+            raise ValueError()
+    except ValueError:
+        raise SuspiciousOperation()
+    search['start'], search['end'] = start, end
+    return render(request, 'logs-analytics.html', {'search': search, 'stat': analytics.summarize(start, end)})
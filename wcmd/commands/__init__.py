@@ -3,11 +3,93 @@ class WebCommand:
     The base class of all web commands.
     """
     commands = {}  # This is where all the commands supported are stored.
+    # Long-running commands should set this to True, so that they are executed as background jobs and their output is
+    # polled by the client. Such commands may yield their output chunk by chunk instead of returning it at once, and
+    # only get the user of the request (see `wcmd.jobs.Detached`).
+    background = False
 
     class Parameter:
         def __init__(self, name, desc, type, default):
             self.name, self.desc, self.type, self.default = name, desc, type, default
 
+    class Parser:
+        """
+        Argument parser of a command, compiled once from its parameters. Lookup tables, defaults and help text are all
+        prepared beforehand, so parsing a command line is a single pass over its tokens.
+        """
+
+        def __init__(self, command):
+            self.pos_params, self.key_params = list(command.pos_params), dict(command.key_params)
+            # Number of positional parameters which must be given, i.e. those before the last one without default.
+            self.pos_required = max([0] + [i + 1 for i, param in enumerate(self.pos_params) if param.default is None])
+            self.pos_defaults = [param.default for param in self.pos_params]
+            self.key_required = [name for name, param in self.key_params.items() if param.default is None]
+            self.key_defaults = {name: param.default for name, param in self.key_params.items()
+                                 if param.default is not None}
+            # Generate a usage string, including every single parameter, no matter positional or keyword.
+            order = ' '.join([('<%s>' if param.default is None else '[%s]') % param.name
+                              for param in self.pos_params])
+            named = ' '.join([('<%s>' if param.default is None else '[%s]') % ('--' + name + ' ' + name)
+                              for name, param in self.key_params.items()])
+            self.usage = command.name + ' ' + order + ' ' + named + ': ' + command.desc
+            # Then append detailed explanations of very parameter. We calculate the maximum length of all parameters'
+            # name first, so that we can align the descriptions.
+            # This zero is required since some commands do no have parameters, and `max` cannot handle empty lists.
+            max_len = max([0] +
+                          [len(param.name) for param in self.pos_params] +
+                          [len(name) for name in self.key_params])
+            self.help = self.usage
+            for param in self.pos_params + list(self.key_params.values()):
+                self.help += '\n    ' + param.name + ' ' * (max_len - len(param.name) + 1) + param.desc
+                if param.default is not None and param.default != '':
+                    self.help += '\n    ' + ' ' * (max_len + 1) + 'Default to be: ' + str(param.default)
+
+        def parse(self, tokens):
+            """
+            Parse the arguments of a command.
+            Instead of detecting the keyword of a parameter (i.e. --something), we detect the parameter value itself and
+            determine whether it is a positional parameter or a keyword parameter by whether the previous token is a
+            keyword. Keywords not followed by a value are ignored.
+            :param tokens: Tokens of the command line, excluding the command name.
+            :return: Positional arguments and keyword arguments.
+            :rtype list, dict
+            """
+            args, kwargs, name = [], {}, None
+            for token in tokens:
+                if token.startswith('--'):
+                    name = token[2:]
+                    continue
+                if name is not None:
+                    # This is a keyword parameter.
+                    if name not in self.key_params:
+                        raise WebCommand.Failed('Unknown keyword parameter %s of value "%s". ' % (name, token))
+                    try:
+                        kwargs[name] = self.key_params[name].type(token)
+                    except ValueError:
+                        raise WebCommand.Failed(
+                            'Preprocessor of keyword parameter %s rejected value "%s".' % (name, token))
+                    name = None
+                else:
+                    # This is a positional parameter. The total count must not exceed.
+                    if len(args) >= len(self.pos_params):
+                        raise WebCommand.Failed('Too much arguments.')
+                    param = self.pos_params[len(args)]
+                    try:
+                        args.append(param.type(token))
+                    except ValueError:
+                        raise WebCommand.Failed(
+                            'Preprocessor of positional parameter %s rejected value "%s".' % (param.name, token))
+            # If there are any positional parameters missing, use the default ones. If some parameter has no default
+            # value (i.e. it is required), raise an error.
+            if len(args) < self.pos_required:
+                missing = next(param for param in self.pos_params[len(args):] if param.default is None)
+                raise WebCommand.Failed('Positional parameter %s is required but not given.' % missing.name)
+            args.extend(self.pos_defaults[len(args):])
+            for name in self.key_required:
+                if name not in kwargs:
+                    raise WebCommand.Failed('Keyword parameter %s is required but not given.' % name)
+            return args, dict(self.key_defaults, **kwargs)
+
     class Failed(BaseException):
         """
         Exception raised when a logic error takes place while executing a command.
@@ -25,6 +107,7 @@ class WebCommand:
         :param permission: Permission required to execute this command. If there are no permissions required, use None.
         """
         self.name, self.desc, self.permission, self.pos_params, self.key_params = name, desc, permission, [], {}
+        self._parser = None
         WebCommand.commands[name] = self
 
     def __call__(self, *args, **kwargs):
@@ -32,8 +115,8 @@ class WebCommand:
         Execute the command.
         This method should be implemented by sub-classes.
         :param request: The HTTP request object.
-        :return: The output of the command.
-        :rtype: str
+        :return: The output of the command, or an iterable of output chunks.
+        :rtype: str | Iterable[str]
         """
         pass
 
@@ -46,6 +129,7 @@ class WebCommand:
         :param default: Default value. If not presented, this parameter is required.
         """
         self.pos_params.append(WebCommand.Parameter(name, desc, type, default))
+        self._parser = None
 
     def add_key_param(self, name, desc, type=str, default=None):
         """
@@ -56,6 +140,18 @@ class WebCommand:
         :param default: Default value. If not presented, this parameter is required.
         """
         self.key_params[name] = WebCommand.Parameter(name, desc, type, default)
+        self._parser = None
+
+    @property
+    def parser(self):
+        """
+        Get the compiled argument parser of the current command. It is compiled on first use, after all parameters
+        have been added, and recompiled only if parameters change.
+        :rtype WebCommand.Parser
+        """
+        if self._parser is None:
+            self._parser = WebCommand.Parser(self)
+        return self._parser
 
     def available(self, request):
         """
@@ -71,5 +167,17 @@ class WebCommand:
         return True
 
 
+def boolean(text):
+    """
+    Transform a POST argument string into a boolean, for parameters acting like switches.
+    :rtype bool
+    """
+    if text.lower() in ('yes', 'y', 'true', 'on', '1'):
+        return True
+    if text.lower() in ('no', 'n', 'false', 'off', '0'):
+        return False
+    raise ValueError(text)
+
+
 # We have to import it here to avoid circular imports
-from wcmd.commands import misc, user
+from wcmd.commands import diag, logs, misc, posts, user
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+from datetime import datetime
+from threading import Event, Thread, get_ident
+
+from endportal import memory, metrics
+from wcmd.commands import WebCommand
+
+
+class Sampler(Thread):
+    """
+    A sampling profiler. It wakes up periodically, takes the stacks of all other threads of the current process, and
+    counts how many times each function appears on top of a stack (self samples) and anywhere in a stack (cumulative
+    samples).
+    """
+
+    def __init__(self, seconds, interval):
+        super().__init__(daemon=True)
+        self.seconds, self.interval, self.stopped = seconds, interval, Event()
+        self.samples, self.self_counts, self.cumulative_counts = 0, {}, {}
+        self.started_at = None
+
+    def run(self) -> None:
+        self.started_at = time.time()
+        deadline = time.monotonic() + self.seconds
+        while not self.stopped.is_set() and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == get_ident():
+                    continue
+                self.sample(frame)
+            self.samples += 1
+            self.stopped.wait(self.interval / 1000)
+        self.stopped.set()
+
+    def sample(self, frame):
+        key = (frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+        self.self_counts[key] = self.self_counts.get(key, 0) + 1
+        # Recursive functions may appear multiple times in one stack, but should be counted once.
+        seen = set()
+        while frame is not None:
+            key = (frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+            if key not in seen:
+                seen.add(key)
+                self.cumulative_counts[key] = self.cumulative_counts.get(key, 0) + 1
+            frame = frame.f_back
+
+
+class Profile(WebCommand):
+    """
+    Start, stop or inspect a sampling profiler in the worker handling the command, requires superuser.
+    Note that every worker has its own profiler, and the results only cover the worker which started it.
+    """
+    sampler = None
+
+    def __init__(self):
+        super().__init__('profile', 'Sample the stacks of the current worker.', 'superuser')
+        self.add_pos_param('action', 'One of start, stop and dump.')
+        self.add_key_param('seconds', 'Duration of sampling, in seconds.', type=int, default=30)
+        self.add_key_param('interval', 'Interval between samples, in milliseconds.', type=int, default=5)
+        self.add_key_param('limit', 'Number of functions to dump.', type=int, default=20)
+
+    def __call__(self, request, action, seconds, interval, limit):
+        if action == 'start':
+            if Profile.sampler is not None and not Profile.sampler.stopped.is_set():
+                raise WebCommand.Failed('Profiler is already running in worker %d.' % os.getpid())
+            if seconds <= 0 or interval <= 0:
+                raise WebCommand.Failed('Duration and interval must be positive.')
+            Profile.sampler = Sampler(seconds, interval)
+            Profile.sampler.start()
+            return 'Profiling worker %d for %ds, one sample every %dms.' % (os.getpid(), seconds, interval)
+        if Profile.sampler is None:
+            raise WebCommand.Failed('Profiler has never been started in worker %d.' % os.getpid())
+        if action == 'stop':
+            Profile.sampler.stopped.set()
+            Profile.sampler.join()
+            return 'Profiler of worker %d stopped with %d samples.' % (os.getpid(), Profile.sampler.samples)
+        if action == 'dump':
+            return self.dump(Profile.sampler, limit)
+        raise WebCommand.Failed('Unknown action %s.' % action)
+
+    @staticmethod
+    def dump(sampler, limit):
+        """
+        Format the top functions by cumulative samples. Time is estimated as samples multiplied by interval.
+        """
+        header = 'Worker %d, %d samples since %s%s.' % (
+            os.getpid(), sampler.samples, datetime.fromtimestamp(sampler.started_at).strftime('%H:%M:%S'),
+            '' if sampler.stopped.is_set() else ', still running')
+        if sampler.samples == 0:
+            return header
+        top = sorted(sampler.cumulative_counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        lines = [header, '%8s %8s %7s  %s' % ('cumtime', 'selftime', 'cum%', 'function')]
+        for key, cumulative in top:
+            filename, lineno, name = key
+            lines.append('%7dms %7dms %6.1f%%  %s (%s:%d)' % (
+                cumulative * sampler.interval, sampler.self_counts.get(key, 0) * sampler.interval,
+                cumulative * 100 / sampler.samples, name, filename, lineno))
+        return '\n'.join(lines)
+
+
+class Slowest(WebCommand):
+    """
+    Show the slowest recent requests of all workers, requires superuser. Only available if instrumentation is enabled.
+    """
+
+    def __init__(self):
+        super().__init__('slowest', 'Show the slowest recent requests.', 'superuser')
+        self.add_key_param('limit', 'Number of requests to show.', type=int, default=10)
+
+    def __call__(self, request, limit):
+        if not metrics.enabled():
+            raise WebCommand.Failed('Instrumentation is disabled, set METRICS_ENABLED to enable it.')
+        _, _, recent = metrics.collect()
+        recent = sorted(recent, key=lambda item: item['time'], reverse=True)[:limit]
+        lines = ['%10s %10s %7s %7s %8s  %s' % ('time', 'db_time', 'queries', 'pid', 'at', 'path')]
+        for item in recent:
+            lines.append('%8.1fms %8.1fms %7d %7d %8s  %s' % (
+                item['time'], item['db_time'], item['queries'], item['pid'],
+                datetime.fromtimestamp(item['at']).strftime('%H:%M:%S'), item['path']))
+        return '\n'.join(lines)
+
+
+class CacheStats(WebCommand):
+    """
+    Report hit rates of in-process caches, requires superuser. Caches report themselves through the `cache_hit` and
+    `cache_miss` counters. Other workers are only included if instrumentation is enabled, since otherwise they never
+    publish their counters.
+    """
+
+    def __init__(self):
+        super().__init__('cachestats', 'Report hit rates of caches.', 'superuser')
+
+    def __call__(self, request):
+        _, counters, _ = metrics.collect()
+        names = sorted({label for name, label in counters if name in ('cache_hit', 'cache_miss')})
+        if not names:
+            return 'No cache has been accessed yet.'
+        max_len = max(len(name) for name in names)
+        lines = []
+        for name in names:
+            hit, miss = counters.get(('cache_hit', name), 0), counters.get(('cache_miss', name), 0)
+            lines.append('%s %d hits, %d misses, %.1f%% hit rate' % (
+                name + ' ' * (max_len - len(name)), hit, miss, hit * 100 / (hit + miss) if hit + miss else 0))
+        return '\n'.join(lines)
+
+
+class Memory(WebCommand):
+    """
+    Inspect memory of workers, requires superuser. Resident memory of all workers is reported (other workers only if
+    instrumentation is enabled, see `CacheStats`). Allocations are traced by tracemalloc in the worker handling the
+    command only, like the profiler, or in all workers if they are started with `PYTHONTRACEMALLOC` set.
+    """
+
+    def __init__(self):
+        super().__init__('memory', 'Inspect memory of workers.', 'superuser')
+        self.add_pos_param('action', 'One of workers, start, stop, top and diff.', default='workers')
+        self.add_key_param('frames', 'Number of frames of tracebacks stored when tracing.', type=int, default=1)
+        self.add_key_param('limit', 'Number of source lines to show.', type=int, default=20)
+
+    def __call__(self, request, action, frames, limit):
+        if action == 'workers':
+            summary = memory.summary(metrics.snapshots())
+            lines = ['Budget: %s' % ('%dMB' % summary['budget'] if summary['budget'] is not None else 'unlimited'),
+                     '%7s %10s  %s' % ('pid', 'rss', 'tracing')]
+            for worker in summary['workers']:
+                lines.append('%7d %8.1fMB  %s' % (worker['pid'], worker['rss'], 'yes' if worker['tracing'] else 'no'))
+            if summary['peaks']:
+                lines.append('\n%10s %10s %7s  %s' % ('max_peak', 'mean_peak', 'count', 'view'))
+                for item in summary['peaks']:
+                    lines.append('%8.1fKB %8.1fKB %7d  %s' % (item['max'], item['mean'], item['count'], item['view']))
+            return '\n'.join(lines)
+        if action == 'start':
+            if memory.tracemalloc.is_tracing():
+                raise WebCommand.Failed('Already tracing in worker %d.' % os.getpid())
+            if frames <= 0:
+                raise WebCommand.Failed('At least one frame must be stored.')
+            memory.start(frames)
+            return 'Tracing allocations of worker %d.' % os.getpid()
+        if not memory.tracemalloc.is_tracing():
+            raise WebCommand.Failed('Not tracing in worker %d.' % os.getpid())
+        if action == 'stop':
+            memory.stop()
+            return 'Stopped tracing allocations of worker %d.' % os.getpid()
+        if action == 'top':
+            return 'Worker %d, allocated since tracing started:\n' % os.getpid() + memory.top(limit)
+        if action == 'diff':
+            return 'Worker %d, grown since the last diff:\n' % os.getpid() + memory.diff(limit)
+        raise WebCommand.Failed('Unknown action %s.' % action)
+
+
+Profile(), Slowest(), CacheStats(), Memory()
@@ -0,0 +1,68 @@
+from logs import analytics, compaction, partitions
+from wcmd.commands import WebCommand
+
+
+class CompactLogs(WebCommand):
+    """
+    Move logs in the original schema, or not partitioned yet, into monthly partitions, requires superuser. The migration
+    is done in batches, it can be interrupted (e.g. by restarting) and run again later, resuming where it stopped.
+    """
+    background = True
+
+    def __init__(self):
+        super().__init__('compactlogs', 'Migrate logs into the compact schema.', 'superuser')
+        self.add_key_param('batch', 'Number of logs moved in each transaction.', type=int, default=1000)
+
+    def __call__(self, request, batch):
+        if batch <= 0:
+            raise WebCommand.Failed('Batch size must be positive.')
+        yield from compaction.migrate(batch)
+
+
+class LogPartitions(WebCommand):
+    """
+    List monthly partitions of logs with their sizes, or drop old ones, requires superuser. Dropping a partition drops
+    its table, no matter how many logs it has.
+    """
+
+    def __init__(self):
+        super().__init__('logparts', 'List or drop partitions of logs.', 'superuser')
+        self.add_pos_param('action', 'One of list and prune.')
+        self.add_key_param('keep', 'Number of months to keep when pruning, counting the current month.', type=int,
+                           default=12)
+
+    def __call__(self, request, action, keep):
+        if action == 'list':
+            query_set = partitions.PartitionedQuerySet()
+            if not query_set.months:
+                return 'No partitions.'
+            return '\n'.join('%04d-%02d %10d logs' % (month + (count,))
+                             for month, count in zip(query_set.months, query_set.counts()))
+        if action == 'prune':
+            if keep <= 0:
+                raise WebCommand.Failed('At least the current month must be kept.')
+            dropped = partitions.prune(keep)
+            return 'Dropped %d partitions%s.' % (len(dropped), ''.join(
+                ', %04d-%02d' % month for month in dropped))
+        raise WebCommand.Failed('Unknown action %s.' % action)
+
+
+class Aggregate(WebCommand):
+    """
+    Aggregate logs written since the last run for the analytics page, requires superuser. Run it periodically with
+    `manage.py aggregatelogs` (e.g. by cron), the aggregation resumes where it stopped, so it can be interrupted at any
+    time.
+    """
+    background = True
+
+    def __init__(self):
+        super().__init__('aggregate', 'Aggregate new logs for analytics.', 'superuser')
+        self.add_key_param('batch', 'Number of logs aggregated in each transaction.', type=int, default=5000)
+
+    def __call__(self, request, batch):
+        if batch <= 0:
+            raise WebCommand.Failed('Batch size must be positive.')
+        yield from analytics.update(batch)
+
+
+CompactLogs(), LogPartitions(), Aggregate()
@@ -5,7 +5,9 @@ from django.conf import settings
 from django.contrib.staticfiles.management.commands import collectstatic
 from django.core.management import CommandError
 
-from wcmd.commands import WebCommand
+from endportal import assets, staticfiles
+from wcmd import jobs
+from wcmd.commands import WebCommand, boolean
 
 # UWSGI is only provided in production environment. We try to import it, and do nothing if failed.
 try:
@@ -27,38 +29,15 @@ class Help(WebCommand):
         # Determine whether we should show brief introductions of all commands, or just give a detailed explanation of
         # one command.
         if command == '':
+            available = [(name, cmd) for name, cmd in WebCommand.commands.items() if cmd.available(request)]
             # The maximum length of all commands is calculated beforehand, so that we can align the descriptions.
-            max_len = max([len(name) for name, cmd in WebCommand.commands.items() if cmd.available(request)])
-            return '\n'.join([name + ' ' * (max_len - len(name) + 1) + cmd.desc
-                              for name, cmd in WebCommand.commands.items() if cmd.available(request)])
+            max_len = max([len(name) for name, cmd in available])
+            return '\n'.join([name + ' ' * (max_len - len(name) + 1) + cmd.desc for name, cmd in available])
         else:
             if command not in WebCommand.commands or not WebCommand.commands[command].available(request):
                 raise WebCommand.Failed('Command %s not found.' % command)
-            command = WebCommand.commands[command]
-            # Generate a usage string, including every single parameter, no matter positional or keyword.
-            order = ' '.join([('<%s>' if param.default is None else '[%s]') % param.name
-                              for param in command.pos_params])
-            named = ' '.join([('<%s>' if param.default is None else '[%s]') % ('--' + name + ' ' + name)
-                              for name, param in command.key_params.items()])
-            msg = command.name + ' ' + order + ' ' + named + ': ' + command.desc
-            # Then append detailed explanations of very parameter. Similar to the previous all-command-introduction, we
-            # calculate the maximum length of all parameters' name first.
-            # This zero is required since some commands do no have parameters, and `max` cannot handle empty lists.
-            max_len = max([0] +
-                          [len(param.name) for param in command.pos_params] +
-                          [len(name) for name in command.key_params])
-
-            def add_msg(msg_, param):
-                msg_ += '\n    ' + param.name + ' ' * (max_len - len(param.name) + 1) + param.desc
-                if param.default is not None and param.default != '':
-                    msg_ += '\n    ' + ' ' * (max_len + 1) + 'Default to be: ' + str(param.default)
-                return msg_
-
-            for param in command.pos_params:
-                msg = add_msg(msg, param)
-            for param in command.key_params.values():
-                msg = add_msg(msg, param)
-            return msg
+            # Usage and explanations of parameters are generated once, along with the argument parser.
+            return WebCommand.commands[command].parser.help
 
 
 class Restart(WebCommand):
@@ -89,21 +68,66 @@ class Restart(WebCommand):
 
 class CollectStatic(WebCommand):
     """
-    Collect all static files into static root directory, requires superuser.
+    Collect all static files into static root directory, requires superuser. Executed in the background, since copying
+    every file takes a while.
+    By default, this simply runs django's `collectstatic`. In incremental mode, only files whose content has changed
+    since the previous run are copied, in parallel, optionally along with fingerprinted copies and precompressed
+    siblings. Bundles of front-end assets can be built afterwards, see `endportal.assets`.
     """
+    background = True
 
     def __init__(self):
         super().__init__('collectstatic', 'Collect static files.', 'superuser')
+        self.add_key_param('incremental', 'Only copy changed files, in parallel.', type=boolean, default=False)
+        self.add_key_param('workers', 'Number of copying threads in incremental mode.', type=int, default=8)
+        self.add_key_param('hashed', 'Generate fingerprinted copies in incremental mode.', type=boolean,
+                           default=False)
+        self.add_key_param('compress', 'Generate .gz and .br siblings in incremental mode.', type=boolean,
+                           default=False)
+        self.add_key_param('bundle', 'Build bundles of front-end assets after collecting.', type=boolean,
+                           default=False)
+
+    def __call__(self, request, incremental, workers, hashed, compress, bundle):
+        if incremental:
+            yield from staticfiles.collect(True, workers, hashed, compress)
+        else:
+            if hashed or compress:
+                raise WebCommand.Failed('Fingerprinting and compressing are only available in incremental mode.')
+            try:
+                yield from jobs.capture(self.collect)
+            except CommandError as e:
+                raise WebCommand.Failed(str(e))
+        if bundle:
+            try:
+                yield from assets.build(compress)
+            except OSError as e:
+                raise WebCommand.Failed('%s, run vendor and collect static files first.' % e)
+
+    @staticmethod
+    def collect(stdout):
+        # Use the highest verbosity so that every copied file is reported, leave other options to default.
+        return collectstatic.Command(stdout=stdout).handle(interactive=False, verbosity=2, link=False, clear=False,
+                                                           dry_run=False, ignore_patterns=[],
+                                                           use_default_ignore_patterns=True, post_process=False,
+                                                           skip_checks=True)
+
+
+class Vendor(WebCommand):
+    """
+    Download third party front-end libraries from the CDN into the project, requires superuser. Vendored libraries are
+    collected as static files, and bundled by `collectstatic --bundle`.
+    """
+    background = True
+
+    def __init__(self):
+        super().__init__('vendor', 'Download front-end libraries.', 'superuser')
+        self.add_key_param('force', 'Download files which already exist.', type=boolean, default=False)
 
-    def __call__(self, request):
+    def __call__(self, request, force):
         try:
-            # Enable verbosity to display more information, leave other options to default.
-            result = collectstatic.Command().handle(interactive=False, verbosity=True, link=False, clear=False,
-                                                    dry_run=False, ignore_patterns=[], use_default_ignore_patterns=True,
-                                                    post_process=False)
-            return result
-        except CommandError as e:
+            yield from assets.vendor(force)
+        except (OSError, ValueError) as e:
             raise WebCommand.Failed(str(e))
 
 
-Help(), Restart(), CollectStatic()
+Help(), Restart(), CollectStatic(), Vendor()
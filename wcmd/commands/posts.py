@@ -0,0 +1,87 @@
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from blog import caches, related, revisions, taxonomy
+from blog.models import Blog
+from wcmd.commands import WebCommand
+
+
+class Retag(WebCommand):
+    """
+    Rebuild normalized categories and tags of all blogs from their publish paths and content tags, and recount them.
+    Requires superuser. This back-fills blogs published before tags were normalized.
+    """
+    background = True
+
+    def __init__(self):
+        super().__init__('retag', 'Rebuild categories and tags of all blogs.', 'superuser')
+
+    def __call__(self, request):
+        yield from taxonomy.backfill()
+        caches.invalidate()
+
+
+class Recommend(WebCommand):
+    """
+    Recompute related blogs of all blogs from scratch, requires superuser. Recommendations are refreshed incrementally
+    by the `refreshrelated` management command, this is only needed for back-filling or after lots of changes.
+    """
+    background = True
+
+    def __init__(self):
+        super().__init__('recommend', 'Recompute related blogs of all blogs.', 'superuser')
+
+    def __call__(self, request):
+        if related.numpy is None:
+            raise WebCommand.Failed('NumPy is not installed.')
+        total = related.rebuild()
+        caches.invalidate()
+        return 'Recommendations of %d blogs computed.' % total
+
+
+class Revisions(WebCommand):
+    """
+    List, show or compare revisions of a blog, requires superuser. Every publish which changes the content of a blog
+    records a revision.
+    """
+
+    def __init__(self):
+        super().__init__('revisions', 'List, show or compare revisions of a blog.', 'superuser')
+        self.add_pos_param('path', 'Publish path of the blog.')
+        self.add_pos_param('action', 'One of list, show and diff.', default='list')
+        self.add_pos_param('first', 'Number of the revision shown or compared, default to the latest one.', type=int,
+                           default=0)
+        self.add_pos_param('second', 'Number of the revision compared with, default to the one before the first.',
+                           type=int, default=0)
+
+    def __call__(self, request, path, action, first, second):
+        try:
+            blog = Blog.objects.get(publish_path=path.strip('/'))
+        except Blog.DoesNotExist:
+            raise WebCommand.Failed('No such blog.')
+        query_set = blog.revisions.defer('data').order_by('number')
+        if action == 'list':
+            if not query_set.exists():
+                return 'No revisions.'
+            lines = ['%6s  %-19s %10s %10s  %s' % ('number', 'created', 'length', 'stored', 'kind')]
+            for revision in query_set.annotate(stored=Length('data')):
+                lines.append('%6d  %-19s %10d %10d  %s' % (
+                    revision.number, timezone.localtime(revision.created).strftime('%Y-%m-%d %H:%M:%S'),
+                    revision.length, revision.stored, 'snapshot' if revision.base == revision.number else 'delta'))
+            return '\n'.join(lines)
+        numbers = list(query_set.values_list('number', flat=True))
+        first = first or (numbers[-1] if numbers else 0)
+        second = second or first - 1
+        if action == 'show':
+            if first not in numbers:
+                raise WebCommand.Failed('No such revision.')
+            return revisions.text(query_set.get(number=first))
+        if action == 'diff':
+            if first not in numbers or second not in numbers:
+                raise WebCommand.Failed('No such revision.')
+            old, new = query_set.get(number=min(first, second)), query_set.get(number=max(first, second))
+            return revisions.diff(old, new) or 'No differences.'
+        raise WebCommand.Failed('Unknown action %s.' % action)
+
+
+Retag(), Recommend(), Revisions()
@@ -0,0 +1,213 @@
+import os
+import queue
+import re
+import socket
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from django.conf import settings
+from django.db import connections
+
+from wcmd.commands import WebCommand
+
+# Background jobs are executed on a small thread pool, so that the worker accepting a command is released immediately.
+# Note that UWSGI must be started with threads enabled for this to work, which is already required by `restart`.
+executor = ThreadPoolExecutor(max_workers=getattr(settings, 'WCMD_JOB_WORKERS', 2), thread_name_prefix='wcmd-job')
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def jobs_dir():
+    """
+    Get the directory where outputs of jobs are stored. Outputs are stored in files rather than memory, so that any
+    worker can serve them, not only the one running the job.
+    :rtype str
+    """
+    return getattr(settings, 'WCMD_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'endportal-jobs'))
+
+
+def job_path(job, suffix):
+    return os.path.join(jobs_dir(), job + suffix)
+
+
+class Detached:
+    """
+    Stand-in of the HTTP request passed to background commands, which keeps only the user. Jobs run after the response
+    has been returned, when the request must not be used any more.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+
+def submit(command, user, args, kwargs):
+    """
+    Run a command in the background. The output of the command (either the returned string or every chunk yielded by
+    it) is appended to the output file of the job as soon as it is available.
+    :param command: Command object.
+    :param user: The user submitting the command.
+    :param args: Positional arguments of the command.
+    :param kwargs: Keyword arguments of the command.
+    :return: ID of the job.
+    :rtype str
+    """
+    cleanup()
+    job = uuid.uuid4().hex
+    os.makedirs(jobs_dir(), exist_ok=True)
+    with open(job_path(job, '.cmd'), 'w') as f:
+        f.write(command.name)
+    # The owner is recorded, so that jobs lost with their worker (e.g. recycled or killed) can be told apart.
+    with open(job_path(job, '.pid'), 'w') as f:
+        f.write('%s %d' % (socket.gethostname(), os.getpid()))
+    open(job_path(job, '.out'), 'w').close()
+    executor.submit(run, job, command, Detached(user), args, kwargs)
+    return job
+
+
+def run(job, command, request, args, kwargs):
+    status = 'success'
+    try:
+        with open(job_path(job, '.out'), 'a', encoding='utf-8') as f:
+            try:
+                result = command(request, *args, **kwargs)
+                for chunk in [result] if result is None or isinstance(result, str) else result:
+                    f.write(chunk or '')
+                    f.flush()
+            except WebCommand.Failed as e:
+                f.write(e.message)
+                status = 'failed'
+            except Exception as e:
+                f.write('%s: %s' % (type(e).__name__, e))
+                status = 'failed'
+        finish(job, status)
+    finally:
+        # Threads of the pool have their own database connections, which must be closed explicitly.
+        connections.close_all()
+
+
+def command_of(job):
+    """
+    Get the name of the command a job is running, or None if the job does not exist.
+    :rtype str | None
+    """
+    if JOB_ID.match(job) is None:
+        return None
+    try:
+        with open(job_path(job, '.cmd')) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def orphaned(job):
+    """
+    Check whether the worker running a job has exited. Only owners on the current host can be checked, jobs of other
+    hosts (if the directory is shared) are never considered orphaned.
+    :rtype bool
+    """
+    try:
+        with open(job_path(job, '.pid')) as f:
+            host, pid = f.read().split()
+        if host != socket.gethostname():
+            return False
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, ValueError):
+        return False
+    return False
+
+
+def finish(job, status, message=None):
+    if message is not None:
+        with open(job_path(job, '.out'), 'a', encoding='utf-8') as f:
+            f.write(message)
+    with open(job_path(job, '.done'), 'w') as f:
+        f.write(status)
+
+
+def read(job, offset):
+    """
+    Read output of a job produced since the given offset.
+    :param job: ID of the job.
+    :param offset: Offset in bytes of where the last read stopped.
+    :return: New output, new offset and the final status of the job (None if it is still running).
+    :rtype str, int, str | None
+    """
+    # The status must be checked before reading, otherwise output written between reading and checking would be lost.
+    try:
+        with open(job_path(job, '.done')) as f:
+            status = f.read()
+    except OSError:
+        status = None
+    # Jobs whose workers exited would never finish, so they are failed once noticed, and clients stop waiting.
+    if status is None and orphaned(job):
+        finish(job, 'failed', '\nWorker exited before the job finished.')
+        status = 'failed'
+    with open(job_path(job, '.out'), 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    # Never split a multi-byte character, leave incomplete trailing bytes to the next read.
+    text = data.decode('utf-8', errors='ignore')
+    return text, offset + len(text.encode('utf-8')), status
+
+
+def cleanup():
+    """
+    Remove files of jobs which finished more than `WCMD_JOBS_KEEP` seconds (default one day) ago.
+    """
+    deadline = time.time() - getattr(settings, 'WCMD_JOBS_KEEP', 86400)
+    try:
+        names = os.listdir(jobs_dir())
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith('.done'):
+            continue
+        try:
+            if os.path.getmtime(os.path.join(jobs_dir(), name)) < deadline:
+                for suffix in ('.cmd', '.pid', '.out', '.done'):
+                    os.remove(job_path(name[:-5], suffix))
+        except OSError:
+            pass
+
+
+class Writer:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def write(self, text):
+        self.chunks.put(text)
+
+    def flush(self):
+        pass
+
+
+def capture(func, *args, **kwargs):
+    """
+    Run a function which writes its output into a file-like object, passed as the `stdout` keyword argument, and yield
+    the output as soon as it is written. This turns functions such as management commands into generators suitable for
+    background jobs.
+    """
+    chunks, done = queue.Queue(), object()
+    failure = []
+
+    def target():
+        try:
+            chunks.put(func(*args, stdout=Writer(chunks), **kwargs))
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            chunks.put(done)
+
+    Thread(target=target, daemon=True).start()
+    while True:
+        chunk = chunks.get()
+        if chunk is done:
+            break
+        yield chunk
+    if failure:
+        raise failure[0]
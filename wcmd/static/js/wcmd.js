@@ -1,4 +1,4 @@
-const wcmd = (url) => $(document).ready(() => {
+const wcmd = (url, jobs) => $(document).ready(() => {
     const paragraphs = (succ, cmd, txt) =>
         `<p class="command ${succ ? 'success' : 'failed'}">${cmd}</p>
          <p><span>&nbsp;</span>${txt.replace(/\n/g, '</p><p><span>&nbsp;</span>')}</p>`;
@@ -9,13 +9,36 @@ const wcmd = (url) => $(document).ready(() => {
             : btn.attr('disabled', 'disabled')
                 .html(`<span class="${classes}"></span><span class="sr-only">${btn.html()}</span>`);
     };
+    // Output of background jobs is polled, and the paragraphs are replaced whenever new output arrives.
+    const follow = (command, output, job) => {
+        let nodes = $(paragraphs(true, command, output)).prependTo($('.response'));
+        const update = (succ) => {
+            const updated = $(paragraphs(succ, command, output));
+            nodes.first().before(updated);
+            nodes.remove();
+            nodes = updated;
+        };
+        const poll = (offset) => $.getJSON(jobs.replace('_', job), {offset: offset}, (resp) => {
+            output += resp.output;
+            if (resp.status !== null) {
+                update(resp.status === 'success');
+                return;
+            }
+            update(true);
+            setTimeout(() => poll(resp.offset), 500);
+        }).fail(() => setTimeout(() => poll(offset), 2000));
+        poll(0);
+    };
     $('form').submit((evt) => {
         evt.preventDefault();
         const command = $('input[name=_]').val().trim();
         switchBtnState();
-        $.post(url, $('form').serializeArray(), (resp) => {
+        $.post(url, $('form').serializeArray(), (resp, status, xhr) => {
             switchBtnState();
-            $(paragraphs(true, command, resp)).prependTo($('.response'));
+            const job = xhr.getResponseHeader('X-Job-Id');
+            job
+                ? follow(command, resp + '\n', job)
+                : $(paragraphs(true, command, resp)).prependTo($('.response'));
         }).fail((resp) => {
             switchBtnState();
             $(paragraphs(false, command, resp.responseText || 'Network failed.')).prependTo($('.response'));
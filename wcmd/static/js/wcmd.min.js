@@ -1,2 +1,2 @@
-const wcmd=a=>$(document).ready(()=>{const b=(a,b,c)=>`<p class="command ${a?"success":"failed"}">${b}</p>
-         <p><span>&nbsp;</span>${c.replace(/\n/g,"</p><p><span>&nbsp;</span>")}</p>`,c=()=>{const a=$("form button");a[0].hasAttribute("disabled")?a.removeAttr("disabled").html(a.children(".sr-only").html()):a.attr("disabled","disabled").html(`<span class="${"spinner-border spinner-border-sm"}"></span><span class="sr-only">${a.html()}</span>`)};$("form").submit(d=>{d.preventDefault();const e=$("input[name=_]").val().trim();c(),$.post(a,$("form").serializeArray(),a=>{c(),$(b(!0,e,a)).prependTo($(".response"))}).fail(a=>{c(),$(b(!1,e,a.responseText||"Network failed.")).prependTo($(".response"))})})});
\ No newline at end of file
+const wcmd=(a,b)=>$(document).ready(()=>{const c=(a,b,c)=>`<p class="command ${a?"success":"failed"}">${b}</p>
+         <p><span>&nbsp;</span>${c.replace(/\n/g,"</p><p><span>&nbsp;</span>")}</p>`,d=()=>{const a=$("form button");a[0].hasAttribute("disabled")?a.removeAttr("disabled").html(a.children(".sr-only").html()):a.attr("disabled","disabled").html(`<span class="${"spinner-border spinner-border-sm"}"></span><span class="sr-only">${a.html()}</span>`)},e=(a,d,e)=>{let f=$(c(!0,a,d)).prependTo($(".response"));const g=b=>{const e=$(c(b,a,d));f.first().before(e),f.remove(),f=e},h=a=>$.getJSON(b.replace("_",e),{offset:a},a=>{if(d+=a.output,null!==a.status)return void g("success"===a.status);g(!0),setTimeout(()=>h(a.offset),500)}).fail(()=>setTimeout(()=>h(a),2e3));h(0)};$("form").submit(b=>{b.preventDefault();const f=$("input[name=_]").val().trim();d(),$.post(a,$("form").serializeArray(),(a,b,g)=>{d();const h=g.getResponseHeader("X-Job-Id");h?e(f,a+"\n",h):$(c(!0,f,a)).prependTo($(".response"))}).fail(a=>{d(),$(c(!1,f,a.responseText||"Network failed.")).prependTo($(".response"))})})});
\ No newline at end of file
@@ -5,4 +5,5 @@ from wcmd import views
 urlpatterns = [
     path('exec/', views.wcmd_exec, name='wcmd-exec'),
     path('wcui/', views.wcmd_wcui, name='wcmd-wcui'),
+    path('jobs/<str:job>/', views.wcmd_jobs, name='wcmd-jobs'),
 ]
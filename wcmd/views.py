@@ -1,11 +1,12 @@
 import re
 
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.utils import html
 from django.views.decorators.http import require_POST, require_GET
 
 from logs.models import Log
+from wcmd import jobs
 from wcmd.commands import WebCommand
 
 
@@ -20,68 +21,101 @@ def escape(s):
     return html.escape(s).replace(' ', '&nbsp;')
 
 
+def split_commands(request):
+    """
+    Split the POST parameters into command lines. Several commands can be executed in one request, either by posting
+    several `_` fields, or by separating them with a standalone `;` token.
+    :return: A list of command lines, each of which is a list of tokens.
+    :rtype list
+    """
+    lines = []
+    for text in request.POST.getlist('_') or ['']:
+        # The command may have consecutive whitespaces, so we cannot simply `.split(' ')`.
+        line = []
+        for token in re.split(r'\s+', text.strip()):
+            if token == ';':
+                lines.append(line)
+                line = []
+            else:
+                line.append(token)
+        lines.append(line)
+    return [line for line in lines if line and line != ['']] or [['']]
+
+
 @require_POST
 def wcmd_exec(request):
-    # The command may have consecutive whitespaces, so we cannot simply `.split(' ')`.
-    text = re.split(r'\s+', request.POST.get('_', '').strip())
+    lines = split_commands(request)
     # Some commands require special privileges, but technically everyone can access the web commandline page, so we log
     # everything.
-    Log.new_log(request, 'wcmd', 'execute', ' '.join(text))
+    Log.new_log(request, 'wcmd', 'execute', ' ; '.join(' '.join(line) for line in lines))
     # All possible failures are raised as WebCommand.Failed, so other exceptions will trigger 502 normally.
     try:
-        if len(text) == 0 or text[0] not in WebCommand.commands:
-            raise WebCommand.Failed('No such command.')
-        command, args, kwargs = WebCommand.commands[text[0]], [], {}
-        # Check whether the command is available for the current request.
-        if not command.available(request):
-            return HttpResponse(status=403, content='Command unavailable')
-        # Parse arguments.
-        for i in range(1, len(text)):
-            # Ignore tokens starting with '--'.
-            # Instead of detecting the keyword of a parameter (i.e. --something), we detect the parameter value itself
-            # and determine whether it is a positional parameter or a keyword parameter.
-            if not text[i].startswith('--'):
-                if text[i - 1].startswith('--'):
-                    # This is a keyword parameter.
-                    name = text[i - 1][2:]
-                    if name not in command.key_params:
-                        raise WebCommand.Failed('Unknown keyword parameter %s of value "%s". ' % (name, text[i]))
-                    try:
-                        kwargs[name] = command.key_params[name].type(text[i])
-                    except ValueError:
-                        raise WebCommand.Failed(
-                            'Preprocessor of keyword parameter %s rejected value "%s".' % (name, text[i]))
-                else:
-                    # This is a positional parameter. The total count must not exceed.
-                    if len(args) >= len(command.pos_params):
-                        raise WebCommand.Failed('Too much arguments.')
-                    param = command.pos_params[len(args)]
-                    try:
-                        args.append(param.type(text[i]))
-                    except ValueError:
-                        raise WebCommand.Failed(
-                            'Preprocessor of positional parameter %s rejected value "%s".' % (param.name, text[i]))
-        # If there are any positional parameters missing, use the default ones. If some parameter has no default value
-        # (i.e. it is required), raise an error.
-        for i in range(len(args), len(command.pos_params)):
-            param = command.pos_params[i]
-            if param.default is None:
-                raise WebCommand.Failed('Positional parameter %s is required but not given.' % param.name)
-            args.append(param.default)
-        for name, param in command.key_params.items():
-            if name not in kwargs:
-                if param.default is None:
-                    raise WebCommand.Failed('Keyword parameter %s is required but not given.' % name)
-                kwargs[name] = param.default
-        # Execute the command.
-        resp = command(request, *args, **kwargs)
-        # Use a single space as default if the command returns nothing. The space is needed because the front-end can
-        # not correctly render empty strings.
-        return HttpResponse(status=200, content=escape(resp or ' '))
+        # Every command is looked up and parsed before anything is executed, so that a typo in a batch never leaves it
+        # half-executed. Commands unavailable yet are not parsed, so that their parameters are never revealed to those
+        # who are not able to execute them. They may become available by previous commands of the batch (e.g. `login`),
+        # and are parsed right before execution then.
+        parsed = []
+        for line in lines:
+            if line[0] not in WebCommand.commands:
+                raise WebCommand.Failed('No such command.')
+            command = WebCommand.commands[line[0]]
+            parsed.append((command, line[1:], command.parser.parse(line[1:]) if command.available(request) else None))
     except WebCommand.Failed as e:
         return HttpResponse(status=400, content=escape(e.message))
+    outputs, job = [], None
+    try:
+        for command, tokens, params in parsed:
+            # Check whether the command is available for the current request. This is done right before execution,
+            # since previous commands of the batch (e.g. `login` or `logout`) may change the result.
+            if not command.available(request):
+                return HttpResponse(status=403, content=escape('\n'.join(outputs + ['Command unavailable'])))
+            args, kwargs = params if params is not None else command.parser.parse(tokens)
+            # Long-running commands are handed over to the job runner, the client will then fetch the output from the
+            # job page. Only the last job of a batch is followed by the client.
+            if command.background:
+                job = jobs.submit(command, request.user, args, kwargs)
+                outputs.append('Job %s started.' % job)
+                continue
+            # Execute the command.
+            resp = command(request, *args, **kwargs)
+            if resp is not None and not isinstance(resp, str):
+                resp = ''.join(resp)
+            if resp:
+                outputs.append(resp)
+    except WebCommand.Failed as e:
+        return HttpResponse(status=400, content=escape('\n'.join(outputs + [e.message])))
+    # Use a single space as default if the commands return nothing. The space is needed because the front-end can not
+    # correctly render empty strings.
+    response = HttpResponse(status=200 if job is None else 202, content=escape('\n'.join(outputs) or ' '))
+    if job is not None:
+        response['X-Job-Id'] = job
+    return response
 
 
 @require_GET
 def wcmd_wcui(request):
     return render(request, 'wcmd.html')
+
+
+@require_GET
+def wcmd_jobs(request, job):
+    """
+    Get the output of a background job produced since the offset given by the `offset` query parameter. Clients poll
+    this page until the job is done, rather than holding a stream open, which would occupy a serving worker.
+    :return: JSON of the escaped output, the offset to poll from next time, and the final status of the job (null if
+        it is still running).
+    """
+    name = jobs.command_of(job)
+    if name is None or name not in WebCommand.commands:
+        raise Http404()
+    # Outputs are only visible to those who are able to execute the command.
+    if not WebCommand.commands[name].available(request):
+        return HttpResponse(status=403, content='Command unavailable')
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        offset = 0
+    text, offset, status = jobs.read(job, offset)
+    response = JsonResponse({'output': escape(text), 'offset': offset, 'status': status})
+    response['Cache-Control'] = 'no-cache'
+    return response